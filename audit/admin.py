@@ -0,0 +1,22 @@
+from django.contrib import admin
+
+from .models import AccessEvent
+
+
+@admin.register(AccessEvent)
+class AccessEventAdmin(admin.ModelAdmin):
+    list_display = ('occurred_at', 'actor', 'actor_role', 'action', 'source',
+                    'object_type', 'object_id', 'patient', 'status_code')
+    list_filter = ('action', 'source', 'object_type')
+    search_fields = ('object_id', 'endpoint')
+    date_hierarchy = 'occurred_at'
+    raw_id_fields = ('actor', 'patient')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
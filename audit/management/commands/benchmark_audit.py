@@ -0,0 +1,93 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework import viewsets
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from audit import writer
+from audit.mixins import AuditMixin
+from audit.models import AccessEvent
+from core.models import User
+from records.serializers import HealthRecordSerializer
+
+ENDPOINT_PREFIX = 'Bench'
+
+
+class BenchView(viewsets.GenericViewSet):
+    serializer_class = HealthRecordSerializer
+    authentication_classes = []
+    permission_classes = []
+
+    def retrieve(self, request, pk=None):
+        return Response({'id': pk})
+
+
+class BenchAuditedView(AuditMixin, BenchView):
+    pass
+
+
+class Command(BaseCommand):
+    """Measure the per-request cost of access auditing"""
+
+    help = ('Time identical requests with and without AuditMixin and report the added latency; '
+            'then flush the captured events to measure write throughput')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20_000)
+        parser.add_argument('--rounds', type=int, default=5,
+                            help='Alternating timing rounds; the median round is reported')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the benchmark events instead of deleting them')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['rounds'] < 1:
+            raise CommandError('--requests and --rounds must be positive')
+        user = User.objects.filter(role=User.Role.PATIENT).first() or User(pk=0, role=User.Role.PATIENT)
+        factory = APIRequestFactory()
+        plain = BenchView.as_view({'get': 'retrieve'})
+        audited = BenchAuditedView.as_view({'get': 'retrieve'})
+
+        def run(view):
+            request = factory.get('/bench/1/')
+            force_authenticate(request, user=user)
+            started = time.perf_counter()
+            for _ in range(options['requests']):
+                view(request, pk='1')
+            return (time.perf_counter() - started) / options['requests']
+
+        batch_size = settings.AUDIT_BATCH_SIZE
+        # Events stay in memory while timing so the comparison is request-path only
+        with override_settings(AUDIT_ENABLED=True, AUDIT_BACKGROUND_FLUSH=False,
+                               AUDIT_BATCH_SIZE=options['requests'] * options['rounds'] + 1,
+                               AUDIT_BUFFER_CAPACITY=options['requests'] * options['rounds'] + 1):
+            plain_times, audited_times = [], []
+            for _ in range(options['rounds']):
+                plain_times.append(run(plain))
+                audited_times.append(run(audited))
+
+            overhead = statistics.median(audited_times) - statistics.median(plain_times)
+            self.stdout.write(f'Plain request:   {statistics.median(plain_times) * 1e6:8.1f} us')
+            self.stdout.write(f'Audited request: {statistics.median(audited_times) * 1e6:8.1f} us')
+            self.stdout.write(f'Audit overhead:  {overhead * 1e6:8.1f} us per request')
+
+            buffer = writer.get_buffer()
+            buffer.batch_size = batch_size
+            events = len(buffer)
+            started = time.perf_counter()
+            writer.flush()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'Flushed {events} events in {elapsed:.2f}s ({events / elapsed:,.0f} events/s, '
+                f'batches of {batch_size})'
+                if elapsed else f'Flushed {events} events'
+            )
+
+        if not options['keep']:
+            AccessEvent.objects.filter(endpoint__startswith=ENDPOINT_PREFIX).delete()
+
+        verdict = self.style.SUCCESS('OK') if overhead < 0.0001 else self.style.ERROR('over budget')
+        self.stdout.write(f'Target < 100.0 us per request: {verdict}')
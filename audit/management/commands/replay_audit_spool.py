@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from audit import writer
+
+
+class Command(BaseCommand):
+    """Write spooled access events to the database"""
+
+    help = 'Replay audit events spooled while the database was unavailable (AUDIT_SPOOL_PATH)'
+
+    def handle(self, *args, **options):
+        replayed = writer.get_buffer().replay_spool()
+        self.stdout.write(self.style.SUCCESS(
+            f'Replayed {replayed} events from {settings.AUDIT_SPOOL_PATH}'
+        ))
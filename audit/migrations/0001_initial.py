@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occurred_at', models.DateTimeField()),
+                ('actor_role', models.CharField(blank=True, max_length=20)),
+                ('action', models.CharField(choices=[('VIEW', 'View'), ('LIST', 'List'), ('CREATE', 'Create'), ('UPDATE', 'Update'), ('DELETE', 'Delete')], max_length=10)),
+                ('source', models.CharField(choices=[('API', 'API'), ('ADMIN', 'Admin')], default='API', max_length=10)),
+                ('endpoint', models.CharField(max_length=100)),
+                ('object_type', models.CharField(max_length=50)),
+                ('object_id', models.CharField(blank=True, max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField(null=True)),
+                ('ip_address', models.GenericIPAddressField(null=True)),
+                ('actor', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Access Event',
+                'verbose_name_plural': 'Access Events',
+                'db_table': 'audit_access_events',
+                'ordering': ['-occurred_at', '-id'],
+                'indexes': [models.Index(fields=['patient', '-occurred_at'], name='audit_patient_time_idx'), models.Index(fields=['actor', '-occurred_at'], name='audit_actor_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,101 @@
+"""Capture access events from DRF viewsets and Django admin classes."""
+from core.models import User
+from .models import AccessEvent
+from .writer import record
+
+METHOD_ACTIONS = {
+    'POST': AccessEvent.Action.CREATE,
+    'PUT': AccessEvent.Action.UPDATE,
+    'PATCH': AccessEvent.Action.UPDATE,
+    'DELETE': AccessEvent.Action.DELETE,
+}
+
+
+def _patient_id(obj):
+    if isinstance(obj, User):
+        return obj.pk if obj.role == User.Role.PATIENT else None
+    return getattr(obj, 'patient_id', None)
+
+
+def _client_ip(request):
+    return request.META.get('REMOTE_ADDR') or None
+
+
+class AuditMixin:
+    """
+    Viewset mixin recording who read or changed which object. The object is
+    taken from ``get_object()`` when the action loaded one; list actions are
+    attributed to the patient they are scoped to, where that is known.
+    """
+    audited_object = None
+
+    def get_object(self):
+        self.audited_object = super().get_object()
+        return self.audited_object
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        user = getattr(request, 'user', None)
+        if response.status_code < 400 and user is not None and user.is_authenticated:
+            self._audit(request, response, user)
+        return response
+
+    def _audit(self, request, response, user):
+        obj = self.audited_object
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if obj is not None:
+            object_type, object_id, patient_id = obj._meta.model_name, obj.pk, _patient_id(obj)
+        else:
+            object_type = self.get_serializer_class().Meta.model._meta.model_name
+            object_id = lookup
+            if object_id is None and response.status_code == 201 and isinstance(response.data, dict):
+                object_id = response.data.get('id')
+            patient_id = user.pk if user.role == User.Role.PATIENT else None
+            if patient_id is None and request.query_params.get('patient', '').isdigit():
+                patient_id = int(request.query_params['patient'])
+
+        action = METHOD_ACTIONS.get(request.method)
+        if action is None:
+            action = AccessEvent.Action.VIEW if lookup is not None else AccessEvent.Action.LIST
+        record(
+            user, action, object_type, object_id, patient_id,
+            endpoint=f'{type(self).__name__}.{self.action}',
+            status_code=response.status_code,
+            ip_address=_client_ip(request),
+        )
+
+
+class AuditAdminMixin:
+    """ModelAdmin mixin recording admin views and changes of objects."""
+
+    def _audit(self, request, action, obj=None):
+        record(
+            request.user, action, self.model._meta.model_name,
+            obj.pk if obj is not None else '', _patient_id(obj) if obj is not None else None,
+            endpoint=f'admin:{self.model._meta.label_lower}',
+            source=AccessEvent.Source.ADMIN,
+            ip_address=_client_ip(request),
+        )
+
+    def changelist_view(self, request, extra_context=None):
+        self._audit(request, AccessEvent.Action.LIST)
+        return super().changelist_view(request, extra_context)
+
+    def get_object(self, request, object_id, from_field=None):
+        obj = super().get_object(request, object_id, from_field)
+        if obj is not None and request.method == 'GET':
+            self._audit(request, AccessEvent.Action.VIEW, obj)
+        return obj
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self._audit(request, AccessEvent.Action.UPDATE if change else AccessEvent.Action.CREATE, obj)
+
+    def delete_model(self, request, obj):
+        self._audit(request, AccessEvent.Action.DELETE, obj)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self._audit(request, AccessEvent.Action.DELETE, obj)
+        super().delete_queryset(request, queryset)
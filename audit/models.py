@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.db import models
+
+
+class AccessEvent(models.Model):
+    """
+    One read or write of a patient-related object. Rows are written in
+    batches by ``audit.writer``; foreign keys carry no database constraint so
+    inserts never lock user rows and events outlive deleted users.
+    """
+    class Action(models.TextChoices):
+        VIEW = 'VIEW', 'View'
+        LIST = 'LIST', 'List'
+        CREATE = 'CREATE', 'Create'
+        UPDATE = 'UPDATE', 'Update'
+        DELETE = 'DELETE', 'Delete'
+
+    class Source(models.TextChoices):
+        API = 'API', 'API'
+        ADMIN = 'ADMIN', 'Admin'
+
+    occurred_at = models.DateTimeField()
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        related_name='+'
+    )
+    actor_role = models.CharField(max_length=20, blank=True)
+    action = models.CharField(max_length=10, choices=Action.choices)
+    source = models.CharField(max_length=10, choices=Source.choices, default=Source.API)
+    endpoint = models.CharField(max_length=100)
+    object_type = models.CharField(max_length=50)
+    object_id = models.CharField(max_length=64, blank=True)
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        related_name='+'
+    )
+    status_code = models.PositiveSmallIntegerField(null=True)
+    ip_address = models.GenericIPAddressField(null=True)
+
+    class Meta:
+        db_table = 'audit_access_events'
+        verbose_name = 'Access Event'
+        verbose_name_plural = 'Access Events'
+        ordering = ['-occurred_at', '-id']
+        indexes = [
+            models.Index(fields=['patient', '-occurred_at'], name='audit_patient_time_idx'),
+            models.Index(fields=['actor', '-occurred_at'], name='audit_actor_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.actor_id} {self.action} {self.object_type}:{self.object_id} at {self.occurred_at}"
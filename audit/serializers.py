@@ -0,0 +1,12 @@
+from rest_framework import serializers
+
+from .models import AccessEvent
+
+
+class AccessEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AccessEvent
+        fields = (
+            'id', 'occurred_at', 'actor', 'actor_role', 'action', 'source', 'endpoint',
+            'object_type', 'object_id', 'patient', 'status_code', 'ip_address',
+        )
@@ -0,0 +1,178 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.buffering import BufferedWriter, fcntl
+from core.models import User
+from records.models import HealthRecord
+from . import writer
+from .models import AccessEvent
+
+
+@override_settings(AUDIT_ENABLED=True, AUDIT_BACKGROUND_FLUSH=False, AUDIT_BATCH_SIZE=100)
+class AccessAuditTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool = os.path.join(directory.name, 'audit.ndjson')
+        settings = override_settings(AUDIT_SPOOL_PATH=self.spool)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        writer.get_buffer().discard()
+
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.admin = User.objects.create_superuser(
+            username='admin',
+            password='testpass123',
+            email='admin@test.com',
+            role=User.Role.ADMIN
+        )
+        self.record = HealthRecord.objects.create(
+            record_id='HR-1',
+            patient=self.patient,
+            title='Consultation',
+            description=''
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+
+    def test_reads_are_buffered_then_written_in_one_batch(self):
+        """Test requests only queue events; flush inserts them together"""
+        self.client.get(f'/api/patient-records/{self.record.id}/')
+        self.client.get('/api/patient-records/')
+        self.assertFalse(AccessEvent.objects.exists())
+
+        with self.assertNumQueries(1):
+            writer.flush()
+
+        view, listing = AccessEvent.objects.order_by('id')
+        self.assertEqual(view.action, AccessEvent.Action.VIEW)
+        self.assertEqual(view.object_type, 'healthrecord')
+        self.assertEqual(view.object_id, str(self.record.id))
+        self.assertEqual(view.patient_id, self.patient.id)
+        self.assertEqual(view.actor_id, self.patient.id)
+        self.assertEqual(listing.action, AccessEvent.Action.LIST)
+        self.assertEqual(listing.endpoint, 'PatientHealthRecordViewSet.list')
+
+    def test_updates_are_recorded(self):
+        """Test writes are logged with the changed object"""
+        self.client.patch(f'/api/patient-records/{self.record.id}/', {'title': 'New'}, format='json')
+        writer.flush()
+
+        event = AccessEvent.objects.get()
+        self.assertEqual(event.action, AccessEvent.Action.UPDATE)
+        self.assertEqual(event.status_code, 200)
+
+    def test_failed_flush_spools_and_replays(self):
+        """Test events survive a database failure via the spool file"""
+        buffer = writer.get_buffer()
+        writer.record(self.admin, AccessEvent.Action.VIEW, 'healthrecord', self.record.id, self.patient.id)
+        with mock.patch.object(buffer, '_flush', side_effect=RuntimeError('database down')):
+            buffer.flush()
+
+        self.assertFalse(AccessEvent.objects.exists())
+        with open(self.spool) as spooled:
+            self.assertEqual(json.loads(spooled.readline())['object_id'], str(self.record.id))
+
+        self.assertEqual(buffer.replay_spool(), 1)
+        self.assertEqual(AccessEvent.objects.get().patient_id, self.patient.id)
+        self.assertFalse(os.path.exists(self.spool))
+
+    def test_query_by_patient(self):
+        """Test admins page through a patient's access history"""
+        for _ in range(3):
+            self.client.get(f'/api/patient-records/{self.record.id}/')
+        writer.flush()
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin).access_token}')
+        response = client.get('/api/audit/events/', {'patient': self.patient.id, 'limit': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        response = client.get('/api/audit/events/', {
+            'patient': self.patient.id, 'limit': 2, 'cursor': response.data['next_cursor']
+        })
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_query_api_is_admin_only(self):
+        """Test patients cannot read the audit log"""
+        response = self.client.get('/api/audit/events/')
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BufferedWriterCapacityTest(SimpleTestCase):
+    def test_backlog_is_bounded_while_a_flush_hangs(self):
+        """Test add() spools, or drops and counts, what exceeds capacity while the flush lock is held"""
+        with tempfile.TemporaryDirectory() as directory:
+            spool = os.path.join(directory, 'spool.ndjson')
+            buffer = BufferedWriter(lambda batch: None, batch_size=4, capacity=10, spool_path=spool)
+            buffer._pid = os.getpid()  # as if the flush thread were running...
+            with buffer._flush_lock:  # ...and stuck on the database
+                for item in range(30):
+                    buffer.add(item)
+            self.assertLessEqual(len(buffer), 10)
+            with open(spool) as spooled:
+                self.assertEqual(len(spooled.readlines()), buffer.stats['spooled'])
+            self.assertEqual(buffer.stats['spooled'] + len(buffer), 30)
+
+        unspooled = BufferedWriter(lambda batch: None, batch_size=4, capacity=10)
+        unspooled._pid = os.getpid()
+        with unspooled._flush_lock:
+            for item in range(30):
+                unspooled.add(item)
+        self.assertLessEqual(len(unspooled), 10)
+        self.assertEqual(unspooled.stats['dropped'] + len(unspooled), 30)
+
+
+class BufferedWriterSpoolTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool = os.path.join(directory.name, 'spool.ndjson')
+        self.written = []
+        self.buffer = BufferedWriter(self.written.extend, batch_size=2, spool_path=self.spool, background=False)
+
+    def test_undecodable_lines_are_set_aside(self):
+        """Test a torn line is moved to the rejected file instead of blocking the spool"""
+        with open(self.spool, 'w') as spool:
+            spool.write('1\n{"torn": \n2\n3')
+
+        self.assertEqual(self.buffer.replay_spool(), 3)
+        self.assertEqual(self.written, [1, 2, 3])
+        self.assertEqual(self.buffer.stats['rejected'], 1)
+        self.assertFalse(os.path.exists(self.spool))
+        with open(f'{self.spool}.rejected') as rejected:
+            self.assertEqual(rejected.read(), '{"torn": \n')
+
+    @unittest.skipIf(fcntl is None, 'Spool locking requires fcntl')
+    def test_claims_of_live_processes_are_left_alone(self):
+        """Test a replay skips a spool another process is replaying and adopts it once abandoned"""
+        claim = f'{self.spool}.replaying.other'
+        with open(claim, 'w') as spool:
+            spool.write('1\n2\n')
+        other = open(claim)
+        fcntl.flock(other, fcntl.LOCK_EX)
+        self.buffer.add(3)
+        self.buffer._spool(self.buffer._drain(1))
+
+        self.assertEqual(self.buffer.replay_spool(), 1)
+        self.assertEqual(self.written, [3])
+        other.close()  # the other process died mid-replay
+        self.assertEqual(self.buffer.replay_spool(), 2)
+        self.assertEqual(self.written, [3, 1, 2])
+        self.assertFalse(os.path.exists(claim))
@@ -0,0 +1,11 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+
+from .views import AccessEventViewSet
+
+router = DefaultRouter()
+router.register(r'audit/events', AccessEventViewSet, basename='audit-event')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
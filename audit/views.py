@@ -0,0 +1,55 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import status, viewsets
+from rest_framework.response import Response
+
+from core.cursors import decode_cursor, encode_cursor
+from core.permissions import IsAdminUser
+from .models import AccessEvent
+from .serializers import AccessEventSerializer
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+FILTERS = ('patient', 'actor', 'object_type', 'object_id', 'action', 'source')
+
+
+class AccessEventViewSet(viewsets.GenericViewSet):
+    """
+    Query the access audit log (Admin only). Filter by ``patient`` or
+    ``actor`` (served from the (patient|actor, occurred_at) indexes) and
+    ``since``/``until``; pages are keyset-paginated newest first.
+    """
+    serializer_class = AccessEventSerializer
+    permission_classes = [IsAdminUser]
+    queryset = AccessEvent.objects.all()
+
+    def list(self, request):
+        params = request.query_params
+        try:
+            events = AccessEvent.objects.filter(
+                **{name: params[name] for name in FILTERS if params.get(name)}
+            )
+            for name, lookup in (('since', 'occurred_at__gte'), ('until', 'occurred_at__lt')):
+                if params.get(name):
+                    value = parse_datetime(params[name])
+                    if value is None:
+                        raise ValueError(f'{name} must be an ISO 8601 datetime')
+                    events = events.filter(**{lookup: value})
+            if params.get('cursor'):
+                occurred_at, event_id = decode_cursor(params['cursor'], int)
+                events = events.filter(
+                    Q(occurred_at__lt=occurred_at) | Q(occurred_at=occurred_at, id__lt=event_id)
+                )
+            limit = params.get('limit', str(PAGE_SIZE))
+            if not limit.isdigit() or int(limit) < 1:
+                raise ValueError('limit must be a positive integer')
+            limit = min(int(limit), MAX_PAGE_SIZE)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = list(events.order_by('-occurred_at', '-id')[:limit + 1])
+        next_cursor = encode_cursor(page[limit - 1].occurred_at, page[limit - 1].pk) if len(page) > limit else None
+        return Response({
+            'results': self.get_serializer(page[:limit], many=True).data,
+            'next_cursor': next_cursor,
+        })
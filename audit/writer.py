@@ -0,0 +1,114 @@
+"""
+Batched, asynchronous writing of ``AccessEvent`` rows.
+
+``record()`` builds a plain tuple and appends it to a process-wide
+``BufferedWriter``; a background thread inserts the batches with
+``bulk_create`` (or ``COPY`` on PostgreSQL). Requests therefore never wait for
+the audit insert, and a slow or unavailable database only delays events to
+the spool file configured by ``AUDIT_SPOOL_PATH``.
+"""
+import atexit
+import csv
+import io
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.buffering import BufferedWriter
+from .models import AccessEvent
+
+FIELDS = (
+    'occurred_at', 'actor_id', 'actor_role', 'action', 'source', 'endpoint',
+    'object_type', 'object_id', 'patient_id', 'status_code', 'ip_address',
+)
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def _copy(events):
+    # Every column is quoted; FORCE_NULL turns empty nullable values back into NULL
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+    for event in events:
+        writer.writerow(['' if value is None else value for value in event])
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {AccessEvent._meta.db_table} ({", ".join(FIELDS)}) FROM STDIN '
+            f'WITH (FORMAT csv, FORCE_NULL (actor_id, patient_id, status_code, ip_address))',
+            buffer
+        )
+
+
+def write_events(events):
+    """Insert a batch of event tuples in one statement."""
+    if connection.vendor == 'postgresql' and settings.AUDIT_USE_COPY:
+        _copy(events)
+    else:
+        AccessEvent.objects.bulk_create(
+            [AccessEvent(**dict(zip(FIELDS, event))) for event in events],
+            batch_size=len(events)
+        )
+
+
+def _encode(event):
+    return dict(zip(FIELDS, event))
+
+
+def _decode(data):
+    data['occurred_at'] = parse_datetime(data['occurred_at'])
+    return tuple(data.get(field) for field in FIELDS)
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = BufferedWriter(
+                    write_events,
+                    batch_size=settings.AUDIT_BATCH_SIZE,
+                    interval=settings.AUDIT_FLUSH_INTERVAL_MS / 1000,
+                    capacity=settings.AUDIT_BUFFER_CAPACITY,
+                    spool_path=settings.AUDIT_SPOOL_PATH,
+                    encode=_encode,
+                    decode=_decode,
+                    background=settings.AUDIT_BACKGROUND_FLUSH,
+                    name='audit-writer',
+                )
+                # Best effort: don't lose the last partial batch on a clean shutdown
+                atexit.register(_buffer.flush)
+    return _buffer
+
+
+@receiver(setting_changed)
+def reset_buffer(setting, **kwargs):
+    # Only tests change settings; writing their leftovers would leak them into the next test
+    global _buffer
+    if setting.startswith('AUDIT_') and _buffer is not None:
+        _buffer.discard()
+        _buffer = None
+
+
+def record(actor, action, object_type, object_id='', patient_id=None, *, endpoint='',
+           source=AccessEvent.Source.API, status_code=None, ip_address=None):
+    """Queue one access event. Cheap enough to call on every request."""
+    if not settings.AUDIT_ENABLED:
+        return
+    actor_id = getattr(actor, 'pk', None)
+    get_buffer().add((
+        timezone.now(), actor_id, getattr(actor, 'role', '') if actor_id else '',
+        action, source, endpoint[:100], object_type, str(object_id or ''), patient_id,
+        status_code, ip_address,
+    ))
+
+
+def flush():
+    """Write every queued event now (tests, shutdown, management commands)."""
+    get_buffer().flush()
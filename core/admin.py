@@ -1,10 +1,15 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import SEARCH_VAR
 from django.contrib.auth.admin import UserAdmin
 from django import forms
-from .models import User, Notification, DoctorAppointment
+from django.db import transaction
+from django.db.models import F
+from .models import User, Notification, NotificationCounter, DoctorAppointment
 from django.utils.html import format_html
 from datetime import datetime, timedelta
-from records.models import HealthRecord, DoctorAnnotation
+from records.models import HealthRecord, DoctorAnnotation, RecordAttachment
+from .search import fuzzy_search_users
+from audit.mixins import AuditAdminMixin
 import time
 from django.contrib import messages
 
@@ -324,6 +329,8 @@ class CustomUserAdmin(UserAdmin):
     list_filter = ('role', 'specialization', 'is_active', 'is_staff')
     search_fields = ('username', 'email', 'first_name', 'last_name', 'specialization')
     ordering = ('-date_joined',)
+    # Skip the unfiltered COUNT(*) over the whole users table on every search
+    show_full_result_count = False
     
     add_fieldsets = (
         (None, {
@@ -393,6 +400,18 @@ class CustomUserAdmin(UserAdmin):
         return '-'
     show_availability.short_description = 'Availability'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Use the trigram indexes instead of OR'ed icontains scans
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        return fuzzy_search_users(queryset, search_term), False
+
+    def get_ordering(self, request):
+        # Rank fuzzy search matches by similarity unless a column sort is chosen
+        if request.GET.get(SEARCH_VAR, '').strip():
+            return ('-search_rank',) + tuple(self.ordering)
+        return super().get_ordering(request)
+
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
@@ -481,6 +500,22 @@ class NotificationAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        # A plain save bypasses Notification.save_unread/mark_read; keep the unread counters exact
+        with transaction.atomic():
+            previous = None
+            if change:
+                previous = Notification.objects.select_for_update().filter(pk=obj.pk).values(
+                    'recipient_id', 'is_read'
+                ).first()
+            super().save_model(request, obj, form, change)
+            if previous is not None and not previous['is_read']:
+                NotificationCounter.objects.filter(user_id=previous['recipient_id'], unread__gt=0).update(
+                    unread=F('unread') - 1
+                )
+            if not obj.is_read:
+                NotificationCounter.add({obj.recipient_id: 1})
+
     def has_add_permission(self, request):
         # Only superusers can add notifications
         return request.user.is_superuser
@@ -506,7 +541,7 @@ class NotificationAdmin(admin.ModelAdmin):
         return qs
 
 @admin.register(DoctorAppointment)
-class DoctorAppointmentAdmin(admin.ModelAdmin):
+class DoctorAppointmentAdmin(AuditAdminMixin, admin.ModelAdmin):
     form = DoctorAppointmentForm
     list_display = ('doctor', 'patient', 'appointment_date', 'start_time', 'status')
     list_filter = ('status', 'appointment_date', 'doctor', 'patient')
@@ -530,8 +565,7 @@ class DoctorAppointmentAdmin(admin.ModelAdmin):
                 title=f"Appointment with Dr. {obj.doctor.get_full_name()}",
                 description="",  # Empty description
                 patient=obj.patient,
-                doctor=obj.doctor,
-                attachments=None  # No attachments initially
+                doctor=obj.doctor
             )
         else:
             super().save_model(request, obj, form, change)
@@ -557,13 +591,23 @@ class DoctorAnnotationInline(admin.TabularInline):
     fields = ('doctor', 'content', 'created_at')
     readonly_fields = ('created_at',)
 
+class RecordAttachmentInline(admin.TabularInline):
+    model = RecordAttachment
+    extra = 0
+    fields = ('filename', 'content_type', 'size', 'blob', 'uploaded_by', 'created_at')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        # Files are added through the upload endpoints, which hash and deduplicate them
+        return False
+
 @admin.register(HealthRecord)
-class HealthRecordAdmin(admin.ModelAdmin):
+class HealthRecordAdmin(AuditAdminMixin, admin.ModelAdmin):
     list_display = ('record_id', 'title', 'patient', 'doctor', 'record_type', 'created_at')
     list_filter = ('record_type', 'created_at', 'doctor')
     search_fields = ('record_id', 'title', 'description', 'patient__username', 'doctor__username')
     readonly_fields = ('record_id', 'created_at', 'updated_at')
-    inlines = [DoctorAnnotationInline]
+    inlines = [DoctorAnnotationInline, RecordAttachmentInline]
     
     def get_fieldsets(self, request, obj=None):
         if request.user.role == User.Role.PATIENT:
@@ -574,10 +618,6 @@ class HealthRecordAdmin(admin.ModelAdmin):
                 ('Patient Information', {
                     'fields': ('doctor',)
                 }),
-                ('Attachments', {
-                    'fields': ('attachments',),
-                    'classes': ('collapse',)
-                }),
                 ('Timestamps', {
                     'fields': ('created_at', 'updated_at'),
                     'classes': ('collapse',)
@@ -590,10 +630,6 @@ class HealthRecordAdmin(admin.ModelAdmin):
             ('Patient Information', {
                 'fields': ('patient', 'doctor')
             }),
-            ('Attachments', {
-                'fields': ('attachments',),
-                'classes': ('collapse',)
-            }),
             ('Timestamps', {
                 'fields': ('created_at', 'updated_at'),
                 'classes': ('collapse',)
@@ -0,0 +1,284 @@
+"""
+In-process write buffering for high-volume, latency-insensitive inserts.
+
+``BufferedWriter.add()`` only appends to a deque, so request threads never
+wait for the database while the backlog is below ``capacity``. A daemon thread drains the buffer every ``interval``
+seconds, or as soon as ``batch_size`` items are waiting, and hands each batch
+to a ``flush`` callable (typically one ``bulk_create``/COPY). When a flush
+fails, takes longer than ``slow_threshold`` or the backlog grows past
+``capacity``, batches go to an NDJSON spool file instead; spooled batches are
+written back once flushes are healthy again. If a flush hangs, ``add()``
+itself spools whatever exceeds ``capacity`` (or drops it, counted in
+``stats['dropped']``, when there is no usable spool file).
+
+Every worker process appends to the same spool file, so appends and claims
+take an ``flock`` on ``<spool>.lock``. A replay first claims the spool by
+renaming it to a name of its own and holds a lock on the claimed file while
+it writes it back; claims left by a process that died mid-replay are adopted
+by the next one. Lines that no longer decode (e.g. torn by a crash) are moved
+to ``<spool>.rejected`` instead of blocking the spool.
+"""
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows: only one process may use a spool file there
+    fcntl = None
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedWriter:
+    """Bounded, thread-safe buffer flushed in batches from a background thread."""
+
+    def __init__(self, flush, *, batch_size=500, interval=0.5, capacity=50_000,
+                 slow_threshold=2.0, spool_path=None, encode=None, decode=None,
+                 background=True, name='buffered-writer'):
+        self._flush = flush
+        self.batch_size = batch_size
+        self.interval = interval
+        self.capacity = capacity
+        self.slow_threshold = slow_threshold
+        self.spool_path = spool_path
+        self._encode = encode or (lambda item: item)
+        self._decode = decode or (lambda item: item)
+        self.background = background
+        self.name = name
+
+        self._items = deque()
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._degraded_until = 0.0
+        self.stats = {'added': 0, 'flushed': 0, 'spooled': 0, 'replayed': 0, 'failures': 0,
+                      'dropped': 0, 'rejected': 0}
+
+    def add(self, item):
+        """Queue ``item``; only blocks on I/O once the backlog is over ``capacity``."""
+        self._items.append(item)
+        self.stats['added'] += 1
+        if len(self._items) > self.capacity:
+            # The flush thread is stuck (e.g. on a hanging database) and holds the
+            # flush lock; move the oldest items out of memory from this thread
+            self._spool(self._drain(max(len(self._items) - self.capacity, self.batch_size)))
+        if not self.background:
+            # Synchronous mode: the caller pays for a full batch
+            if len(self._items) >= self.batch_size:
+                self.flush()
+            return
+        if len(self._items) >= self.batch_size:
+            self._wake.set()
+        if self._pid != os.getpid():
+            self._start()
+
+    def discard(self):
+        """Forget everything queued in memory; returns how many items were dropped."""
+        dropped = len(self._drain(len(self._items)))
+        self.stats['dropped'] += dropped
+        return dropped
+
+    def __len__(self):
+        return len(self._items)
+
+    def _start(self):
+        with self._flush_lock:
+            # Also restarts the thread in processes forked after it was started
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('%s: flush loop error', self.name)
+            finally:
+                # Don't hold a connection between flushes
+                connection.close()
+
+    def _drain(self, limit):
+        batch = []
+        try:
+            while len(batch) < limit:
+                batch.append(self._items.popleft())
+        except IndexError:
+            # Empty, possibly drained by another thread meanwhile
+            pass
+        return batch
+
+    def flush(self):
+        """Write everything queued so far. Safe to call from any thread."""
+        with self._flush_lock:
+            while self._items:
+                if len(self._items) > self.capacity or time.monotonic() < self._degraded_until:
+                    # The database is behind; keep memory bounded by spooling the backlog
+                    self._spool(self._drain(len(self._items)))
+                    break
+                self._write(self._drain(self.batch_size))
+            else:
+                if time.monotonic() >= self._degraded_until:
+                    self._replay()
+
+    def _write(self, batch):
+        started = time.monotonic()
+        try:
+            self._flush(batch)
+        except Exception:
+            logger.exception('%s: flush of %d items failed, spooling', self.name, len(batch))
+            self.stats['failures'] += 1
+            self._degraded_until = time.monotonic() + self.interval * 10
+            self._spool(batch)
+            return
+        self.stats['flushed'] += len(batch)
+        if time.monotonic() - started > self.slow_threshold:
+            logger.warning('%s: slow flush of %d items, spooling for a while', self.name, len(batch))
+            self._degraded_until = time.monotonic() + self.interval * 10
+
+    @contextmanager
+    def _spool_locked(self):
+        """Serialize spool appends and claims across threads and worker processes."""
+        with self._spool_lock:
+            os.makedirs(os.path.dirname(self.spool_path) or '.', exist_ok=True)
+            with open(f'{self.spool_path}.lock', 'a') as lock:
+                if fcntl is not None:
+                    # Released when the file is closed
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                yield
+
+    def _append(self, path, lines):
+        with self._spool_locked(), open(path, 'a') as spool:
+            spool.writelines(lines)
+
+    def _spool(self, batch):
+        if not batch:
+            return
+        if not self.spool_path:
+            logger.error('%s: dropping %d items, no spool file configured', self.name, len(batch))
+            self.stats['dropped'] += len(batch)
+            return
+        lines = [json.dumps(self._encode(item), default=str) + '\n' for item in batch]
+        try:
+            self._append(self.spool_path, lines)
+        except OSError:
+            logger.exception('%s: dropping %d items, spool file is not writable', self.name, len(batch))
+            self.stats['dropped'] += len(batch)
+            return
+        self.stats['spooled'] += len(batch)
+
+    def _open_claim(self, path):
+        """Open and lock a claimed spool file; ``None`` if another process is replaying it."""
+        try:
+            spool = open(path)
+        except FileNotFoundError:
+            return None
+        if fcntl is not None:
+            try:
+                fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # The owner removes the file before releasing its lock
+                live = os.path.samestat(os.fstat(spool.fileno()), os.stat(path))
+            except (BlockingIOError, FileNotFoundError):
+                live = False
+            if not live:
+                spool.close()
+                return None
+        return spool
+
+    def _claim(self, names):
+        """Take the spool file, and claims abandoned by dead processes, for this replay."""
+        directory = os.path.dirname(self.spool_path)
+        claimed = []
+        with self._spool_locked():
+            for name in names:
+                spool = self._open_claim(os.path.join(directory, name))
+                if spool is not None:
+                    claimed.append(spool)
+            if os.path.exists(self.spool_path):
+                path = f'{self.spool_path}.replaying.{os.getpid()}-{time.time_ns()}'
+                os.replace(self.spool_path, path)
+                spool = self._open_claim(path)
+                if spool is not None:
+                    claimed.append(spool)
+        return claimed
+
+    def _replay(self):
+        if not self.spool_path:
+            return
+        directory, base = os.path.split(self.spool_path)
+        try:
+            names = sorted(os.listdir(directory or '.'))
+        except FileNotFoundError:
+            return
+        claims = [name for name in names if name.startswith(f'{base}.replaying.')]
+        if not claims and base not in names:
+            return
+        claimed = self._claim(claims)
+        try:
+            for spool in claimed:
+                if not self._replay_file(spool):
+                    break
+        finally:
+            for spool in claimed:
+                spool.close()
+
+    def _replay_file(self, spool):
+        """Write one claimed file back and remove it; ``False`` if the database failed."""
+        # A torn last line gets its newline back, so later appends start a line of their own
+        lines = (line if line.endswith('\n') else line + '\n' for line in spool if line.strip())
+        rejected = []
+        healthy = True
+        while True:
+            chunk = list(itertools.islice(lines, self.batch_size))
+            if not chunk:
+                break
+            batch, kept = [], []
+            for line in chunk:
+                try:
+                    batch.append(self._decode(json.loads(line)))
+                except Exception:
+                    # It would fail every replay; set it aside for inspection
+                    rejected.append(line)
+                else:
+                    kept.append(line)
+            if not batch:
+                continue
+            try:
+                self._flush(batch)
+            except Exception:
+                logger.exception('%s: spool replay failed, keeping the rest spooled', self.name)
+                self.stats['failures'] += 1
+                self._degraded_until = time.monotonic() + self.interval * 10
+                self._append(self.spool_path, itertools.chain(kept, lines))
+                healthy = False
+                break
+            self.stats['replayed'] += len(batch)
+        if rejected:
+            logger.error('%s: moved %d spooled lines that do not decode to %s.rejected',
+                         self.name, len(rejected), self.spool_path)
+            self.stats['rejected'] += len(rejected)
+            self._append(f'{self.spool_path}.rejected', rejected)
+        # Removed while still locked, so no other process adopts it afterwards
+        os.remove(spool.name)
+        return healthy
+
+    def replay_spool(self):
+        """Write spooled items to the database now; returns how many were replayed."""
+        with self._flush_lock:
+            before = self.stats['replayed']
+            self._replay()
+            return self.stats['replayed'] - before
@@ -0,0 +1,119 @@
+"""
+Versioned response caching for read-mostly endpoints.
+
+Each ``ResponseCache`` namespace (optionally split into scopes, e.g. one per
+doctor) keeps a generation counter in the cache. Entries are stored under keys
+that include the current generation, so invalidation is a single ``incr`` of
+the counter: old entries are never read again and simply expire. Only cache
+operations every Django backend implements are used (``get``/``set``/``add``/
+``incr``), so the local-memory, file-based and Redis backends all work. A
+generation counter that is missing (never set, or evicted) restarts at the
+current time in nanoseconds rather than 1, so it never returns to a value whose
+entries may still be cached.
+
+Hits and misses are counted per namespace and reported by ``stats()`` and the
+``response_cache_stats`` management command.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+CACHE_HEADER = 'X-Cache'
+
+_registry = {}
+
+
+def _cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _incr(cache, key, start=1):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Missing or evicted counter: start it, or increment if another process just did
+        if cache.add(key, start, timeout=None):
+            return start
+        return cache.incr(key)
+
+
+def _new_generation():
+    # Above any generation handed out before, unlike restarting at 1
+    return time.time_ns()
+
+
+class ResponseCache:
+    """A namespace of cached response payloads invalidated by generation bumps."""
+
+    def __init__(self, namespace, timeout=None):
+        self.namespace = namespace
+        self.timeout = timeout
+        _registry[namespace] = self
+
+    def _key(self, *parts):
+        return ':'.join(('response', self.namespace) + tuple(str(part) for part in parts))
+
+    def generation(self, scope=''):
+        cache = _cache()
+        key = self._key('generation', scope)
+        generation = cache.get(key)
+        if generation is None:
+            seed = _new_generation()
+            cache.add(key, seed, timeout=None)
+            generation = cache.get(key, seed)
+        return generation
+
+    def bump(self, scope=''):
+        """Invalidate every entry of ``scope``."""
+        return _incr(_cache(), self._key('generation', scope), start=_new_generation())
+
+    def cached(self, request, render, scope=''):
+        """
+        Return the cached payload for ``request`` or call ``render()`` and
+        store its data when it succeeds. Responses carry ``X-Cache: HIT/MISS``.
+        """
+        cache = _cache()
+        variant = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+        key = self._key(scope, self.generation(scope), variant)
+        data = cache.get(key)
+        if data is not None:
+            _incr(cache, self._key('hits'))
+            return Response(data, headers={CACHE_HEADER: 'HIT'})
+
+        _incr(cache, self._key('misses'))
+        response = render()
+        if response.status_code == status.HTTP_200_OK:
+            timeout = self.timeout if self.timeout is not None else settings.RESPONSE_CACHE_TIMEOUT
+            cache.set(key, response.data, timeout=timeout)
+        response[CACHE_HEADER] = 'MISS'
+        return response
+
+    def stats(self):
+        cache = _cache()
+        counters = cache.get_many([self._key('hits'), self._key('misses')])
+        hits = counters.get(self._key('hits'), 0)
+        misses = counters.get(self._key('misses'), 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
+
+    def reset_stats(self):
+        _cache().delete_many([self._key('hits'), self._key('misses')])
+
+
+def stats():
+    """Hit/miss counters for every registered namespace."""
+    return {namespace: response_cache.stats() for namespace, response_cache in _registry.items()}
+
+
+# Doctor profiles and weekly availability, shared by every directory listing
+doctor_directory = ResponseCache('doctor_directory')
+# Per-doctor availability including booked slots, scoped by doctor id
+doctor_schedule = ResponseCache('doctor_schedule')
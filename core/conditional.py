@@ -0,0 +1,176 @@
+"""
+Conditional requests (ETag/Last-Modified, If-None-Match, If-Match) for API
+resources.
+
+Validators are computed from ``updated_at`` columns without serializing
+anything: one ``UNION ALL`` query returning the row count, highest pk and
+latest timestamp, plus the same for each nested relation whose changes show
+up in the payload (e.g. record annotations; relations without ``updated_at``
+use ``created_at``). Each relation is aggregated on its own, over the rows the
+main query selects, so lists never join one relation against another.
+Entity tags also cover the query string, since ``?fields=``/``?expand=``
+change the representation. Collections only get an ETag: deleting any row
+but the newest leaves the latest timestamp unchanged, so a Last-Modified
+would go stale. Objects keep one because removing a related row touches the
+parent (see ``records.attachments._touch`` and ``records.summaries``).
+Unchanged resources are answered with 304 before any serialization happens,
+and writes whose If-Match no longer matches get 412 Precondition Failed.
+"""
+import hashlib
+
+from django.db.models import Count, Max, Value
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+TIMESTAMP_FIELD = 'updated_at'
+CACHE_CONTROL = 'private, no-cache'
+
+
+class Validators:
+    """An entity tag and optional last-modified time (epoch seconds)."""
+
+    def __init__(self, parts, timestamps):
+        self.etag = quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+        timestamps = [value for value in timestamps if value is not None]
+        self.last_modified = int(max(timestamps).timestamp()) if timestamps else None
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.last_modified)
+        response['Cache-Control'] = CACHE_CONTROL
+        return response
+
+
+def _summary(queryset, part, timestamp_field):
+    return queryset.order_by().select_related(None).annotate(part=Value(part)).values('part').annotate(
+        count=Count('pk', distinct=True), last_pk=Max('pk'), modified=Max(timestamp_field)
+    )
+
+
+def _aggregate(queryset, related):
+    queryset = queryset.order_by()
+    summaries = [_summary(queryset, 0, TIMESTAMP_FIELD)]
+    for index, path in enumerate(related, 1):
+        related_model = queryset.model._meta.get_field(path).related_model
+        rows = related_model._base_manager.filter(pk__in=queryset.values(f'{path}__pk'))
+        summaries.append(_summary(rows, index, _timestamp_field(related_model)))
+    # One statement; each relation is aggregated on its own instead of joined with the others
+    values = {row['part']: row for row in summaries[0].union(*summaries[1:], all=True)}
+    related_parts = tuple(
+        (path, values[index]['count'], values[index]['last_pk'], _timestamp(values[index]['modified']))
+        for index, path in enumerate(related, 1)
+    )
+    timestamps = [values[index]['modified'] for index in range(len(related) + 1)]
+    return values[0], related_parts, timestamps
+
+
+def _timestamp_field(model):
+    fields = {field.name for field in model._meta.get_fields()}
+    # Append-only relations (e.g. attachments) only have their creation time
+    return TIMESTAMP_FIELD if TIMESTAMP_FIELD in fields else 'created_at'
+
+
+def _timestamp(value):
+    return value.timestamp() if value is not None else None
+
+
+def instance_validators(request, instance):
+    """Validators for an already loaded object; no query needed."""
+    modified = getattr(instance, TIMESTAMP_FIELD)
+    parts = (instance._meta.label, instance.pk, request.GET.urlencode(), _timestamp(modified), ())
+    return Validators(parts, [modified])
+
+
+def object_validators(request, queryset, related=()):
+    """Validators for the single object in ``queryset``, or ``None`` if it does not exist."""
+    values, related_parts, timestamps = _aggregate(queryset, related)
+    if values['last_pk'] is None:
+        return None
+    parts = (
+        queryset.model._meta.label, values['last_pk'], request.GET.urlencode(),
+        _timestamp(values['modified']), related_parts,
+    )
+    return Validators(parts, timestamps)
+
+
+def collection_validators(request, queryset, related=()):
+    """ETag-only validators for a list response."""
+    values, related_parts, _ = _aggregate(queryset, related)
+    parts = (
+        queryset.model._meta.label, request.get_full_path(), request.user.pk,
+        values['count'], values['last_pk'], _timestamp(values['modified']), related_parts,
+    )
+    return Validators(parts, [])
+
+
+def evaluate_preconditions(request, validators):
+    """Return a 304/412 response when the request's preconditions say so, else ``None``."""
+    placeholder = validators.apply(HttpResponse())
+    response = get_conditional_response(
+        request,
+        etag=validators.etag,
+        last_modified=validators.last_modified,
+        response=placeholder
+    )
+    return None if response is placeholder else response
+
+
+def conditional_response(request, validators, render):
+    """Short-circuit with 304/412 or call ``render()`` and attach the validators."""
+    if validators is None:
+        return render()
+    response = evaluate_preconditions(request, validators)
+    if response is not None:
+        return response
+    response = render()
+    if 200 <= response.status_code < 300:
+        validators.apply(response)
+    return response
+
+
+class ConditionalRequestMixin:
+    """
+    Viewset mixin adding validators and conditional handling to ``list``,
+    ``retrieve`` and ``update``. ``conditional_related`` names relations whose
+    ``updated_at`` changes also change the representation.
+    """
+    conditional_related = ()
+
+    def object_validators(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        return object_validators(self.request, queryset, self.conditional_related)
+
+    def check_object_preconditions(self, request):
+        """Return a 412 response when If-Match/If-Unmodified-Since fail, else ``None``."""
+        validators = self.object_validators()
+        return evaluate_preconditions(request, validators) if validators else None
+
+    def list(self, request, *args, **kwargs):
+        validators = collection_validators(
+            request, self.filter_queryset(self.get_queryset()), self.conditional_related
+        )
+        return conditional_response(
+            request, validators, lambda: super(ConditionalRequestMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request, self.object_validators(),
+            lambda: super(ConditionalRequestMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+    def update(self, request, *args, **kwargs):
+        response = self.check_object_preconditions(request)
+        if response is not None:
+            return response
+        response = super().update(request, *args, **kwargs)
+        if 200 <= response.status_code < 300:
+            validators = self.object_validators()
+            if validators is not None:
+                validators.apply(response)
+        return response
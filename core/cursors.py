@@ -0,0 +1,34 @@
+"""
+Opaque keyset-pagination cursors.
+
+A cursor carries the sort key of the last row on a page, a timestamp followed
+by tie-breakers such as an id, as unpadded URL-safe base64 JSON. The next page
+is then a range condition on an index instead of an ``OFFSET``.
+"""
+import base64
+import json
+
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(timestamp, *keys):
+    payload = json.dumps([timestamp.isoformat(), *keys])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, *types):
+    """
+    Return ``(timestamp, *keys)`` from ``encode_cursor``, checking each key
+    against ``types``; raises ``ValueError`` for anything else.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, *keys = json.loads(base64.urlsafe_b64decode(padded))
+        timestamp = parse_datetime(timestamp)
+        if timestamp is None or len(keys) != len(types):
+            raise ValueError
+        if not all(isinstance(key, expected) for key, expected in zip(keys, types)):
+            raise ValueError
+        return (timestamp, *keys)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
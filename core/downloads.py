@@ -0,0 +1,175 @@
+"""
+Serving stored files after the view has checked access.
+
+``serve_file()`` answers conditional requests from the file's size and mtime
+and then either hands the transfer to the front proxy (``ATTACHMENT_OFFLOAD``
+= ``'nginx'`` for ``X-Accel-Redirect``, ``'sendfile'`` for Apache/lighttpd
+``X-Sendfile``) or streams the file itself. The fallback honours single
+``Range`` requests and ``If-Range``; it passes the open file to the WSGI
+server's ``wsgi.file_wrapper``, which uses ``sendfile(2)`` where available
+(gunicorn without TLS), and otherwise reads it in blocks. Files in object
+storage (``core.objectstore``) are not served at all: the response redirects
+to a short-lived presigned URL. ``serve_stream()`` sends content produced on
+the fly (such as a decompressed cold attachment), without ranges.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class FileRange:
+    """Read-only view of ``length`` bytes of ``file`` starting at ``start``."""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        # sendfile starts at the current position and stops at Content-Length
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Return ``(start, end)`` (inclusive) for a single byte range, or ``None``
+    to send the whole file (no, invalid or multiple ranges).
+    """
+    match = RANGE_RE.match(header.strip()) if header and size else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix range: the final N bytes
+        if int(last) == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if start >= size:
+        raise RangeNotSatisfiable
+    end = int(last) if last else size - 1
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, last_modified):
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    return parse_http_date_safe(value) == int(last_modified)
+
+
+def serve_file(request, fieldfile, filename=None, as_attachment=True, etag=None, offload=True):
+    """
+    Respond with the file behind ``fieldfile`` (anything with a storage
+    ``name`` and local ``path``); the caller has already authorized access.
+    ``etag`` replaces the one derived from size and mtime, and
+    ``offload=False`` keeps files the front proxy cannot see in this process.
+    """
+    storage = getattr(fieldfile, 'storage', None)
+    if getattr(storage, 'presigned_urls', False):
+        # The bucket handles ranges and validators itself
+        response = HttpResponseRedirect(storage.url(
+            fieldfile.name, filename=filename or os.path.basename(fieldfile.name), as_attachment=as_attachment
+        ))
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
+    try:
+        path = fieldfile.path
+        stat = os.stat(path)
+    except (ValueError, FileNotFoundError):
+        raise Http404('File not found')
+
+    filename = filename or os.path.basename(fieldfile.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    etag = etag or quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        offload = settings.ATTACHMENT_OFFLOAD if offload else None
+        if offload == 'nginx':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.ATTACHMENT_OFFLOAD_PREFIX + quote(fieldfile.name)
+        elif offload == 'sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = path
+        else:
+            response = _stream(request, path, stat.st_size, content_type, etag, last_modified)
+        if disposition := content_disposition_header(as_attachment, filename):
+            response['Content-Disposition'] = disposition
+        response['X-Content-Type-Options'] = 'nosniff'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def serve_stream(request, blocks, size=None, filename=None, etag=None, as_attachment=True, content_type=None):
+    """Respond with the byte blocks yielded by ``blocks``; ``size`` sets Content-Length when known."""
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        content_type = content_type or mimetypes.guess_type(filename or '')[0] or 'application/octet-stream'
+        response = StreamingHttpResponse(blocks, content_type=content_type)
+        if size is not None:
+            response['Content-Length'] = str(size)
+        if disposition := content_disposition_header(as_attachment, filename or 'download'):
+            response['Content-Disposition'] = disposition
+        response['X-Content-Type-Options'] = 'nosniff'
+    elif hasattr(blocks, 'close'):
+        blocks.close()
+    if etag:
+        response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _stream(request, path, size, content_type, etag, last_modified):
+    byte_range = None
+    if _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(file, start, end - start + 1), content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return response
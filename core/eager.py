@@ -0,0 +1,202 @@
+"""
+Eager-loading plans derived from the serializer graph.
+
+``eager_loading_plan()`` walks a serializer class once and returns the
+``select_related`` paths and ``Prefetch`` objects its nesting needs: nested
+serializers on forward relations are joined, nested lists on reverse or
+many-to-many relations are prefetched (recursively planned), dotted sources
+and non-pk related fields are loaded as well. Relations read only by
+``SerializerMethodField`` code are declared with ``Meta.eager_load``.
+
+``EagerLoadingMixin`` applies the plan to every viewset ``get_queryset`` and,
+with ``EAGER_LOADING_DEBUG`` enabled, warns whenever a query is executed while
+a serializer is rendering an object, i.e. a lazy load slipped through.
+"""
+import functools
+import sys
+import warnings
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+from .fieldsets import SparseFieldsMixin, sparse_params
+
+MAX_DEPTH = 4
+
+_plans = {}
+
+
+class LazyLoadWarning(RuntimeWarning):
+    """A query ran while a serializer was rendering an object."""
+
+
+def _relation_kind(model, name):
+    """Return ``'select'``, ``'prefetch'`` or ``None`` for ``model.name``."""
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None, None
+    if not field.is_relation:
+        return None, None
+    if field.many_to_many or field.one_to_many:
+        return 'prefetch', field.related_model
+    return 'select', field.related_model
+
+
+def _add_path(model, path, select, prefetch, prefix=''):
+    """Load the relations along a dotted ``path`` of ``model``."""
+    relations, to_many = [], False
+    for name in path.split('__'):
+        kind, model = _relation_kind(model, name)
+        if kind is None:
+            break
+        relations.append(name)
+        to_many = to_many or kind == 'prefetch'
+    if relations:
+        (prefetch if to_many else select).append(prefix + '__'.join(relations))
+
+
+def _walk(serializer, select, prefetch, prefix, depth):
+    model = serializer.Meta.model
+    if depth > MAX_DEPTH:
+        return
+
+    for source in getattr(serializer.Meta, 'eager_load', ()):
+        _add_path(model, source, select, prefetch, prefix)
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        source = field.source.replace('.', '__')
+
+        if isinstance(field, serializers.ListSerializer):
+            kind, related_model = _relation_kind(model, source)
+            if kind != 'prefetch':
+                continue
+            child_select, child_prefetch = _child_plan(field.child, depth + 1)
+            queryset = related_model._default_manager.all()
+            if child_select:
+                queryset = queryset.select_related(*child_select)
+            if child_prefetch:
+                queryset = queryset.prefetch_related(*child_prefetch)
+            prefetch.append(Prefetch(prefix + source, queryset=queryset))
+        elif isinstance(field, serializers.BaseSerializer):
+            kind, _ = _relation_kind(model, source)
+            if kind != 'select':
+                continue
+            select.append(prefix + source)
+            _walk(field, select, prefetch, f'{prefix}{source}__', depth + 1)
+        elif isinstance(field, serializers.ManyRelatedField):
+            if _relation_kind(model, source)[0] == 'prefetch':
+                prefetch.append(prefix + source)
+        elif '__' in source or (
+            isinstance(field, serializers.RelatedField)
+            and not isinstance(field, serializers.PrimaryKeyRelatedField)
+        ):
+            # Dotted sources and slug/string related fields read the related object
+            _add_path(model, source, select, prefetch, prefix)
+
+
+def _child_plan(serializer, depth):
+    select, prefetch = [], []
+    _walk(serializer, select, prefetch, '', depth)
+    return select, prefetch
+
+
+def eager_loading_plan(serializer_class):
+    """Return the cached ``(model, select_related, prefetch_related)`` plan."""
+    if serializer_class not in _plans:
+        model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+        if model is None:
+            _plans[serializer_class] = (None, [], [])
+        else:
+            select, prefetch = _child_plan(serializer_class(), 0)
+            _plans[serializer_class] = (model, select, prefetch)
+    return _plans[serializer_class]
+
+
+def eager_load(queryset, serializer_class):
+    """Apply ``serializer_class``'s eager-loading plan to ``queryset``."""
+    model, select, prefetch = eager_loading_plan(serializer_class)
+    if model is None or queryset.model is not model:
+        return queryset
+    if select:
+        queryset = queryset.select_related(*select)
+    seen = {
+        lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+        for lookup in queryset._prefetch_related_lookups
+    }
+    missing = [
+        lookup for lookup in prefetch
+        if (lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup) not in seen
+    ]
+    if missing:
+        queryset = queryset.prefetch_related(*missing)
+    return queryset
+
+
+def _with_eager_loading(get_queryset):
+    @functools.wraps(get_queryset)
+    def wrapper(self, *args, **kwargs):
+        return self.apply_eager_loading(get_queryset(self, *args, **kwargs))
+    wrapper._eager_loading = True
+    return wrapper
+
+
+def _rendering_serializer():
+    """Return the serializer whose ``to_representation`` is on the stack, if any."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code.co_name == 'to_representation':
+            instance = frame.f_locals.get('self')
+            if isinstance(instance, serializers.Serializer):
+                return instance
+        frame = frame.f_back
+    return None
+
+
+class EagerLoadingMixin:
+    """
+    Viewset mixin that applies the serializer-derived eager-loading plan to
+    ``get_queryset``, including overrides defined by subclasses.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        get_queryset = cls.__dict__.get('get_queryset')
+        if get_queryset is not None and not getattr(get_queryset, '_eager_loading', False):
+            cls.get_queryset = _with_eager_loading(get_queryset)
+        # Build the plan at import time so misconfigurations surface early
+        if getattr(cls, 'serializer_class', None) is not None:
+            eager_loading_plan(cls.serializer_class)
+
+    @_with_eager_loading
+    def get_queryset(self):
+        return super().get_queryset()
+
+    def apply_eager_loading(self, queryset):
+        serializer_class = self.get_serializer_class()
+        if issubclass(serializer_class, SparseFieldsMixin) and sparse_params(self.request) is not None:
+            # Sparse responses are planned by SparseFieldsViewMixin instead
+            return queryset
+        return eager_load(queryset, serializer_class)
+
+    def dispatch(self, request, *args, **kwargs):
+        if not getattr(settings, 'EAGER_LOADING_DEBUG', False):
+            return super().dispatch(request, *args, **kwargs)
+        with connection.execute_wrapper(self._detect_lazy_load):
+            return super().dispatch(request, *args, **kwargs)
+
+    def _detect_lazy_load(self, execute, sql, params, many, context):
+        serializer = _rendering_serializer()
+        if serializer is not None:
+            warnings.warn(
+                f'{type(self).__name__} ({self.action}): {type(serializer).__name__} '
+                f'triggered a lazy load: {sql}',
+                LazyLoadWarning,
+                stacklevel=2
+            )
+        return execute(sql, params, many, context)
@@ -0,0 +1,263 @@
+"""
+Read-only, ``values_list()``-based rendering for high-volume list endpoints.
+
+A ``FastSerializer`` mirrors an existing DRF serializer. Its field tree is
+compiled once into a flat column list and per-field converters; rows are then
+rendered straight from database tuples, without instantiating models or going
+through DRF's per-field ``get_attribute``/``to_representation`` machinery.
+Forward relations are joined into the same query and reverse relations are
+loaded with one extra query each. The output matches the mirrored serializer.
+"""
+import datetime
+from collections import defaultdict
+from operator import itemgetter
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .fieldsets import sparse_params
+
+ISO_8601 = 'iso-8601'
+
+# DRF fields whose representation of a database value is the value itself
+IDENTITY_FIELDS = (
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.FloatField,
+    serializers.BooleanField,
+    serializers.ChoiceField,
+    serializers.JSONField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+
+class _Plan:
+    """Columns and render nodes for one ``values_list()`` query."""
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = []
+        self.nodes = []
+        self.related = []
+        self.pk_index = None
+        self.link_index = None
+
+    def column(self, path):
+        self.columns.append(path)
+        return len(self.columns) - 1
+
+
+def _compile(serializer, method_fields, path=''):
+    plan = _Plan(serializer.Meta.model)
+    plan.pk_index, plan.nodes = _compile_nodes(plan, serializer, method_fields, '', path)
+    return plan
+
+
+def _compile_nodes(plan, serializer, method_fields, prefix, path):
+    model = serializer.Meta.model
+    pk_index = plan.column(f'{prefix}pk')
+    nodes = []
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        field_path = f'{path}{name}'
+
+        if isinstance(field, serializers.SerializerMethodField):
+            if field_path not in method_fields:
+                raise ImproperlyConfigured(f'{field_path} needs an entry in method_fields')
+            sources, function = method_fields[field_path]
+            indexes = [plan.column(prefix + source) for source in sources]
+            nodes.append((name, 'method', indexes, function))
+            continue
+
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            if hasattr(model, field.source):
+                raise ImproperlyConfigured(f'{field_path} is not backed by a model field')
+            # DRF skips read-only fields whose attribute does not exist
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            if prefix or not model_field.one_to_many:
+                raise ImproperlyConfigured(f'{field_path}: only top-level reverse foreign keys are supported')
+            child = _compile(field.child, method_fields, path=f'{field_path}.')
+            child.link_index = child.column(model_field.field.attname)
+            plan.related.append((model_field.field.attname, child))
+            nodes.append((name, 'related', len(plan.related) - 1))
+        elif isinstance(field, serializers.BaseSerializer):
+            nested = _compile_nodes(
+                plan, field, method_fields, f'{prefix}{field.source}__', f'{field_path}.'
+            )
+            nodes.append((name, 'nested') + nested)
+        else:
+            nodes.append((name, 'value', plan.column(prefix + field.source), field, model_field))
+
+    return pk_index, nodes
+
+
+def _temporal_converter(field, default_format, iso):
+    output_format = getattr(field, 'format', default_format)
+    if output_format is None:
+        return None
+    if output_format.lower() != ISO_8601:
+        return lambda value: value if isinstance(value, str) else value.strftime(output_format)
+    return iso
+
+
+def _datetime_converter(field):
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    # Database drivers return UTC datetimes, which need no conversion to a UTC field timezone
+    utc_target = field_timezone is not None and field_timezone.utcoffset(None) == datetime.timedelta(0)
+
+    def iso(value):
+        # Mirrors DateTimeField.enforce_timezone() followed by ISO formatting
+        if isinstance(value, str):
+            return value
+        if value.tzinfo is not None and not (utc_target and value.tzinfo is datetime.timezone.utc):
+            if field_timezone is not None:
+                value = value.astimezone(field_timezone)
+            elif value.utcoffset() is not None:
+                value = timezone.make_naive(value, datetime.timezone.utc)
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    return _temporal_converter(field, api_settings.DATETIME_FORMAT, iso)
+
+
+def _isoformat(value):
+    return value if isinstance(value, str) else value.isoformat()
+
+
+def _file_converter(field, model_field, context):
+    if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+        return lambda name: name or None
+    storage = model_field.storage
+    request = context.get('request')
+
+    def convert(name):
+        if not name:
+            return None
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+
+    return convert
+
+
+def _converter(field, model_field, context):
+    """Return a callable for non-null values, or ``None`` when no conversion is needed."""
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime_converter(field)
+    if isinstance(field, serializers.DateField):
+        return _temporal_converter(field, api_settings.DATE_FORMAT, _isoformat)
+    if isinstance(field, serializers.TimeField):
+        return _temporal_converter(field, api_settings.TIME_FORMAT, _isoformat)
+    if isinstance(field, serializers.FileField):
+        return _file_converter(field, model_field, context)
+    if isinstance(field, IDENTITY_FIELDS):
+        return None
+    # Anything else goes through the DRF field itself
+    return field.to_representation
+
+
+def _value_getter(index, convert):
+    if convert is None:
+        return itemgetter(index)
+
+    def get(row):
+        value = row[index]
+        return None if value is None else convert(value)
+    return get
+
+
+def _method_getter(indexes, function):
+    return lambda row: function(*[row[index] for index in indexes])
+
+
+def _nested_getter(pk_index, build):
+    return lambda row: None if row[pk_index] is None else build(row)
+
+
+def _related_getter(pk_index, children):
+    return lambda row: children.get(row[pk_index], [])
+
+
+def _builder(nodes, pk_index, related, context):
+    getters = []
+    for node in nodes:
+        name, kind = node[0], node[1]
+        if kind == 'value':
+            _, _, index, field, model_field = node
+            getter = _value_getter(index, _converter(field, model_field, context))
+        elif kind == 'method':
+            getter = _method_getter(node[2], node[3])
+        elif kind == 'nested':
+            nested_pk, nested_nodes = node[2], node[3]
+            getter = _nested_getter(nested_pk, _builder(nested_nodes, nested_pk, related, context))
+        else:
+            getter = _related_getter(pk_index, related[node[2]])
+        getters.append((name, getter))
+
+    def build(row):
+        return {name: getter(row) for name, getter in getters}
+    return build
+
+
+class FastSerializer:
+    """
+    Render ``serializer_class`` output for a queryset from ``values_list()``
+    tuples. ``SerializerMethodField``s cannot be inferred and are declared in
+    ``method_fields`` by dotted path as ``(source columns, function)``.
+    """
+    serializer_class = None
+    method_fields = {}
+
+    def __init__(self, context=None):
+        self.context = context or {}
+
+    @classmethod
+    def get_plan(cls):
+        if '_plan' not in cls.__dict__:
+            cls._plan = _compile(cls.serializer_class(), cls.method_fields)
+        return cls._plan
+
+    def render(self, queryset):
+        return [data for _, data in self._render(self.get_plan(), queryset)]
+
+    def _render(self, plan, queryset):
+        rows = list(queryset.prefetch_related(None).values_list(*plan.columns))
+
+        related = []
+        if plan.related and rows:
+            pks = [row[plan.pk_index] for row in rows]
+            for link, child in plan.related:
+                children = defaultdict(list)
+                child_queryset = child.model._default_manager.filter(**{f'{link}__in': pks})
+                for child_row, data in self._render(child, child_queryset):
+                    children[child_row[child.link_index]].append(data)
+                related.append(children)
+        else:
+            related = [{} for _ in plan.related]
+
+        build = _builder(plan.nodes, plan.pk_index, related, self.context)
+        return [(row, build(row)) for row in rows]
+
+
+class FastListMixin:
+    """
+    Viewset mixin serving ``list`` through ``fast_serializer_class``. Sparse
+    fieldset requests and paginated lists keep using the regular serializer.
+    """
+    fast_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if (self.fast_serializer_class is None or self.paginator is not None
+                or sparse_params(request) is not None):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.fast_serializer_class(context=self.get_serializer_context())
+        return Response(serializer.render(queryset))
@@ -0,0 +1,186 @@
+"""
+Sparse fieldsets (``?fields=``), explicit expansion (``?expand=``) and
+``Prefer: return=minimal`` support for API responses.
+
+Without either query parameter responses keep their full legacy shape. Once a
+client asks for a sparse response only the requested fields are rendered and
+nested serializers collapse to primary keys unless listed in ``expand``.
+Dotted names select fields of a relation, e.g.
+``?fields=id,title,patient.username`` (which implies ``expand=patient``).
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers, status
+from rest_framework.response import Response
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def parse_field_tree(value):
+    """Turn ``a,b.c,b.d`` into ``{'a': {}, 'b': {'c': {}, 'd': {}}}``."""
+    tree = {}
+    for name in (value or '').split(','):
+        node = tree
+        for part in name.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def sparse_params(request):
+    """
+    Return ``(fields, expand)`` trees for a read request that asked for a
+    sparse response, or ``None`` to render the full legacy representation.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    if FIELDS_PARAM not in params and EXPAND_PARAM not in params:
+        return None
+    fields = parse_field_tree(params.get(FIELDS_PARAM)) if FIELDS_PARAM in params else None
+    return fields, parse_field_tree(params.get(EXPAND_PARAM))
+
+
+def _nested(field):
+    return field.child if isinstance(field, serializers.ListSerializer) else field
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin that honours ``?fields=`` and ``?expand=`` from the
+    request in its context. Nested serializers receive their part of the
+    field tree from the parent.
+    """
+
+    def __init__(self, *args, **kwargs):
+        sparse = kwargs.pop('sparse', None)
+        super().__init__(*args, **kwargs)
+        self._sparse = sparse if sparse is not None else sparse_params(self._context.get('request'))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self._sparse is None:
+            return fields
+
+        requested, expand = self._sparse
+        if requested:
+            fields = {name: field for name, field in fields.items() if name in requested}
+
+        for name, field in list(fields.items()):
+            if not isinstance(field, serializers.BaseSerializer):
+                continue
+            subfields = (requested or {}).get(name) or None
+            if name in expand or subfields:
+                nested = _nested(field)
+                if isinstance(nested, SparseFieldsMixin):
+                    nested._sparse = (subfields, expand.get(name, {}))
+            else:
+                fields[name] = serializers.PrimaryKeyRelatedField(
+                    source=field.source,
+                    many=isinstance(field, serializers.ListSerializer),
+                    read_only=True
+                )
+        return fields
+
+
+def sparse_queryset(queryset, serializer, required=()):
+    """
+    Trim ``queryset`` to the columns and relations ``serializer`` will read:
+    ``only()`` for plain fields, ``select_related`` for expanded foreign keys
+    and a prefetch for expanded reverse relations (itself trimmed when the
+    nested serializer is sparse). Fields whose columns cannot be inferred,
+    such as ``SerializerMethodField``, disable the ``only()`` step.
+    """
+    model = queryset.model
+    columns = {model._meta.pk.name, *required}
+    trim = True
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*' or '.' in field.source:
+            trim = False
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            if isinstance(field, serializers.SerializerMethodField) or hasattr(model, field.source):
+                trim = False
+            # Otherwise the attribute does not exist and the field is skipped
+            continue
+
+        nested = _nested(field)
+        if not model_field.is_relation:
+            columns.add(model_field.name)
+        elif model_field.concrete and not model_field.many_to_many:
+            columns.add(model_field.name)
+            if isinstance(nested, serializers.BaseSerializer):
+                queryset = queryset.select_related(model_field.name)
+        else:
+            related = model_field.related_model._default_manager.all()
+            # Reverse foreign keys need the joining column to attach results
+            link = (model_field.field.name,) if model_field.one_to_many else ()
+            if isinstance(nested, SparseFieldsMixin):
+                related = sparse_queryset(related, nested, required=link)
+            elif not isinstance(nested, serializers.BaseSerializer):
+                related = related.only('pk', *link)
+            queryset = queryset.prefetch_related(Prefetch(model_field.name, queryset=related))
+
+    if not trim:
+        # Method fields are being rendered; load the relations they declare
+        queryset = queryset.prefetch_related(*getattr(serializer.Meta, 'eager_load', ()))
+    return queryset.only(*columns) if trim else queryset
+
+
+def prefers_minimal(request):
+    """True when the client sent ``Prefer: return=minimal`` (RFC 7240)."""
+    preferences = request.headers.get('Prefer', '')
+    return any(
+        token.strip().lower() == 'return=minimal'
+        for preference in preferences.split(',')
+        for token in preference.split(';')
+    )
+
+
+def minimal_response(instance, status=status.HTTP_200_OK):
+    """Acknowledge a write with just the identifier, skipping serialization."""
+    return Response(
+        {'id': instance.pk},
+        status=status,
+        headers={'Preference-Applied': 'return=minimal'}
+    )
+
+
+class SparseFieldsViewMixin:
+    """
+    Viewset mixin that trims read querysets to the requested sparse fieldset
+    and answers writes sent with ``Prefer: return=minimal`` with only the id.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        sparse = sparse_params(self.request)
+        serializer_class = self.get_serializer_class()
+        if sparse is not None and issubclass(serializer_class, SparseFieldsMixin):
+            queryset = sparse_queryset(queryset, serializer_class(sparse=sparse))
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        if not prefers_minimal(request):
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return minimal_response(serializer.instance, status.HTTP_201_CREATED)
+
+    def update(self, request, *args, **kwargs):
+        if not prefers_minimal(request):
+            return super().update(request, *args, **kwargs)
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return minimal_response(instance)
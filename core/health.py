@@ -0,0 +1,89 @@
+"""
+Liveness and readiness probes.
+
+``/healthz`` answers as long as the process serves requests and reports what
+it sees; ``/readyz`` returns 503 unless the primary database answers within
+``HEALTH_DB_TIMEOUT_MS`` and the connection pool has room, so load balancers
+only route traffic to instances that can serve it.
+"""
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.http import JsonResponse
+
+from . import routing
+
+
+def probe(alias=DEFAULT_DB_ALIAS):
+    """Run ``SELECT 1`` on ``alias`` and return the round trip in milliseconds."""
+    started = time.perf_counter()
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return (time.perf_counter() - started) * 1000
+
+
+def check_database(alias=DEFAULT_DB_ALIAS):
+    try:
+        latency = probe(alias)
+    except DatabaseError as e:
+        # Drop the broken connection so the next probe reconnects
+        connections[alias].close()
+        return {'ok': False, 'error': str(e).strip()}
+    return {'ok': latency <= settings.HEALTH_DB_TIMEOUT_MS, 'latency_ms': round(latency, 2)}
+
+
+def pool_stats(alias=DEFAULT_DB_ALIAS):
+    """Connection pool usage, or the persistent-connection settings without a pool."""
+    connection = connections[alias]
+    pool = getattr(connection, 'pool', None)
+    if pool is None:
+        return {
+            'enabled': False,
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+            'ok': True,
+        }
+    stats = pool.get_stats()
+    in_use = stats.get('pool_size', 0) - stats.get('pool_available', 0)
+    waiting = stats.get('requests_waiting', 0)
+    return {
+        'enabled': True,
+        'size': stats.get('pool_size', 0),
+        'max_size': pool.max_size,
+        'in_use': in_use,
+        'waiting': waiting,
+        'saturation': round(in_use / pool.max_size, 2),
+        'ok': waiting == 0 or in_use < pool.max_size,
+    }
+
+
+def replica_stats():
+    healthy = routing.monitor.healthy()
+    return {
+        alias: {'lag_seconds': lag, 'in_rotation': alias in healthy}
+        for alias, lag in routing.monitor.lag.items()
+    }
+
+
+def report():
+    database = check_database()
+    pool = pool_stats()
+    return {
+        'status': 'ok' if database['ok'] and pool['ok'] else 'unavailable',
+        'database': database,
+        'pool': pool,
+        'replicas': replica_stats(),
+    }
+
+
+def healthz(request):
+    """Liveness: always 200 while the process serves; the body shows dependency state."""
+    return JsonResponse(report())
+
+
+def readyz(request):
+    """Readiness: 503 while the database is unreachable, slow or out of pooled connections."""
+    data = report()
+    return JsonResponse(data, status=200 if data['status'] == 'ok' else 503)
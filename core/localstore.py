@@ -0,0 +1,258 @@
+"""
+A filesystem-backed stand-in for an S3-compatible object store.
+
+``LocalObjectStore`` is a small WSGI application for development and tests
+(``python manage.py run_object_store``). It implements the part of the S3
+API that ``core.objectstore.S3Storage`` and browsers use: path-style
+``PUT``/``GET``/``HEAD``/``DELETE`` of objects and ``PUT`` copies, authenticated with SigV4
+``Authorization`` headers or presigned query strings. Signatures, expiry,
+signed ``Content-Length`` and ``x-amz-checksum-sha256`` are checked like the
+real service checks them, so presigned URLs that work here work against S3.
+Uploads are streamed to a temporary file and renamed into place; objects live
+under ``<root>/<bucket>/<key>``. It is not meant for production traffic.
+"""
+import base64
+import hashlib
+import hmac
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from urllib.parse import parse_qsl, unquote
+from xml.sax.saxutils import escape
+
+from core.downloads import RangeNotSatisfiable, parse_range
+
+from .objectstore import ALGORITHM, MAX_EXPIRY, UNSIGNED_PAYLOAD, signature
+
+AUTHORIZATION_RE = re.compile(
+    r'^AWS4-HMAC-SHA256 Credential=(?P<credential>[^,]+),\s*'
+    r'SignedHeaders=(?P<signed>[^,]+),\s*Signature=(?P<signature>[0-9a-f]+)$'
+)
+CLOCK_SKEW = timedelta(minutes=15)
+REASONS = {
+    200: 'OK', 204: 'No Content', 206: 'Partial Content', 400: 'Bad Request', 403: 'Forbidden',
+    404: 'Not Found', 405: 'Method Not Allowed', 411: 'Length Required', 416: 'Range Not Satisfiable',
+}
+
+
+class StoreError(Exception):
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        raise StoreError(403, 'AccessDenied', 'Invalid X-Amz-Date')
+
+
+class LocalObjectStore:
+    """WSGI application serving buckets under ``root`` for the given ``{access key: secret key}``."""
+
+    def __init__(self, root, credentials, region='us-east-1', block_size=64 * 1024):
+        self.root = os.path.abspath(root)
+        self.credentials = credentials
+        self.region = region
+        self.block_size = block_size
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        headers = {
+            key[5:].replace('_', '-').lower(): value
+            for key, value in environ.items() if key.startswith('HTTP_')
+        }
+        for key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            if environ.get(key):
+                headers[key.replace('_', '-').lower()] = environ[key]
+        if method == 'OPTIONS':
+            # CORS preflight for browser uploads and downloads
+            return self._respond(start_response, 200, {
+                'Access-Control-Allow-Methods': 'GET, HEAD, PUT',
+                'Access-Control-Allow-Headers': headers.get('access-control-request-headers', '*'),
+                'Access-Control-Max-Age': '3600',
+            })
+        query = parse_qsl(environ.get('QUERY_STRING', ''), keep_blank_values=True)
+        path = environ.get('PATH_INFO', '/').encode('latin-1').decode('utf-8')
+        try:
+            self._authenticate(method, path, query, headers)
+            bucket, _, key = path.lstrip('/').partition('/')
+            parts = key.split('/')
+            if not bucket or not key or any(part in ('', '.', '..') for part in parts):
+                raise StoreError(400, 'InvalidRequest', 'Expected /<bucket>/<key>')
+            target = os.path.join(self.root, bucket, *parts)
+            if method == 'PUT' and 'x-amz-copy-source' in headers:
+                return self._copy(start_response, headers['x-amz-copy-source'], target)
+            if method == 'PUT':
+                return self._put(environ, start_response, headers, target)
+            if method in ('GET', 'HEAD'):
+                return self._get(environ, start_response, method, headers, dict(query), target)
+            if method == 'DELETE':
+                try:
+                    os.remove(target)
+                except FileNotFoundError:
+                    pass
+                return self._respond(start_response, 204)
+            raise StoreError(405, 'MethodNotAllowed', f'{method} is not supported')
+        except StoreError as e:
+            body = (
+                '<?xml version="1.0" encoding="UTF-8"?>'
+                f'<Error><Code>{e.code}</Code><Message>{escape(str(e))}</Message></Error>'
+            ).encode()
+            return self._respond(start_response, e.status, {'Content-Type': 'application/xml'},
+                                 body if method != 'HEAD' else b'')
+
+    def _authenticate(self, method, path, query, headers):
+        params = dict(query)
+        if 'X-Amz-Signature' in params:
+            if params.get('X-Amz-Algorithm') != ALGORITHM:
+                raise StoreError(400, 'AuthorizationQueryParametersError', 'Unsupported algorithm')
+            credential = params.get('X-Amz-Credential', '')
+            signed = params.get('X-Amz-SignedHeaders', '')
+            given = params['X-Amz-Signature']
+            amz_date = params.get('X-Amz-Date')
+            try:
+                expires = int(params.get('X-Amz-Expires', ''))
+            except ValueError:
+                raise StoreError(400, 'AuthorizationQueryParametersError', 'Invalid X-Amz-Expires')
+            if not 0 < expires <= MAX_EXPIRY:
+                raise StoreError(400, 'AuthorizationQueryParametersError', 'Invalid X-Amz-Expires')
+            if datetime.now(timezone.utc) > _parse_date(amz_date) + timedelta(seconds=expires):
+                raise StoreError(403, 'AccessDenied', 'Request has expired')
+            query = [(name, value) for name, value in query if name != 'X-Amz-Signature']
+            payload_hash = UNSIGNED_PAYLOAD
+        else:
+            match = AUTHORIZATION_RE.match(headers.get('authorization', ''))
+            if match is None:
+                raise StoreError(403, 'AccessDenied', 'Missing or malformed authorization')
+            credential, signed, given = match['credential'], match['signed'], match['signature']
+            amz_date = headers.get('x-amz-date')
+            if abs(datetime.now(timezone.utc) - _parse_date(amz_date)) > CLOCK_SKEW:
+                raise StoreError(403, 'RequestTimeTooSkewed', 'Request time is too far from the server time')
+            payload_hash = headers.get('x-amz-content-sha256', '')
+
+        access_key, _, scope = credential.partition('/')
+        secret_key = self.credentials.get(access_key)
+        if secret_key is None:
+            raise StoreError(403, 'InvalidAccessKeyId', 'Unknown access key')
+        if len(scope.split('/')) != 4 or scope.split('/')[1] != self.region or not amz_date.startswith(scope[:8]):
+            raise StoreError(403, 'AuthorizationHeaderMalformed', 'Invalid credential scope')
+        names = signed.split(';')
+        if 'host' not in names or any(name not in headers for name in names):
+            raise StoreError(403, 'AccessDenied', 'A signed header is missing')
+        expected = signature(
+            secret_key, scope, amz_date, method, path, query, {name: headers[name] for name in names}, payload_hash
+        )
+        if not hmac.compare_digest(expected, given):
+            raise StoreError(403, 'SignatureDoesNotMatch', 'The request signature does not match')
+
+    def _put(self, environ, start_response, headers, target):
+        try:
+            length = int(headers['content-length'])
+        except (KeyError, ValueError):
+            raise StoreError(411, 'MissingContentLength', 'Content-Length is required')
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        hasher = hashlib.sha256()
+        stream = environ['wsgi.input']
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(target), suffix='.upload', delete=False) as partial:
+            try:
+                remaining = length
+                while remaining:
+                    block = stream.read(min(self.block_size, remaining))
+                    if not block:
+                        raise StoreError(400, 'IncompleteBody', 'Request body is shorter than Content-Length')
+                    partial.write(block)
+                    hasher.update(block)
+                    remaining -= len(block)
+                checksum = headers.get('x-amz-checksum-sha256')
+                if checksum and checksum != base64.b64encode(hasher.digest()).decode():
+                    raise StoreError(400, 'BadDigest', 'The SHA-256 checksum does not match the body')
+                payload_hash = headers.get('x-amz-content-sha256', UNSIGNED_PAYLOAD)
+                if payload_hash != UNSIGNED_PAYLOAD and payload_hash != hasher.hexdigest():
+                    raise StoreError(400, 'XAmzContentSHA256Mismatch', 'The payload hash does not match the body')
+            except BaseException:
+                partial.close()
+                os.remove(partial.name)
+                raise
+        os.replace(partial.name, target)
+        return self._respond(start_response, 200, {'ETag': f'"{hasher.hexdigest()}"'})
+
+    def _copy(self, start_response, source, target):
+        source = unquote(source).lstrip('/')
+        parts = source.split('/')
+        if len(parts) < 2 or any(part in ('', '.', '..') for part in parts):
+            raise StoreError(400, 'InvalidArgument', 'Expected x-amz-copy-source /<bucket>/<key>')
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(target), suffix='.upload', delete=False) as partial:
+            try:
+                with open(os.path.join(self.root, *parts), 'rb') as original:
+                    shutil.copyfileobj(original, partial, self.block_size)
+            except BaseException as e:
+                partial.close()
+                os.remove(partial.name)
+                if isinstance(e, (FileNotFoundError, NotADirectoryError)):
+                    raise StoreError(404, 'NoSuchKey', 'The specified copy source does not exist')
+                raise
+        os.replace(partial.name, target)
+        return self._respond(start_response, 200, {'Content-Type': 'application/xml'},
+                             b'<?xml version="1.0" encoding="UTF-8"?><CopyObjectResult/>')
+
+    def _get(self, environ, start_response, method, headers, params, target):
+        try:
+            stat = os.stat(target)
+        except (FileNotFoundError, NotADirectoryError):
+            raise StoreError(404, 'NoSuchKey', 'The specified key does not exist')
+        response_headers = {
+            'Content-Type': params.get('response-content-type')
+            or mimetypes.guess_type(target)[0] or 'application/octet-stream',
+            'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+            'ETag': f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+            'Accept-Ranges': 'bytes',
+        }
+        if params.get('response-content-disposition'):
+            response_headers['Content-Disposition'] = params['response-content-disposition']
+        start, length, status = 0, stat.st_size, 200
+        try:
+            byte_range = parse_range(headers.get('range'), stat.st_size)
+        except RangeNotSatisfiable:
+            raise StoreError(416, 'InvalidRange', 'The requested range is not satisfiable')
+        if byte_range is not None:
+            start, end = byte_range
+            length, status = end - start + 1, 206
+            response_headers['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response_headers['Content-Length'] = str(length)
+        if method == 'HEAD':
+            return self._respond(start_response, status, response_headers)
+        file = open(target, 'rb')
+        file.seek(start)
+        self._start(start_response, status, response_headers)
+        return self._iter_file(file, length)
+
+    def _iter_file(self, file, length):
+        with file:
+            while length:
+                block = file.read(min(self.block_size, length))
+                if not block:
+                    break
+                length -= len(block)
+                yield block
+
+    def _start(self, start_response, status, headers):
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'ETag, Content-Length, Content-Range',
+            **headers,
+        }
+        start_response(f'{status} {REASONS.get(status, "")}', list(headers.items()))
+
+    def _respond(self, start_response, status, headers=None, body=b''):
+        headers = dict(headers or {})
+        headers.setdefault('Content-Length', str(len(body)))
+        self._start(start_response, status, headers)
+        return [body]
@@ -0,0 +1,119 @@
+import time
+from datetime import date, timedelta, time as dtime
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+from rest_framework.test import APIRequestFactory
+
+from core.models import User, DoctorAppointment
+from core.serializers import AppointmentFastSerializer, AppointmentResponseSerializer
+from records.models import HealthRecord, DoctorAnnotation
+from records.serializers import HealthRecordFastSerializer, HealthRecordSerializer
+
+PREFIX = 'bench_ser_'
+
+
+class Command(BaseCommand):
+    """Compare DRF serializers with the values()-based fast serializers"""
+
+    help = 'Seed synthetic records and appointments and time list serialization throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000,
+                            help='Number of synthetic records and appointments')
+        parser.add_argument('--annotations', type=int, default=2,
+                            help='Annotations per synthetic record')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed runs per serializer; the best run is reported')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the synthetic data and exit')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(username__startswith=PREFIX)
+        if options['cleanup']:
+            deleted, _ = users.delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} synthetic rows'))
+            return
+
+        patient, doctor = self._seed(options)
+        context = {'request': APIRequestFactory().get('/api/records/')}
+
+        records = HealthRecord.objects.filter(patient=patient)
+        appointments = DoctorAppointment.objects.filter(patient=patient)
+        cases = {
+            'records': (
+                lambda: HealthRecordSerializer(
+                    records.select_related('patient').prefetch_related(
+                        Prefetch('annotations', queryset=DoctorAnnotation.objects.select_related('doctor'))
+                    ),
+                    many=True, context=context
+                ).data,
+                lambda: HealthRecordFastSerializer(context=context).render(records),
+            ),
+            'appointments': (
+                lambda: AppointmentResponseSerializer(
+                    appointments.select_related('doctor', 'patient'), many=True, context=context
+                ).data,
+                lambda: AppointmentFastSerializer(context=context).render(appointments),
+            ),
+        }
+
+        self.stdout.write(f'{"endpoint":<14}{"drf rows/s":>14}{"fast rows/s":>14}{"speedup":>10}')
+        for name, (drf, fast) in cases.items():
+            drf_seconds, count = self._time(drf, options['repeat'])
+            fast_seconds, _ = self._time(fast, options['repeat'])
+            self.stdout.write(
+                f'{name:<14}{count / drf_seconds:>14,.0f}{count / fast_seconds:>14,.0f}'
+                f'{drf_seconds / fast_seconds:>9.1f}x'
+            )
+
+    def _seed(self, options):
+        patient, _ = User.objects.get_or_create(
+            username=f'{PREFIX}patient',
+            defaults={'email': f'{PREFIX}patient@bench.example', 'role': User.Role.PATIENT,
+                      'first_name': 'Bench', 'last_name': 'Patient', 'password': '!'}
+        )
+        doctor, _ = User.objects.get_or_create(
+            username=f'{PREFIX}doctor',
+            defaults={'email': f'{PREFIX}doctor@bench.example', 'role': User.Role.DOCTOR,
+                      'first_name': 'Bench', 'last_name': 'Doctor', 'password': '!',
+                      'specialization': 'Cardiology', 'appointment_duration': 30,
+                      'max_patients_per_day': 20,
+                      'available_days': {'MONDAY': {'start_time': '08:00', 'end_time': '17:00',
+                                                    'is_available': True}}}
+        )
+
+        existing = HealthRecord.objects.filter(patient=patient).count()
+        missing = options['rows'] - existing
+        batch_size = options['batch_size']
+        if missing > 0:
+            self.stdout.write(f'Seeding {missing} records and appointments...')
+            for start in range(existing, options['rows'], batch_size):
+                stop = min(start + batch_size, options['rows'])
+                # bulk_create skips the model save() hooks and appointment validation
+                records = HealthRecord.objects.bulk_create([
+                    HealthRecord(record_id=f'{PREFIX}{i}', patient=patient, doctor=doctor,
+                                 title=f'Record {i}', description='Synthetic benchmark record')
+                    for i in range(start, stop)
+                ])
+                DoctorAnnotation.objects.bulk_create([
+                    DoctorAnnotation(record=record, doctor=doctor, content=f'Annotation {n}')
+                    for record in records for n in range(options['annotations'])
+                ], batch_size=batch_size)
+                DoctorAppointment.objects.bulk_create([
+                    DoctorAppointment(doctor=doctor, patient=patient,
+                                      appointment_date=date(2020, 1, 6) + timedelta(days=i),
+                                      start_time=dtime(9, 0), end_time=dtime(9, 30))
+                    for i in range(start, stop)
+                ])
+        return patient, doctor
+
+    def _time(self, run, repeat):
+        best, count = None, 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            count = len(run())
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, count
@@ -0,0 +1,138 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+
+from core.models import User
+from core.search import SEARCH_FIELDS, fuzzy_search_users
+
+FIRST_NAMES = [
+    'james', 'mary', 'robert', 'patricia', 'john', 'jennifer', 'michael', 'linda',
+    'david', 'elizabeth', 'william', 'barbara', 'richard', 'susan', 'joseph', 'jessica',
+    'thomas', 'sarah', 'charles', 'karen', 'amina', 'omar', 'fatima', 'hassan',
+]
+LAST_NAMES = [
+    'smith', 'johnson', 'williams', 'brown', 'jones', 'garcia', 'miller', 'davis',
+    'rodriguez', 'martinez', 'hernandez', 'lopez', 'gonzalez', 'wilson', 'anderson',
+    'thomas', 'taylor', 'moore', 'jackson', 'martin', 'khan', 'ali', 'hussain', 'ahmed',
+]
+PREFIX = 'bench_'
+
+
+class Command(BaseCommand):
+    """Measure fuzzy user lookup latency against the legacy icontains search"""
+
+    help = 'Seed synthetic users and benchmark trigram search latency (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000,
+                            help='Number of synthetic users to have in the table')
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Number of search terms to time per strategy')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Result page size, as used by the admin and lookup endpoint')
+        parser.add_argument('--skip-legacy', action='store_true',
+                            help='Only time the trigram search')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the synthetic users and exit')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('This benchmark requires PostgreSQL with pg_trgm')
+
+        benchmark_users = User.objects.filter(username__startswith=PREFIX)
+        if options['cleanup']:
+            deleted, _ = benchmark_users.delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} synthetic rows'))
+            return
+
+        rng = random.Random(options['seed'])
+        self._seed(rng, benchmark_users.count(), options['users'], options['batch_size'])
+
+        terms = self._terms(rng, options['queries'])
+        limit = options['limit']
+        results = {'trigram': self._time(terms, lambda term: list(
+            fuzzy_search_users(User.objects.all(), term)[:limit]
+        ))}
+        if not options['skip_legacy']:
+            results['icontains'] = self._time(terms, lambda term: list(
+                self._legacy_search(term)[:limit]
+            ))
+
+        total = User.objects.count()
+        self.stdout.write(f'\n{total} users, {len(terms)} queries, page size {limit}')
+        self.stdout.write(f'{"strategy":<12}{"mean":>10}{"p50":>10}{"p95":>10}{"p99":>10}  (ms)')
+        for name, timings in results.items():
+            self.stdout.write(
+                f'{name:<12}{statistics.fmean(timings):>10.2f}'
+                f'{self._percentile(timings, 50):>10.2f}'
+                f'{self._percentile(timings, 95):>10.2f}'
+                f'{self._percentile(timings, 99):>10.2f}'
+            )
+
+    def _seed(self, rng, existing, target, batch_size):
+        missing = target - existing
+        if missing <= 0:
+            return
+        self.stdout.write(f'Seeding {missing} synthetic users...')
+        specializations = ['Cardiology', 'Pediatrics', 'Dermatology', 'Neurology', 'Oncology']
+        created = 0
+        while created < missing:
+            batch = []
+            for offset in range(min(batch_size, missing - created)):
+                index = existing + created + offset
+                first = rng.choice(FIRST_NAMES)
+                last = rng.choice(LAST_NAMES)
+                is_doctor = index % 50 == 0
+                username = f'{PREFIX}{index:07d}_{first}{last}'
+                batch.append(User(
+                    username=username,
+                    email=f'{username}@bench.example',
+                    first_name=first.title(),
+                    last_name=last.title(),
+                    password='!',
+                    role=User.Role.DOCTOR if is_doctor else User.Role.PATIENT,
+                    specialization=rng.choice(specializations) if is_doctor else None,
+                ))
+            User.objects.bulk_create(batch, batch_size=batch_size)
+            created += len(batch)
+            self.stdout.write(f'  {existing + created}/{target}')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE users')
+
+    def _terms(self, rng, count):
+        terms = []
+        for _ in range(count):
+            term = rng.choice([rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+                               f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'])
+            if rng.random() < 0.5 and len(term) > 4:
+                # Simulate a typo by swapping two adjacent characters
+                i = rng.randrange(1, len(term) - 2)
+                term = term[:i] + term[i + 1] + term[i] + term[i + 2:]
+            terms.append(term)
+        return terms
+
+    def _legacy_search(self, term):
+        query = Q()
+        for field in SEARCH_FIELDS:
+            query |= Q(**{f'{field}__icontains': term})
+        return User.objects.filter(query).order_by('-date_joined')
+
+    def _time(self, terms, run):
+        timings = []
+        for term in terms:
+            start = time.perf_counter()
+            run(term)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    @staticmethod
+    def _percentile(values, percentile):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, round(percentile / 100 * (len(ordered) - 1)))
+        return ordered[index]
@@ -0,0 +1,96 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import partitioning
+
+
+class Command(BaseCommand):
+    """Maintain the monthly partitions of appointments"""
+
+    help = ('ensure: create partitions for the coming months (run daily); '
+            'archive: move partitions older than the retention window to the archive schema; '
+            'rehydrate: attach an archived month again; list: show attached and archived partitions')
+
+    def add_arguments(self, parser):
+        parser.add_argument('operation', choices=['ensure', 'archive', 'rehydrate', 'list'])
+        parser.add_argument('--table', choices=sorted(partitioning.PARTITIONED_TABLES),
+                            help='Limit to one table (required for rehydrate)')
+        parser.add_argument('--ahead', type=int, default=3, help='Months to create in advance')
+        parser.add_argument('--retention-months', type=int, default=24,
+                            help='Months kept attached, counting the current one')
+        parser.add_argument('--month', help='Month to rehydrate, YYYY-MM')
+        parser.add_argument('--dry-run', action='store_true', help='Report without changing anything')
+
+    def handle(self, *args, **options):
+        if not partitioning.is_postgresql():
+            raise CommandError('Partitioning requires PostgreSQL')
+        tables = partitioning.PARTITIONED_TABLES
+        if options['table']:
+            tables = {options['table']: tables[options['table']]}
+        with connection.cursor() as cursor:
+            for table, column in tables.items():
+                if not partitioning.is_partitioned(cursor, table):
+                    raise CommandError(f'{table} is not partitioned; run migrate first')
+            getattr(self, options['operation'])(cursor, tables, options)
+
+    def ensure(self, cursor, tables, options):
+        current = partitioning.month_start(datetime.date.today())
+        last = partitioning.add_months(current, options['ahead'])
+        for table, column in tables.items():
+            for month in partitioning.months(current, last):
+                name = partitioning.partition_name(table, month)
+                if options['dry_run']:
+                    self.stdout.write(f'Would ensure {name}')
+                elif partitioning.create_partition(cursor, table, column, month):
+                    self.stdout.write(f'Created {name}')
+
+    def archive(self, cursor, tables, options):
+        if options['retention_months'] < 1:
+            raise CommandError('--retention-months must be positive')
+        for table in tables:
+            referenced_by = partitioning.referencing_models(table)
+            if referenced_by:
+                raise CommandError(
+                    f'{table} is referenced by {", ".join(referenced_by)}; archiving would orphan their rows'
+                )
+        cutoff = partitioning.add_months(
+            partitioning.month_start(datetime.date.today()), 1 - options['retention_months']
+        )
+        for table in tables:
+            for name, month in partitioning.partitions(cursor, table):
+                if month >= cutoff:
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(f'Would archive {name}')
+                    continue
+                partitioning.archive_partition(cursor, table, name)
+                self.stdout.write(self.style.SUCCESS(f'Archived {name} to {partitioning.ARCHIVE_SCHEMA}.{name}'))
+
+    def rehydrate(self, cursor, tables, options):
+        if not options['table'] or not options['month']:
+            raise CommandError('rehydrate needs --table and --month')
+        try:
+            month = datetime.datetime.strptime(options['month'], '%Y-%m').date()
+        except ValueError:
+            raise CommandError('--month must be YYYY-MM')
+        table, column = next(iter(tables.items()))
+        name = partitioning.partition_name(table, month)
+        if name not in dict(partitioning.archived_partitions(cursor, table)):
+            raise CommandError(f'{partitioning.ARCHIVE_SCHEMA}.{name} does not exist')
+        if options['dry_run']:
+            self.stdout.write(f'Would attach {name}')
+            return
+        partitioning.rehydrate_partition(cursor, table, column, name, month)
+        self.stdout.write(self.style.SUCCESS(f'Attached {name}'))
+
+    def list(self, cursor, tables, options):
+        for table in tables:
+            attached = [name for name, month in partitioning.partitions(cursor, table)]
+            archived = [name for name, month in partitioning.archived_partitions(cursor, table)]
+            self.stdout.write(f'{table}: {len(attached)} attached, {len(archived)} archived')
+            for name in attached:
+                self.stdout.write(f'  {name}')
+            for name in archived:
+                self.stdout.write(f'  {partitioning.ARCHIVE_SCHEMA}.{name}')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.models import NotificationCounter
+
+
+class Command(BaseCommand):
+    """Recompute the per-user unread notification counters"""
+
+    help = ('Reset NotificationCounter rows from the unread notifications, e.g. after notifications '
+            'were edited outside the API')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only rebuild this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        NotificationCounter.recount(options['users'])
+        counters = NotificationCounter.objects.all()
+        if options['users']:
+            counters = counters.filter(user_id__in=options['users'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt unread counters for {counters.count()} users'))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.routing import monitor
+
+
+class Command(BaseCommand):
+    """Report read replica lag"""
+
+    help = ('Measure replication lag of every DATABASE_REPLICAS alias and show whether it is '
+            'in rotation (lag <= DATABASE_REPLICA_MAX_LAG)')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            self.stdout.write('No read replicas configured (POSTGRES_REPLICAS)')
+            return
+        for alias, lag in monitor.refresh().items():
+            if lag is None:
+                state = self.style.ERROR('unreachable')
+            elif lag <= settings.DATABASE_REPLICA_MAX_LAG:
+                state = self.style.SUCCESS(f'lag {lag:.2f}s, in rotation')
+            else:
+                state = self.style.WARNING(f'lag {lag:.2f}s, out of rotation')
+            self.stdout.write(f'{alias:<12} {settings.DATABASES[alias]["HOST"]}: {state}')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core import cache
+
+
+class Command(BaseCommand):
+    """Report response cache hit ratios"""
+
+    help = ('Show hit/miss counters of the versioned response caches. Counters live in the '
+            'cache itself, so they are shared across processes with the file and Redis '
+            'backends only.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after reporting')
+
+    def handle(self, *args, **options):
+        for namespace, stats in cache.stats().items():
+            ratio = 'n/a' if stats['hit_ratio'] is None else f"{stats['hit_ratio']:.1%}"
+            self.stdout.write(
+                f"{namespace:<20} hits={stats['hits']:<8} misses={stats['misses']:<8} hit ratio={ratio}"
+            )
+            if options['reset']:
+                cache._registry[namespace].reset_stats()
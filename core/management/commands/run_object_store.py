@@ -0,0 +1,43 @@
+import os
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, make_server
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.localstore import LocalObjectStore
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class Command(BaseCommand):
+    """Run the local S3-compatible stand-in"""
+
+    help = ('Serve a filesystem-backed, signature-verifying S3 stand-in for development and tests. '
+            'Point ATTACHMENT_S3_ENDPOINT at it; objects are stored under --root/<bucket>/.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=9000)
+        parser.add_argument('--root', default=settings.OBJECT_STORE_ROOT,
+                            help='Directory holding the buckets (default OBJECT_STORE_ROOT)')
+
+    def handle(self, *args, **options):
+        bucket = settings.ATTACHMENT_S3_BUCKET or 'attachments'
+        os.makedirs(os.path.join(options['root'], bucket), exist_ok=True)
+        app = LocalObjectStore(
+            options['root'],
+            {settings.ATTACHMENT_S3_ACCESS_KEY: settings.ATTACHMENT_S3_SECRET_KEY},
+            region=settings.ATTACHMENT_S3_REGION,
+        )
+        server = make_server(options['host'], options['port'], app, server_class=ThreadingWSGIServer)
+        self.stdout.write(f"Object store on http://{options['host']}:{options['port']}/{bucket}/ "
+                          f"(access key {settings.ATTACHMENT_S3_ACCESS_KEY})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
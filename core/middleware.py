@@ -1,6 +1,9 @@
 from django.utils.deprecation import MiddlewareMixin
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.contrib.auth import get_user_model
+from rest_framework.permissions import SAFE_METHODS
+
+from . import routing
 
 User = get_user_model()
 
@@ -12,4 +15,23 @@ class JWTAuthenticationMiddleware(MiddlewareMixin):
             if user_auth_tuple is not None:
                 request.user, _ = user_auth_tuple
         except Exception:
-            pass 
\ No newline at end of file
+            pass 
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    """Choose the database for this request's reads (see core/routing.py)"""
+
+    def process_request(self, request):
+        alias = routing.PRIMARY
+        if request.method in SAFE_METHODS and not routing.is_pinned(request):
+            alias = routing.choose_replica()
+        request.db_read_alias = alias
+        request._db_read_token = routing.set_read_alias(alias)
+
+    def process_response(self, request, response):
+        token = getattr(request, '_db_read_token', None)
+        if token is not None:
+            routing.reset_read_alias(token)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            routing.pin(request, response)
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_user_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctorappointment',
+            index=models.Index(fields=['patient', '-created_at'], name='appt_patient_created_idx'),
+        ),
+    ]
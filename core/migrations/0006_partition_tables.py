@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:32
+
+from django.db import migrations
+
+from core.partitioning import convert_to_partitioned, convert_to_plain
+
+
+def partition_appointments(apps, schema_editor):
+    # No-op outside PostgreSQL
+    convert_to_partitioned(schema_editor, 'doctor_appointments', 'appointment_date')
+
+
+def unpartition_appointments(apps, schema_editor):
+    # Archived months are moved back into the table
+    convert_to_plain(schema_editor, 'doctor_appointments')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_appointments, unpartition_appointments),
+    ]
@@ -1,5 +1,10 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from collections import Counter
 from datetime import date, time, datetime
 from django.core.exceptions import ValidationError
 
@@ -69,6 +74,14 @@ class User(AbstractUser):
         db_table = 'users'
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            # Trigram indexes backing the fuzzy user lookup (see core/search.py)
+            GinIndex(fields=['username'], name='users_username_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['email'], name='users_email_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['first_name'], name='users_first_name_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['last_name'], name='users_last_name_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['specialization'], name='users_specialization_trgm', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return f"{self.username} ({self.role})"
@@ -206,28 +219,128 @@ class Notification(models.Model):
         verbose_name = 'Notification'
         verbose_name_plural = 'Notifications'
         ordering = ['-created_at']
+        indexes = [
+            # The inbox: keyset pages of one recipient's notifications, newest first
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notifications_inbox_idx'),
+        ]
 
     def __str__(self):
         return f"{self.notification_type} - {self.recipient.username}"
 
     def mark_as_read(self):
-        self.is_read = True
-        self.save(update_fields=['is_read', 'updated_at'])
+        if not self.is_read:
+            Notification.mark_read(self.recipient_id, [self.pk])
+            self.is_read = True
 
     @classmethod
-    def create_patient_assigned_notification(cls, doctor, patient):
-        """Create notification when a new patient is assigned to a doctor"""
-        return cls.objects.create(
-            recipient=doctor,
+    def mark_read(cls, recipient_id, ids=None):
+        """
+        Mark ``recipient_id``'s unread notifications (only ``ids``, if given)
+        read in one UPDATE and lower the unread counter by the rows changed.
+        Returns that number.
+        """
+        unread = cls.objects.filter(recipient_id=recipient_id, is_read=False)
+        if ids is not None:
+            unread = unread.filter(pk__in=ids)
+        with transaction.atomic():
+            changed = unread.update(is_read=True, updated_at=timezone.now())
+            if changed:
+                NotificationCounter.objects.filter(user_id=recipient_id).update(
+                    unread=Greatest(F('unread') - changed, 0)
+                )
+        return changed
+
+    @classmethod
+    def save_unread(cls, notifications):
+        """Insert unsaved notifications and raise their recipients' unread counters, atomically."""
+        with transaction.atomic():
+            cls.objects.bulk_create(notifications, batch_size=len(notifications))
+            NotificationCounter.add(Counter(notification.recipient_id for notification in notifications))
+
+    @classmethod
+    def patient_assigned(cls, doctor, patient):
+        """Unsaved notification telling ``doctor`` about a newly assigned ``patient``"""
+        return cls(
+            recipient_id=doctor.pk,
             notification_type=cls.NotificationType.PATIENT_ASSIGNED,
             title="New Patient Assignment",
             message=f"You have been assigned a new patient: {patient.get_full_name() or patient.username}"
         )
 
+    @classmethod
+    def annotation_added(cls, doctor, record):
+        """Unsaved notification telling ``record``'s patient that ``doctor`` annotated it"""
+        return cls(
+            recipient_id=record.patient_id,
+            notification_type=cls.NotificationType.ANNOTATION_ADDED,
+            title="New Annotation",
+            message=f"Dr. {doctor.get_full_name() or doctor.username} added an annotation to {record.title}",
+            related_record_id=record.pk
+        )
+
+    @classmethod
+    def create_patient_assigned_notification(cls, doctor, patient):
+        """Create notification when a new patient is assigned to a doctor"""
+        notification = cls.patient_assigned(doctor, patient)
+        cls.save_unread([notification])
+        return notification
+
     @classmethod
     def create_annotation_notification(cls, doctor, patient, record):
         """Create notification when a doctor adds an annotation to a patient's record"""
-        return cls.objects
+        notification = cls.annotation_added(doctor, record)
+        notification.recipient_id = patient.pk
+        cls.save_unread([notification])
+        return notification
+
+
+class NotificationCounter(models.Model):
+    """
+    A user's unread notification count, kept by ``Notification.save_unread``
+    and ``mark_read`` so polling it never counts rows.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notification_counter'
+    )
+    unread = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'notification_counters'
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
+
+    @classmethod
+    def unread_for(cls, user_id):
+        return cls.objects.filter(user_id=user_id).values_list('unread', flat=True).first() or 0
+
+    @classmethod
+    def add(cls, counts):
+        """Raise the counters of ``{user id: new unread notifications}`` in one UPDATE."""
+        counts = {user_id: count for user_id, count in counts.items() if count}
+        if not counts:
+            return
+        cls.objects.bulk_create([cls(user_id=user_id) for user_id in counts], ignore_conflicts=True)
+        cls.objects.filter(user_id__in=counts).update(unread=F('unread') + Case(
+            *[When(user_id=user_id, then=Value(count)) for user_id, count in counts.items()],
+            default=Value(0),
+        ))
+
+    @classmethod
+    def recount(cls, user_ids=None):
+        """Reset counters from the notifications themselves (repairs drift from manual edits)."""
+        counters = cls.objects.all()
+        unread = Notification.objects.filter(is_read=False)
+        if user_ids is not None:
+            counters = counters.filter(user_id__in=user_ids)
+            unread = unread.filter(recipient_id__in=user_ids)
+        totals = unread.order_by().values_list('recipient_id').annotate(total=Count('id'))
+        with transaction.atomic():
+            counters.delete()
+            cls.objects.bulk_create([cls(user_id=user_id, unread=total) for user_id, total in totals])
 
 class DoctorAppointment(models.Model):
     doctor = models.ForeignKey(
@@ -259,6 +372,9 @@ class DoctorAppointment(models.Model):
         verbose_name = 'Doctor Appointment'
         verbose_name_plural = 'Doctor Appointments'
         ordering = ['-appointment_date', 'start_time']
+        indexes = [
+            models.Index(fields=['patient', '-created_at'], name='appt_patient_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.doctor.username} - {self.patient.username} ({self.appointment_date})"
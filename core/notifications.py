@@ -0,0 +1,109 @@
+"""
+Batched fan-out of in-app notifications.
+
+``queue()`` takes unsaved ``Notification`` instances (see
+``Notification.patient_assigned``/``annotation_added``) and, once the
+surrounding transaction commits, appends them as plain tuples to a
+process-wide ``BufferedWriter``. Its background thread writes each batch with
+one ``SELECT`` and one ``bulk_create``, raising the recipients' unread
+counters (``NotificationCounter``) in the same transaction. Identical
+notifications in the batch collapse into one, and those matching an unread
+notification already stored are dropped. A doctor annotating hundreds of records therefore never waits on
+notification inserts, and a notification is only sent for work that was
+committed. ``created_at`` is the insert time, at most a flush interval late.
+Jobs call ``flush()`` before they exit. Inserted notifications are pushed to
+their recipients' open event streams (``core/push.py``).
+"""
+import atexit
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from core import push
+from core.buffering import BufferedWriter
+from .models import Notification
+from .serializers import NotificationSerializer
+
+FIELDS = ('recipient_id', 'notification_type', 'title', 'message', 'related_record_id')
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def write_notifications(items):
+    """Insert a batch of notification tuples, skipping duplicates and already pending ones."""
+    batch = dict.fromkeys(tuple(item) for item in items)
+    pending = set(
+        Notification.objects
+        .filter(
+            is_read=False,
+            recipient_id__in={item[0] for item in batch},
+            notification_type__in={item[1] for item in batch},
+            title__in={item[2] for item in batch},
+        )
+        .order_by()
+        .values_list(*FIELDS)
+    )
+    notifications = [Notification(**dict(zip(FIELDS, item))) for item in batch if item not in pending]
+    if notifications:
+        Notification.save_unread(notifications)
+        push.publish(
+            ([notification.recipient_id], 'notification', data)
+            for notification, data in zip(notifications, NotificationSerializer(notifications, many=True).data)
+        )
+
+
+def _encode(item):
+    return dict(zip(FIELDS, item))
+
+
+def _decode(data):
+    return tuple(data.get(field) for field in FIELDS)
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = BufferedWriter(
+                    write_notifications,
+                    batch_size=settings.NOTIFICATION_BATCH_SIZE,
+                    interval=settings.NOTIFICATION_FLUSH_INTERVAL_MS / 1000,
+                    spool_path=settings.NOTIFICATION_SPOOL_PATH,
+                    encode=_encode,
+                    decode=_decode,
+                    background=settings.NOTIFICATION_BACKGROUND_FLUSH,
+                    name='notification-writer',
+                )
+                atexit.register(_buffer.flush)
+    return _buffer
+
+
+@receiver(setting_changed)
+def reset_buffer(setting, **kwargs):
+    # Only tests change settings; writing their leftovers would leak them into the next test
+    global _buffer
+    if setting.startswith('NOTIFICATION_') and _buffer is not None:
+        _buffer.discard()
+        _buffer = None
+
+
+def queue(*notifications):
+    """Send unsaved ``Notification`` instances after the current transaction commits."""
+    items = [tuple(getattr(notification, field) for field in FIELDS) for notification in notifications]
+
+    def add():
+        buffer = get_buffer()
+        for item in items:
+            buffer.add(item)
+
+    transaction.on_commit(add)
+
+
+def flush():
+    """Write every queued notification now (tests, shutdown, management commands)."""
+    get_buffer().flush()
@@ -0,0 +1,246 @@
+"""
+S3-compatible object storage.
+
+``S3Storage`` is a Django storage backend for a bucket on any S3-compatible
+service (AWS S3, MinIO, Ceph, or the stand-in in ``core/localstore.py``). It
+talks path-style HTTP with ``http.client`` and signs requests with AWS
+Signature Version 4, so it needs no SDK. Besides the usual storage methods it
+issues presigned URLs: ``url()`` for downloads (with the attachment's own
+file name and type) and ``presigned_put()`` for uploads whose size and
+SHA-256 are part of the signature, so the bucket rejects any other bytes,
+and ``copy()`` for server-side copies between object names. Clients then move the bytes to and from the bucket without passing through
+application workers.
+"""
+import base64
+import hashlib
+import hmac
+import http.client
+import mimetypes
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+
+from django.core.files.base import File
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.http import content_disposition_header
+
+ALGORITHM = 'AWS4-HMAC-SHA256'
+UNSIGNED_PAYLOAD = 'UNSIGNED-PAYLOAD'
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+MAX_EXPIRY = 7 * 24 * 3600
+
+
+class ObjectStoreError(Exception):
+    """The object store answered with an unexpected status."""
+
+    def __init__(self, status, message):
+        super().__init__(f'{status}: {message}')
+        self.status = status
+
+
+def uri_encode(value, safe='-_.~'):
+    return quote(value, safe=safe)
+
+
+def canonical_query(params):
+    return '&'.join(f'{uri_encode(key)}={uri_encode(value)}' for key, value in sorted(params))
+
+
+def signing_key(secret_key, scope):
+    date, region, service, terminator = scope.split('/')
+    key = f'AWS4{secret_key}'.encode()
+    for part in (date, region, service, terminator):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    return key
+
+
+def signature(secret_key, scope, amz_date, method, path, query, headers, payload_hash):
+    """
+    SigV4 signature of a request. ``headers`` maps the lower-case names of the
+    signed headers to their values; ``query`` excludes ``X-Amz-Signature``.
+    """
+    names = sorted(headers)
+    canonical_request = '\n'.join([
+        method,
+        uri_encode(path, safe='/-_.~'),
+        canonical_query(query),
+        ''.join(f"{name}:{' '.join(str(headers[name]).split())}\n" for name in names),
+        ';'.join(names),
+        payload_hash,
+    ])
+    string_to_sign = '\n'.join([
+        ALGORITHM, amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+    ])
+    return hmac.new(signing_key(secret_key, scope), string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+
+def checksum_header(sha256):
+    """``x-amz-checksum-sha256`` value (base64 digest) for a hex SHA-256."""
+    return base64.b64encode(bytes.fromhex(sha256)).decode()
+
+
+class ObjectFile(File):
+    """A streamed ``GET`` response; closing it closes the connection."""
+
+    def __init__(self, response, connection, name):
+        super().__init__(response, name=name)
+        self.connection = connection
+        self._size = int(response.headers.get('Content-Length', 0))
+
+    def close(self):
+        super().close()
+        self.connection.close()
+
+
+@deconstructible(path='core.objectstore.S3Storage')
+class S3Storage(Storage):
+    """
+    Files stored as objects in ``bucket`` at ``endpoint_url``. Presigned URLs
+    use ``public_endpoint_url`` when clients reach the store under another
+    host name than the application does.
+    """
+    presigned_urls = True
+
+    def __init__(self, endpoint_url, bucket, access_key, secret_key, region='us-east-1',
+                 public_endpoint_url=None, url_expiry=300, timeout=60, block_size=64 * 1024):
+        self.endpoint_url = endpoint_url.rstrip('/')
+        self.public_endpoint_url = (public_endpoint_url or endpoint_url).rstrip('/')
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.url_expiry = url_expiry
+        self.timeout = timeout
+        self.block_size = block_size
+
+    def _scope(self, now):
+        return f"{now.strftime('%Y%m%d')}/{self.region}/s3/aws4_request"
+
+    def _path(self, name):
+        return f'/{self.bucket}/{name}'
+
+    def _request(self, method, name, body=None, headers=None):
+        endpoint = urlsplit(self.endpoint_url)
+        connection_class = http.client.HTTPSConnection if endpoint.scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(endpoint.netloc, timeout=self.timeout, blocksize=self.block_size)
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        scope = self._scope(now)
+        signed = {header.lower(): value for header, value in (headers or {}).items()}
+        # Bodies are streamed, not hashed up front; TLS (and checksums) protect them
+        signed.update({
+            'host': endpoint.netloc,
+            'x-amz-date': amz_date,
+            'x-amz-content-sha256': UNSIGNED_PAYLOAD if body is not None else EMPTY_SHA256,
+        })
+        path = self._path(name)
+        request_signature = signature(
+            self.secret_key, scope, amz_date, method, path, [], signed, signed['x-amz-content-sha256']
+        )
+        signed['authorization'] = (
+            f"{ALGORITHM} Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={';'.join(sorted(signed))}, Signature={request_signature}"
+        )
+        try:
+            connection.request(method, uri_encode(path, safe='/-_.~'), body=body, headers=signed)
+            return connection, connection.getresponse()
+        except Exception:
+            connection.close()
+            raise
+
+    def _call(self, method, name, body=None, headers=None, expected=(200, 204)):
+        connection, response = self._request(method, name, body, headers)
+        try:
+            detail = response.read()
+            if response.status == 404:
+                raise FileNotFoundError(name)
+            if response.status not in expected:
+                raise ObjectStoreError(response.status, detail.decode(errors='replace')[:500])
+            return response
+        finally:
+            connection.close()
+
+    def _save(self, name, content):
+        content.seek(0)
+        headers = {'Content-Length': str(content.size)}
+        content_type = getattr(content, 'content_type', None) or mimetypes.guess_type(name)[0]
+        if content_type:
+            headers['Content-Type'] = content_type
+        self._call('PUT', name, body=content.file if hasattr(content, 'file') else content, headers=headers)
+        return name
+
+    def _open(self, name, mode='rb'):
+        connection, response = self._request('GET', name)
+        if response.status != 200:
+            detail = response.read()
+            connection.close()
+            if response.status == 404:
+                raise FileNotFoundError(name)
+            raise ObjectStoreError(response.status, detail.decode(errors='replace')[:500])
+        return ObjectFile(response, connection, name)
+
+    def get_available_name(self, name, max_length=None):
+        # Objects are replaced in place; attachment names are content addresses
+        return name
+
+    def exists(self, name):
+        try:
+            self._call('HEAD', name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def size(self, name):
+        return int(self._call('HEAD', name).headers['Content-Length'])
+
+    def delete(self, name):
+        try:
+            self._call('DELETE', name)
+        except FileNotFoundError:
+            pass
+
+    def copy(self, source, name):
+        """Copy the object ``source`` to ``name`` inside the store; the bytes never leave it."""
+        self._call('PUT', name, headers={'x-amz-copy-source': uri_encode(self._path(source), safe='/-_.~')})
+        return name
+
+    def presign(self, method, name, headers=None, params=(), expire=None):
+        """A URL that performs ``method`` on ``name`` without credentials until it expires."""
+        endpoint = urlsplit(self.public_endpoint_url)
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        scope = self._scope(now)
+        signed = {header.lower(): str(value) for header, value in (headers or {}).items()}
+        signed['host'] = endpoint.netloc
+        query = [
+            ('X-Amz-Algorithm', ALGORITHM),
+            ('X-Amz-Credential', f'{self.access_key}/{scope}'),
+            ('X-Amz-Date', amz_date),
+            ('X-Amz-Expires', str(min(expire or self.url_expiry, MAX_EXPIRY))),
+            ('X-Amz-SignedHeaders', ';'.join(sorted(signed))),
+            *params,
+        ]
+        path = endpoint.path + self._path(name)
+        query.append(('X-Amz-Signature', signature(
+            self.secret_key, scope, amz_date, method, path, query, signed, UNSIGNED_PAYLOAD
+        )))
+        return f'{endpoint.scheme}://{endpoint.netloc}{uri_encode(path, safe="/-_.~")}?{canonical_query(query)}'
+
+    def url(self, name, filename=None, as_attachment=True, content_type=None, expire=None):
+        """Presigned ``GET`` URL; the response carries ``filename`` and ``content_type``."""
+        params = []
+        if filename:
+            params.append(('response-content-disposition', content_disposition_header(as_attachment, filename)))
+            content_type = content_type or mimetypes.guess_type(filename)[0]
+        if content_type:
+            params.append(('response-content-type', content_type))
+        return self.presign('GET', name, params=params, expire=expire)
+
+    def presigned_put(self, name, size, sha256, expire=None):
+        """
+        Presigned ``PUT`` URL for exactly ``size`` bytes hashing to ``sha256``.
+        Returns ``(url, headers)``; the client must send ``headers`` as given.
+        """
+        headers = {'x-amz-checksum-sha256': checksum_header(sha256)}
+        url = self.presign('PUT', name, headers={**headers, 'content-length': size}, expire=expire)
+        return url, headers
@@ -0,0 +1,359 @@
+"""
+Monthly range partitioning of large append-mostly tables (PostgreSQL only).
+
+``convert_to_partitioned()`` is run from migrations. It rebuilds a table as
+``PARTITION BY RANGE (column)`` with one partition per month plus a DEFAULT
+partition, copying rows, indexes, check and foreign key constraints. Two
+PostgreSQL rules shape the result:
+
+* the primary key becomes ``(id, column)``; ids still come from one sequence;
+* unique columns without the partition key keep global uniqueness through a
+  one-column guard table kept in sync by a trigger, and foreign keys *into* a
+  partitioned table are not possible.
+
+Only tables whose hot queries filter on the partition column are worth it:
+anything else (lookups by id, lists by owner) probes every partition. Of our
+tables that is ``doctor_appointments``, whose availability and overlap
+queries select a date range. Archiving a partition removes its rows, so only
+tables no other model refers to are partitioned. ``convert_to_plain()`` undoes
+a conversion, archived months included.
+
+``manage.py manage_partitions`` creates upcoming partitions, moves partitions
+older than a retention window to the ``archive`` schema (detached and
+recompressed) and attaches them again on demand.
+"""
+import datetime
+
+from django.apps import apps
+from django.db import connection, transaction
+
+ARCHIVE_SCHEMA = 'archive'
+# Set (transaction-locally) while rows move between partitions of one table;
+# unique guard triggers skip those rows, whose values are already registered
+MOVING_ROWS_SETTING = 'healthrecords.moving_rows'
+
+# Table -> partition column
+PARTITIONED_TABLES = {
+    'doctor_appointments': 'appointment_date',
+}
+
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def months(first, last):
+    """Every month start from ``first`` to ``last`` inclusive."""
+    month = month_start(first)
+    while month <= month_start(last):
+        yield month
+        month = add_months(month, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def parse_partition_month(table, name):
+    """Return the month of a partition created by ``create_partition``, else ``None``."""
+    suffix = name[len(table) + 2:] if name.startswith(f'{table}_p') else ''
+    try:
+        return datetime.datetime.strptime(suffix, '%Y%m').date()
+    except ValueError:
+        return None
+
+
+def _q(name):
+    return connection.ops.quote_name(name)
+
+
+def _bounds(month):
+    # Literals work for both date and timestamptz columns; the connection runs in UTC
+    return f"'{month:%Y-%m-%d}'", f"'{add_months(month, 1):%Y-%m-%d}'"
+
+
+def is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned(cursor, table):
+    cursor.execute(
+        'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+        'WHERE c.relname = %s AND c.relnamespace = current_schema()::regnamespace',
+        [table]
+    )
+    return cursor.fetchone() is not None
+
+
+def partitions(cursor, table):
+    """``[(name, month)]`` of the monthly partitions currently attached to ``table``."""
+    cursor.execute(
+        'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = %s::regclass ORDER BY c.relname',
+        [table]
+    )
+    names = [row[0] for row in cursor.fetchall()]
+    return [(name, parse_partition_month(table, name)) for name in names
+            if parse_partition_month(table, name) is not None]
+
+
+def archived_partitions(cursor, table):
+    cursor.execute(
+        'SELECT tablename FROM pg_tables WHERE schemaname = %s AND tablename LIKE %s ORDER BY tablename',
+        [ARCHIVE_SCHEMA, f'{table}\\_p%']
+    )
+    names = [row[0] for row in cursor.fetchall()]
+    return [(name, parse_partition_month(table, name)) for name in names
+            if parse_partition_month(table, name) is not None]
+
+
+def create_partition(cursor, table, column, month):
+    """
+    Create the partition for ``month`` unless it exists. Rows that already
+    landed in the DEFAULT partition for that month are moved into it, with
+    unique guard triggers suspended for the move.
+    """
+    name = partition_name(table, month)
+    cursor.execute('SELECT to_regclass(%s)', [name])
+    if cursor.fetchone()[0] is not None:
+        return False
+
+    lower, upper = _bounds(month)
+    default = f'{table}_default'
+    in_range = f'{_q(column)} >= {lower} AND {_q(column)} < {upper}'
+    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {_q(default)} WHERE {in_range})')
+    if not cursor.fetchone()[0]:
+        cursor.execute(
+            f'CREATE TABLE {_q(name)} PARTITION OF {_q(table)} FOR VALUES FROM ({lower}) TO ({upper})'
+        )
+        return True
+
+    with transaction.atomic():
+        cursor.execute(f"SET LOCAL {MOVING_ROWS_SETTING} = 'on'")
+        cursor.execute(f'ALTER TABLE {_q(table)} DETACH PARTITION {_q(default)}')
+        cursor.execute(
+            f'CREATE TABLE {_q(name)} PARTITION OF {_q(table)} FOR VALUES FROM ({lower}) TO ({upper})'
+        )
+        cursor.execute(f'INSERT INTO {_q(table)} SELECT * FROM {_q(default)} WHERE {in_range}')
+        cursor.execute(f'DELETE FROM {_q(default)} WHERE {in_range}')
+        cursor.execute(f'ALTER TABLE {_q(table)} ATTACH PARTITION {_q(default)} DEFAULT')
+    return True
+
+
+def referencing_models(table):
+    """Models with a relation into ``table``, enforced by the database or not."""
+    return sorted({
+        relation.related_model._meta.label
+        for model in apps.get_models() if model._meta.db_table == table
+        for relation in model._meta.related_objects
+    })
+
+
+def _unique_guard(cursor, table, column, column_type):
+    guard = f'{table}_{column}_unique'
+    function = f'{guard}_sync'
+    cursor.execute(f'CREATE TABLE {_q(guard)} ({_q(column)} {column_type} PRIMARY KEY)')
+    cursor.execute(
+        f'INSERT INTO {_q(guard)} SELECT {_q(column)} FROM {_q(table)} WHERE {_q(column)} IS NOT NULL'
+    )
+    cursor.execute(f'''
+        CREATE FUNCTION {_q(function)}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF current_setting('{MOVING_ROWS_SETTING}', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.{_q(column)} IS NOT NULL THEN
+                DELETE FROM {_q(guard)} WHERE {_q(column)} = OLD.{_q(column)};
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.{_q(column)} IS NOT NULL THEN
+                INSERT INTO {_q(guard)} VALUES (NEW.{_q(column)});
+            END IF;
+            RETURN NULL;
+        END $$
+    ''')
+    cursor.execute(
+        f'CREATE TRIGGER {_q(function)} AFTER INSERT OR DELETE OR UPDATE OF {_q(column)} '
+        f'ON {_q(table)} FOR EACH ROW EXECUTE FUNCTION {_q(function)}()'
+    )
+
+
+def convert_to_partitioned(schema_editor, table, column, months_ahead=3):
+    """Rebuild ``table`` as a monthly range-partitioned table (migration helper)."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if is_partitioned(cursor, table):
+            return
+        cursor.execute(
+            'SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = %s',
+            [table, 'p']
+        )
+        primary_key = cursor.fetchone()[0]
+        cursor.execute(
+            'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+            'WHERE conrelid = %s::regclass AND contype = %s',
+            [table, 'f']
+        )
+        foreign_keys = cursor.fetchall()
+        # Secondary indexes, and which of them are single-column unique ones
+        cursor.execute('''
+            SELECT c.relname, pg_get_indexdef(i.indexrelid), i.indisunique,
+                   array_agg(a.attname ORDER BY a.attnum),
+                   (array_agg(format_type(a.atttypid, a.atttypmod) ORDER BY a.attnum))[1]
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = %s::regclass AND NOT i.indisprimary
+            GROUP BY c.relname, i.indexrelid, i.indisunique
+        ''', [table])
+        indexes = cursor.fetchall()
+        cursor.execute(f'SELECT min({_q(column)}) FROM {_q(table)}')
+        oldest = cursor.fetchone()[0] or datetime.date.today()
+
+        legacy = f'{table}_unpartitioned'
+        cursor.execute(f'ALTER TABLE {_q(table)} RENAME TO {_q(legacy)}')
+        cursor.execute(
+            f'CREATE TABLE {_q(table)} (LIKE {_q(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS '
+            f'INCLUDING STORAGE INCLUDING COMMENTS) PARTITION BY RANGE ({_q(column)})'
+        )
+        cursor.execute(
+            f'CREATE TABLE {_q(table + "_default")} PARTITION OF {_q(table)} DEFAULT'
+        )
+        for month in months(oldest, add_months(datetime.date.today(), months_ahead)):
+            create_partition(cursor, table, column, month)
+        cursor.execute(f'INSERT INTO {_q(table)} SELECT * FROM {_q(legacy)}')
+        # Drops the identity/serial sequence and foreign keys pointing at the old table
+        cursor.execute(f'DROP TABLE {_q(legacy)} CASCADE')
+
+        sequence = f'{table}_id_seq'
+        cursor.execute(f'CREATE SEQUENCE {_q(sequence)} OWNED BY {_q(table)}.id')
+        cursor.execute(f"SELECT setval(%s, coalesce((SELECT max(id) FROM {_q(table)}), 0) + 1, false)", [sequence])
+        cursor.execute(f"ALTER TABLE {_q(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        cursor.execute(f'ALTER TABLE {_q(table)} ADD CONSTRAINT {_q(primary_key)} PRIMARY KEY (id, {_q(column)})')
+
+        for name, definition, unique, columns, column_type in indexes:
+            if unique and column not in columns:
+                # Partitioned unique indexes must contain the partition key
+                definition = definition.replace('CREATE UNIQUE INDEX', 'CREATE INDEX', 1)
+                if len(columns) == 1:
+                    _unique_guard(cursor, table, columns[0], column_type)
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {_q(table)} ADD CONSTRAINT {_q(name)} {definition}')
+
+
+def convert_to_plain(schema_editor, table):
+    """Rebuild a partitioned ``table`` as a plain table, archived months included (migration helper)."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not is_partitioned(cursor, table):
+            return
+        archived = archived_partitions(cursor, table)
+        cursor.execute(
+            'SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = %s',
+            [table, 'p']
+        )
+        primary_key = cursor.fetchone()[0]
+        cursor.execute(
+            'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+            'WHERE conrelid = %s::regclass AND contype = %s',
+            [table, 'f']
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute('''
+            SELECT c.relname, pg_get_indexdef(i.indexrelid), array_agg(a.attname ORDER BY a.attnum)
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = %s::regclass AND NOT i.indisprimary
+            GROUP BY c.relname, i.indexrelid
+        ''', [table])
+        indexes = cursor.fetchall()
+        # Columns made unique through a guard table by _unique_guard()
+        cursor.execute(
+            'SELECT tgname FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal AND tgname LIKE %s',
+            [table, f'{table}\\_%\\_unique\\_sync']
+        )
+        guarded = [name[len(table) + 1:-len('_unique_sync')] for (name,) in cursor.fetchall()]
+
+        legacy = f'{table}_partitioned'
+        cursor.execute(f'ALTER TABLE {_q(table)} RENAME TO {_q(legacy)}')
+        cursor.execute(
+            f'CREATE TABLE {_q(table)} (LIKE {_q(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS '
+            f'INCLUDING STORAGE INCLUDING COMMENTS)'
+        )
+        cursor.execute(f'INSERT INTO {_q(table)} SELECT * FROM {_q(legacy)}')
+        for name, month in archived:
+            cursor.execute(f'INSERT INTO {_q(table)} SELECT * FROM {_q(ARCHIVE_SCHEMA)}.{_q(name)}')
+            cursor.execute(f'DROP TABLE {_q(ARCHIVE_SCHEMA)}.{_q(name)}')
+        # Drops the partitions, the id sequence and the guard triggers with the old table
+        cursor.execute(f'DROP TABLE {_q(legacy)} CASCADE')
+        for column in guarded:
+            guard = f'{table}_{column}_unique'
+            cursor.execute(f'DROP TABLE IF EXISTS {_q(guard)}')
+            cursor.execute(f'DROP FUNCTION IF EXISTS {_q(guard + "_sync")}()')
+
+        sequence = f'{table}_id_seq'
+        cursor.execute(f'CREATE SEQUENCE {_q(sequence)} OWNED BY {_q(table)}.id')
+        cursor.execute(f"SELECT setval(%s, coalesce((SELECT max(id) FROM {_q(table)}), 0) + 1, false)", [sequence])
+        cursor.execute(f"ALTER TABLE {_q(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        cursor.execute(f'ALTER TABLE {_q(table)} ADD CONSTRAINT {_q(primary_key)} PRIMARY KEY (id)')
+
+        for name, definition, columns in indexes:
+            if len(columns) == 1 and columns[0] in guarded and 'pattern_ops' not in definition:
+                # The unique constraint convert_to_partitioned() had to downgrade
+                cursor.execute(f'ALTER TABLE {_q(table)} ADD CONSTRAINT {_q(name)} UNIQUE ({_q(columns[0])})')
+            else:
+                cursor.execute(definition.replace(' ON ONLY ', ' ON ', 1))
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {_q(table)} ADD CONSTRAINT {_q(name)} {definition}')
+
+
+def archive_partition(cursor, table, name):
+    """
+    Detach a partition and copy it, recompressed, into the archive schema.
+    Its rows leave the table, so ``table`` must not be referenced by other
+    models (see ``referencing_models``).
+    """
+    archived = f'{_q(ARCHIVE_SCHEMA)}.{_q(name)}'
+    with transaction.atomic():
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {_q(ARCHIVE_SCHEMA)}')
+        cursor.execute(f'ALTER TABLE {_q(table)} DETACH PARTITION {_q(name)}')
+        # Values are only (re)compressed when written, so the rows are copied
+        # into a table that TOASTs anything in rows wider than 128 bytes
+        cursor.execute(
+            f'CREATE TABLE {archived} (LIKE {_q(name)} INCLUDING ALL) WITH (toast_tuple_target = 128)'
+        )
+        if connection.pg_version >= 140000:
+            cursor.execute(
+                "SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass AND attnum > 0 "
+                "AND NOT attisdropped AND attstorage IN ('x', 'm')",
+                [f'{ARCHIVE_SCHEMA}.{name}']
+            )
+            for (column,) in cursor.fetchall():
+                cursor.execute(f'ALTER TABLE {archived} ALTER COLUMN {_q(column)} SET COMPRESSION lz4')
+        cursor.execute(f'INSERT INTO {archived} SELECT * FROM {_q(name)}')
+        cursor.execute(f'DROP TABLE {_q(name)}')
+
+
+def rehydrate_partition(cursor, table, column, name, month):
+    """Attach an archived partition back to ``table``."""
+    lower, upper = _bounds(month)
+    check = f'{name}_bounds'
+    with transaction.atomic():
+        cursor.execute(f'ALTER TABLE {_q(ARCHIVE_SCHEMA)}.{_q(name)} SET SCHEMA public')
+        # A matching CHECK lets ATTACH skip its validation scan
+        cursor.execute(
+            f'ALTER TABLE {_q(name)} ADD CONSTRAINT {_q(check)} '
+            f'CHECK ({_q(column)} IS NOT NULL AND {_q(column)} >= {lower} AND {_q(column)} < {upper})'
+        )
+        cursor.execute(
+            f'ALTER TABLE {_q(table)} ATTACH PARTITION {_q(name)} FOR VALUES FROM ({lower}) TO ({upper})'
+        )
+        cursor.execute(f'ALTER TABLE {_q(name)} DROP CONSTRAINT {_q(check)}')
@@ -43,4 +43,19 @@ class IsPatient(permissions.BasePermission):
             user, _ = user_auth_tuple
             return user.role == 'PATIENT'
         except Exception:
-            return False 
\ No newline at end of file
+            return False 
+
+class IsStaffUser(permissions.BasePermission):
+    """
+    Allow front-desk staff (staff accounts, admins and superusers).
+    """
+    def has_permission(self, request, view):
+        jwt_authenticator = JWTAuthentication()
+        try:
+            user_auth_tuple = jwt_authenticator.authenticate(request)
+            if user_auth_tuple is None:
+                return False
+            user, _ = user_auth_tuple
+            return user.is_superuser or user.is_staff or user.role == 'ADMIN'
+        except Exception:
+            return False
@@ -0,0 +1,371 @@
+"""
+Server-sent events for notifications and appointment changes.
+
+``healthrecords/asgi.py`` routes ``PUSH_PATH`` (``/api/events/``) to
+``PushApplication``, a plain ASGI app that never enters Django's request
+handling. Each open stream is a small bounded queue in the worker's ``Hub``;
+an idle connection costs its socket and a few kilobytes, so one event loop
+holds thousands of them.
+
+``publish()`` runs after the surrounding transaction commits. On PostgreSQL it
+sends the event with ``pg_notify`` and every ASGI worker's listener (one
+``LISTEN`` connection per worker) hands it to the streams it holds for the
+recipients, so no broker is needed. Other databases deliver to the current
+process only. Events are hints: a client that falls behind, or whose worker
+lost its listener connection for a moment, receives ``resync`` and refetches
+its inbox.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD = 7900
+RESYNC = b'event: resync\ndata: {}\n\n'
+
+
+def encode_events(events):
+    """Pack ``(user_ids, event, data)`` triples into as few JSON payloads as fit under ``MAX_PAYLOAD``."""
+    payloads, batch, size = [], [], 2
+    for user_ids, event, data in events:
+        item = json.dumps([sorted(set(user_ids)), event, data], cls=DjangoJSONEncoder, separators=(',', ':'))
+        if len(item.encode()) + 2 > MAX_PAYLOAD:
+            # Too large to push; the recipients fetch it instead
+            item = json.dumps([sorted(set(user_ids)), 'resync', {}], separators=(',', ':'))
+        if batch and size + len(item.encode()) + 1 > MAX_PAYLOAD:
+            payloads.append(f'[{",".join(batch)}]')
+            batch, size = [], 2
+        batch.append(item)
+        size += len(item.encode()) + 1
+    if batch:
+        payloads.append(f'[{",".join(batch)}]')
+    return payloads
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'.encode()
+
+
+class Stream:
+    """One client connection's pending events."""
+
+    __slots__ = ('queue',)
+
+    def __init__(self, size):
+        self.queue = asyncio.Queue(size)
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # The client is not keeping up: drop what it missed and have it refetch
+            self._clear()
+            self.queue.put_nowait(RESYNC)
+
+    def close(self):
+        self._clear()
+        self.queue.put_nowait(None)
+
+    def _clear(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class Hub:
+    """The open streams of this worker, by user id."""
+
+    def __init__(self):
+        self.streams = defaultdict(set)
+        self.loop = None
+        self.listener = None
+
+    def subscribe(self, user_id):
+        self.loop = asyncio.get_running_loop()
+        if self.listener is None and connection.vendor == 'postgresql':
+            self.listener = self.loop.create_task(Listener(self).run())
+        stream = Stream(settings.PUSH_QUEUE_SIZE)
+        self.streams[user_id].add(stream)
+        return stream
+
+    def unsubscribe(self, user_id, stream):
+        streams = self.streams.get(user_id)
+        if streams is not None:
+            streams.discard(stream)
+            if not streams:
+                del self.streams[user_id]
+
+    def dispatch(self, payload):
+        """Hand a payload from ``encode_events`` to the recipients connected here; runs on the loop."""
+        for user_ids, event, data in json.loads(payload):
+            targets = [stream for user_id in user_ids for stream in self.streams.get(user_id, ())]
+            if targets:
+                message = RESYNC if event == 'resync' else format_event(event, data)
+                for stream in targets:
+                    stream.put(message)
+
+    def dispatch_threadsafe(self, payload):
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.dispatch(payload)
+        else:
+            loop.call_soon_threadsafe(self.dispatch, payload)
+
+    def broadcast(self, message):
+        for streams in self.streams.values():
+            for stream in streams:
+                stream.put(message)
+
+    def close(self):
+        for streams in self.streams.values():
+            for stream in streams:
+                stream.close()
+        if self.listener is not None:
+            self.listener.cancel()
+            self.listener = None
+
+
+hub = Hub()
+
+
+def _listen_params():
+    params = connection.settings_dict
+    options = {
+        key: value for key, value in params.get('OPTIONS', {}).items()
+        if key not in ('pool', 'server_side_binding', 'isolation_level', 'assume_role')
+    }
+    return {
+        'dbname': params['NAME'],
+        'user': params['USER'],
+        'password': params['PASSWORD'],
+        'host': params['HOST'],
+        'port': params['PORT'] or None,
+        'keepalives': 1,
+        'keepalives_idle': 30,
+        'connect_timeout': 10,
+        **options,
+    }
+
+
+class Listener:
+    """Forward ``pg_notify`` payloads on ``PUSH_CHANNEL`` to the hub, reconnecting when the connection drops."""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.delay = 1
+        self.reconnecting = False
+
+    async def run(self):
+        while True:
+            try:
+                await self.listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                logger.warning('Push listener connection failed: %s', error)
+            await asyncio.sleep(self.delay)
+            self.delay = min(self.delay * 2, 30)
+
+    def connected(self):
+        if self.reconnecting:
+            # Events sent while the connection was down are lost
+            self.hub.broadcast(RESYNC)
+        self.reconnecting = True
+        self.delay = 1
+
+    async def listen(self):
+        if connection.Database.__name__ == 'psycopg':
+            await self._listen_psycopg()
+        else:
+            await self._listen_psycopg2()
+
+    async def _listen_psycopg(self):
+        import psycopg
+
+        async with await psycopg.AsyncConnection.connect(**_listen_params(), autocommit=True) as conn:
+            await conn.execute(f'LISTEN "{settings.PUSH_CHANNEL}"')
+            self.connected()
+            async for notify in conn.notifies():
+                self.hub.dispatch(notify.payload)
+
+    async def _listen_psycopg2(self):
+        import psycopg2
+
+        loop = asyncio.get_running_loop()
+        conn = await loop.run_in_executor(None, lambda: psycopg2.connect(**_listen_params()))
+        conn.autocommit = True
+        lost = loop.create_future()
+
+        def readable():
+            try:
+                conn.poll()
+            except psycopg2.Error as error:
+                if not lost.done():
+                    lost.set_exception(error)
+                return
+            while conn.notifies:
+                self.hub.dispatch(conn.notifies.pop(0).payload)
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{settings.PUSH_CHANNEL}"')
+            loop.add_reader(conn.fileno(), readable)
+            self.connected()
+            try:
+                await lost
+            finally:
+                loop.remove_reader(conn.fileno())
+        finally:
+            conn.close()
+
+
+def _send(events):
+    payloads = encode_events(events)
+    if connection.vendor == 'postgresql':
+        try:
+            with connection.cursor() as cursor:
+                for payload in payloads:
+                    cursor.execute('SELECT pg_notify(%s, %s)', [settings.PUSH_CHANNEL, payload])
+        except DatabaseError:
+            # The change itself is committed; clients catch up when they next refetch
+            logger.warning('Push notify failed; %d events not delivered', len(events), exc_info=True)
+    else:
+        for payload in payloads:
+            hub.dispatch_threadsafe(payload)
+
+
+def publish(events):
+    """Push ``(user_ids, event, data)`` triples to the recipients' open streams once the transaction commits."""
+    events = [(user_ids, event, data) for user_ids, event, data in events if user_ids]
+    if settings.PUSH_ENABLED and events:
+        transaction.on_commit(lambda: _send(events), robust=True)
+
+
+def _load_user(authentication, token):
+    # Outside Django's request handling nothing else applies CONN_MAX_AGE and
+    # CONN_HEALTH_CHECKS to this thread's connection, or drops it once broken
+    close_old_connections()
+    try:
+        return authentication.get_user(token)
+    finally:
+        close_old_connections()
+
+
+def _raw_token(scope):
+    for name, value in scope.get('headers', ()):
+        if name == b'authorization':
+            parts = value.decode('latin-1').split()
+            if len(parts) == 2 and parts[0] in settings.SIMPLE_JWT['AUTH_HEADER_TYPES']:
+                return parts[1]
+            return None
+    # EventSource cannot set headers, so browsers pass the access token in the query string
+    tokens = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('token')
+    return tokens[0] if tokens else None
+
+
+class PushApplication:
+    """ASGI app streaming ``notification`` and ``appointment`` events to the authenticated user."""
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] != 'GET':
+            return await self.reject(send, 405, 'Method not allowed')
+        user = None
+        raw = _raw_token(scope)
+        if raw:
+            try:
+                authentication = JWTAuthentication()
+                token = authentication.get_validated_token(raw)
+                user = await sync_to_async(_load_user)(authentication, token)
+            except (InvalidToken, AuthenticationFailed):
+                user = None
+            except DatabaseError:
+                logger.warning('Push stream authentication failed: database unavailable', exc_info=True)
+                return await self.reject(send, 503, 'Service temporarily unavailable')
+        if user is None:
+            return await self.reject(send, 401, 'Authentication credentials were not provided or are invalid')
+
+        stream = hub.subscribe(user.pk)
+        watcher = asyncio.ensure_future(self.wait_for_disconnect(receive, stream))
+        try:
+            await self.stream(send, stream, token['exp'])
+        finally:
+            watcher.cancel()
+            hub.unsubscribe(user.pk, stream)
+
+    async def wait_for_disconnect(self, receive, stream):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        stream.close()
+
+    async def stream(self, send, stream, expires):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n: connected\n\n', 'more_body': True})
+        while True:
+            remaining = expires - time.time()
+            if remaining <= 0:
+                # The client reconnects with a refreshed access token
+                message = b'event: expired\ndata: {}\n\n'
+                break
+            try:
+                async with asyncio.timeout(min(settings.PUSH_HEARTBEAT_SECONDS, remaining)):
+                    message = await stream.get()
+            except TimeoutError:
+                message = b': ping\n\n'
+            if message is None:
+                return
+            await send({'type': 'http.response.body', 'body': message, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': message})
+
+    async def reject(self, send, status, error):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': json.dumps({'error': error}).encode()})
+
+
+def router(django_application):
+    """Serve ``PUSH_PATH`` with ``PushApplication`` and everything else with Django."""
+    push = PushApplication()
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    hub.close()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] == 'http' and scope['path'] == settings.PUSH_PATH:
+            return await push(scope, receive, send)
+        return await django_application(scope, receive, send)
+
+    return application
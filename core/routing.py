@@ -0,0 +1,147 @@
+"""
+Read-replica routing.
+
+``ReplicaRoutingMiddleware`` picks the database for each request's reads:
+safe-method requests use one healthy replica from ``DATABASE_REPLICAS``;
+writes, and every request for ``DATABASE_PIN_SECONDS`` after a client's last
+write (tracked by a cookie), use the primary so users read their own writes.
+Outside requests (management commands, background threads) and inside
+transactions everything goes to the primary. Replicas whose lag exceeds
+``DATABASE_REPLICA_MAX_LAG`` seconds, or that cannot be reached, are left out
+of rotation until the next check.
+"""
+import contextvars
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.dispatch import receiver
+
+PRIMARY = DEFAULT_DB_ALIAS
+
+_read_alias = contextvars.ContextVar('read_alias', default=PRIMARY)
+
+# Idle primaries stop generating WAL, so replay time alone would look like lag
+LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+'''
+
+
+def measure_lag(alias):
+    """Replication lag of ``alias`` in seconds (0 for a stand-alone database)."""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        return float(cursor.fetchone()[0] or 0)
+
+
+class ReplicaMonitor:
+    """Per-process view of replica lag, refreshed at most every check interval."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._healthy = []
+        self.lag = {}
+
+    def healthy(self):
+        if not settings.DATABASE_REPLICAS:
+            return []
+        if self._stale():
+            with self._lock:
+                if self._stale():
+                    self.refresh()
+        return self._healthy
+
+    def _stale(self):
+        return (self._checked_at is None
+                or time.monotonic() - self._checked_at >= settings.DATABASE_REPLICA_CHECK_INTERVAL)
+
+    def refresh(self):
+        lag = {}
+        for alias in settings.DATABASE_REPLICAS:
+            try:
+                lag[alias] = measure_lag(alias)
+            except DatabaseError:
+                lag[alias] = None
+        self.lag = lag
+        self._healthy = [
+            alias for alias, seconds in lag.items()
+            if seconds is not None and seconds <= settings.DATABASE_REPLICA_MAX_LAG
+        ]
+        self._checked_at = time.monotonic()
+        return lag
+
+    def reset(self):
+        self._checked_at = None
+
+
+monitor = ReplicaMonitor()
+
+
+@receiver(setting_changed)
+def reset_monitor(setting, **kwargs):
+    if setting.startswith('DATABASE_REPLICA'):
+        monitor.reset()
+
+
+def choose_replica():
+    """A healthy replica alias, or the primary when none is available."""
+    healthy = monitor.healthy()
+    return random.choice(healthy) if healthy else PRIMARY
+
+
+def set_read_alias(alias):
+    return _read_alias.set(alias)
+
+
+def reset_read_alias(token):
+    _read_alias.reset(token)
+
+
+def is_pinned(request):
+    """Whether the client wrote recently enough that it must read from the primary."""
+    try:
+        return float(request.COOKIES.get(settings.DATABASE_PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def pin(request, response):
+    """Send this client's reads to the primary for ``DATABASE_PIN_SECONDS``."""
+    seconds = settings.DATABASE_PIN_SECONDS
+    response.set_cookie(
+        settings.DATABASE_PIN_COOKIE, str(int(time.time() + seconds) + 1),
+        max_age=seconds + 1, httponly=True, samesite='Lax',
+        secure=request.is_secure()
+    )
+
+
+class ReplicaRouter:
+    """Route reads to the replica chosen for the current request; writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias != PRIMARY and connections[PRIMARY].in_atomic_block:
+            # Reads inside a transaction must see its writes
+            return PRIMARY
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
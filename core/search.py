@@ -0,0 +1,66 @@
+"""
+Fuzzy user lookup backed by PostgreSQL's pg_trgm extension.
+
+Each word of the search term must match at least one searched column through
+the ``%`` (similarity) or ``<%`` (word similarity) operators, both of which are
+served by the ``gin_trgm_ops`` indexes declared on ``User.Meta.indexes``.
+Matches are ranked by the average of each word's best similarity.
+"""
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity, TrigramWordSimilarity
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import User
+
+SEARCH_FIELDS = ('username', 'email', 'first_name', 'last_name', 'specialization')
+MAX_SEARCH_WORDS = 4
+
+
+def _word_rank(word, fields):
+    scores = []
+    for field in fields:
+        scores.append(TrigramSimilarity(field, word))
+        scores.append(TrigramWordSimilarity(word, field))
+    return Coalesce(Greatest(*scores), Value(0.0), output_field=FloatField())
+
+
+def fuzzy_search_users(queryset, term, fields=SEARCH_FIELDS, min_similarity=None):
+    """
+    Filter ``queryset`` down to users matching ``term`` and order them by
+    similarity. Each row is annotated with ``search_rank`` (0.0 - 1.0).
+    """
+    words = (term or '').split()[:MAX_SEARCH_WORDS]
+    if not words:
+        return queryset.none()
+    if min_similarity is None:
+        min_similarity = settings.USER_SEARCH_MIN_SIMILARITY
+
+    match = Q()
+    rank = None
+    for word in words:
+        word_match = Q()
+        for field in fields:
+            word_match |= Q(**{f'{field}__trigram_similar': word})
+            word_match |= Q(**{f'{field}__trigram_word_similar': word})
+        match &= word_match
+        word_rank = _word_rank(word, fields)
+        rank = word_rank if rank is None else rank + word_rank
+
+    return (
+        queryset.filter(match)
+        .annotate(search_rank=rank / len(words))
+        .filter(search_rank__gte=min_similarity)
+        .order_by('-search_rank', 'pk')
+    )
+
+
+def lookup_patients(term, limit=None):
+    """Return the best matching patients for the staff lookup endpoint."""
+    max_results = settings.USER_SEARCH_MAX_RESULTS
+    limit = min(limit or max_results, max_results)
+    patients = User.objects.filter(role=User.Role.PATIENT).only(
+        'id', 'username', 'email', 'first_name', 'last_name',
+        'date_of_birth', 'phone_number', 'role',
+    )
+    return fuzzy_search_users(patients, term)[:limit]
@@ -3,12 +3,14 @@ from django.contrib.auth import get_user_model, authenticate
 from django.contrib.auth.password_validation import validate_password
 from rest_framework_simplejwt.tokens import RefreshToken
 from datetime import datetime, timedelta
-from .models import DoctorAppointment
+from .models import DoctorAppointment, Notification
+from .fastserializers import FastSerializer
+from .fieldsets import SparseFieldsMixin
 from records.models import HealthRecord
 
 User = get_user_model()
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 
@@ -33,6 +35,13 @@ class UserSerializer(serializers.ModelSerializer):
                 })
         return attrs
 
+class UserProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'role',
+                 'date_of_birth', 'phone_number', 'specialization')
+        read_only_fields = fields
+
 class UserCreateSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     password2 = serializers.CharField(write_only=True, required=True)
@@ -363,7 +372,7 @@ class DoctorAvailabilityResponseSerializer(serializers.ModelSerializer):
         fields = ['id', 'first_name', 'last_name', 'available_days', 
                  'appointment_duration', 'max_patients_per_day']
 
-class AppointmentResponseSerializer(serializers.ModelSerializer):
+class AppointmentResponseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     doctor = UserSerializer(read_only=True)
     patient = UserSerializer(read_only=True)
 
@@ -371,4 +380,26 @@ class AppointmentResponseSerializer(serializers.ModelSerializer):
         model = DoctorAppointment
         fields = ['id', 'doctor', 'patient', 'appointment_date', 
                  'start_time', 'end_time', 'status', 'notes', 
-                 'created_at', 'updated_at'] 
\ No newline at end of file
+                 'created_at', 'updated_at']
+
+class AppointmentFastSerializer(FastSerializer):
+    """values()-based read path producing the same output as AppointmentResponseSerializer"""
+    serializer_class = AppointmentResponseSerializer
+
+class PatientLookupSerializer(serializers.ModelSerializer):
+    score = serializers.FloatField(source='search_rank', read_only=True)
+
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'first_name', 'last_name', 'email',
+                 'date_of_birth', 'phone_number', 'score']
+
+class NotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ['id', 'notification_type', 'title', 'message', 'is_read',
+                 'related_record', 'created_at']
+        read_only_fields = fields
+
+class MarkReadSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), min_length=1, max_length=1000)
@@ -0,0 +1,76 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import notifications, push
+from .cache import doctor_directory, doctor_schedule
+from .models import DoctorAppointment, Notification, NotificationCounter
+
+User = get_user_model()
+
+
+@receiver(post_init, sender=User)
+def remember_role(sender, instance, **kwargs):
+    # Lets a doctor demoted to another role still invalidate the directory
+    instance._loaded_role = instance.role
+
+
+def _was_or_is_doctor(user):
+    return User.Role.DOCTOR in (user.role, getattr(user, '_loaded_role', None))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_doctor_directory(sender, instance, **kwargs):
+    """Profile and availability changes of doctors invalidate directory reads."""
+    if _was_or_is_doctor(instance):
+        doctor_directory.bump()
+        doctor_schedule.bump(instance.pk)
+    instance._loaded_role = instance.role
+
+
+@receiver(post_save, sender=DoctorAppointment)
+@receiver(post_delete, sender=DoctorAppointment)
+def invalidate_doctor_schedule(sender, instance, **kwargs):
+    """Booked slots are part of the doctor's availability response."""
+    doctor_schedule.bump(instance.doctor_id)
+
+
+@receiver(post_save, sender=DoctorAppointment)
+def notify_assigned_doctor(sender, instance, created, **kwargs):
+    """A patient's first appointment with a doctor assigns the patient to them."""
+    if created and not DoctorAppointment.objects.filter(
+        doctor_id=instance.doctor_id, patient_id=instance.patient_id
+    ).exclude(pk=instance.pk).exists():
+        notifications.queue(Notification.patient_assigned(instance.doctor, instance.patient))
+
+
+APPOINTMENT_PUSH_FIELDS = ('status', 'appointment_date', 'start_time', 'end_time')
+
+
+@receiver(post_init, sender=DoctorAppointment)
+def remember_schedule(sender, instance, **kwargs):
+    # __dict__ so deferred fields are not loaded just to be remembered
+    instance._loaded_schedule = tuple(instance.__dict__.get(field) for field in APPOINTMENT_PUSH_FIELDS)
+
+
+@receiver(post_save, sender=DoctorAppointment)
+def push_appointment_change(sender, instance, created, **kwargs):
+    """Status changes and reschedules reach both participants' open event streams."""
+    schedule = tuple(instance.__dict__.get(field) for field in APPOINTMENT_PUSH_FIELDS)
+    if not created and schedule != instance._loaded_schedule:
+        push.publish([(
+            [instance.doctor_id, instance.patient_id],
+            'appointment',
+            {'id': instance.pk, **dict(zip(APPOINTMENT_PUSH_FIELDS, schedule))},
+        )])
+    instance._loaded_schedule = schedule
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        NotificationCounter.objects.filter(user_id=instance.recipient_id, unread__gt=0).update(
+            unread=F('unread') - 1
+        )
@@ -1,3 +1,715 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import unittest
+from datetime import date, time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from rest_framework.renderers import JSONRenderer
+
+from records.models import HealthRecord
+from .models import User, DoctorAppointment, Notification, NotificationCounter
+from . import health, notifications, partitioning, push, routing
+from .admin import NotificationAdmin
+from .middleware import ReplicaRoutingMiddleware
+from .cache import doctor_directory
+from .search import fuzzy_search_users
+from .serializers import AppointmentFastSerializer, AppointmentResponseSerializer
+
+
+def authenticate(client, user):
+    """Attach a JWT access token for ``user`` to the API client"""
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+
+class PatientLookupTest(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            username='frontdesk',
+            password='testpass123',
+            email='frontdesk@test.com',
+            role=User.Role.ADMIN,
+            is_staff=True
+        )
+        self.patient = User.objects.create_user(
+            username='jsmith',
+            password='testpass123',
+            email='john.smith@test.com',
+            first_name='John',
+            last_name='Smith',
+            role=User.Role.PATIENT
+        )
+        User.objects.create_user(
+            username='mbrown',
+            password='testpass123',
+            email='mary.brown@test.com',
+            first_name='Mary',
+            last_name='Brown',
+            role=User.Role.PATIENT
+        )
+        self.client = APIClient()
+
+    def test_fuzzy_search_tolerates_typos(self):
+        """Test a misspelled surname still finds the patient"""
+        results = list(fuzzy_search_users(User.objects.all(), 'Smiht'))
+        self.assertEqual(results[0], self.patient)
+        self.assertGreater(results[0].search_rank, 0)
+
+    def test_lookup_ranks_best_match_first(self):
+        """Test the staff lookup endpoint returns ranked patients"""
+        authenticate(self.client, self.staff)
+        response = self.client.get(reverse('users-lookup'), {'q': 'john smith'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['patients'][0]['id'], self.patient.id)
+        self.assertIn('score', response.data['patients'][0])
+
+    def test_lookup_only_returns_patients(self):
+        """Test staff accounts never show up in patient lookup"""
+        authenticate(self.client, self.staff)
+        response = self.client.get(reverse('users-lookup'), {'q': 'frontdesk'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['patients'], [])
+
+    def test_lookup_requires_staff(self):
+        """Test patients cannot use the staff lookup"""
+        authenticate(self.client, self.patient)
+        response = self.client.get(reverse('users-lookup'), {'q': 'brown'})
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AppointmentFastSerializerTest(TestCase):
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT,
+            date_of_birth=date(1990, 1, 2)
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            role=User.Role.DOCTOR,
+            specialization='Cardiology',
+            appointment_duration=30,
+            max_patients_per_day=10
+        )
+        self.doctor.set_availability('SUNDAY', '08:00', '17:00')
+        for hour in (9, 10):
+            DoctorAppointment.objects.create(
+                doctor=self.doctor,
+                patient=self.patient,
+                appointment_date=date(2025, 6, 1),  # a Sunday
+                start_time=time(hour, 0),
+                end_time=time(hour, 30),
+                notes='Follow-up'
+            )
+
+    def test_output_matches_response_serializer(self):
+        """Test the values()-based serializer renders identical JSON"""
+        appointments = DoctorAppointment.objects.all()
+        expected = JSONRenderer().render(AppointmentResponseSerializer(appointments, many=True).data)
+        actual = JSONRenderer().render(AppointmentFastSerializer().render(appointments))
+
+        self.assertEqual(actual, expected)
+
+    def test_list_uses_fixed_number_of_queries(self):
+        """Test listing appointments does not query per row"""
+        client = APIClient()
+        client.force_authenticate(user=self.patient)
+        # Validators aggregate plus the list itself
+        with self.assertNumQueries(2):
+            response = client.get('/api/appointments/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+
+class DoctorDirectoryCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            role=User.Role.DOCTOR,
+            specialization='Cardiology',
+            appointment_duration=30,
+            max_patients_per_day=10
+        )
+        self.doctor.set_availability('SUNDAY', '08:00', '17:00')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+
+    def test_repeat_reads_are_served_from_cache(self):
+        """Test the second directory read runs no queries"""
+        first = self.client.get('/api/appointments/available_doctors/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/appointments/available_doctors/')
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(doctor_directory.stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_patient_directory_route_is_cached(self):
+        """Test the patient-facing doctor list has its own route and shares the directory cache"""
+        authenticate(self.client, self.patient)
+        first = self.client.get('/api/doctor-directory/')
+        second = self.client.get('/api/doctor-directory/')
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(reverse('doctor-list'), '/api/doctors/')
+        self.assertEqual(reverse('doctor-directory-list'), '/api/doctor-directory/')
+
+    def test_evicted_generation_never_repeats(self):
+        """Test a lost generation counter restarts above every earlier generation"""
+        old = doctor_directory.generation()
+        self.client.get('/api/appointments/available_doctors/')
+        cache.delete(doctor_directory._key('generation', ''))
+
+        self.assertGreater(doctor_directory.generation(), old)
+        self.assertEqual(self.client.get('/api/appointments/available_doctors/')['X-Cache'], 'MISS')
+
+    def test_availability_update_invalidates_directory(self):
+        """Test saving a doctor bumps the directory generation"""
+        self.client.get('/api/appointments/available_doctors/')
+        self.doctor.set_availability('MONDAY', '09:00', '12:00')
+
+        response = self.client.get('/api/appointments/available_doctors/')
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('MONDAY', response.data['doctors'][0]['availability'])
+
+    def test_patient_changes_keep_directory_cached(self):
+        """Test non-doctor saves leave cached entries valid"""
+        self.client.get('/api/appointments/available_doctors/')
+        self.patient.first_name = 'Changed'
+        self.patient.save()
+
+        response = self.client.get('/api/appointments/available_doctors/')
+
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_booking_invalidates_doctor_schedule(self):
+        """Test new appointments show up in the doctor's cached availability"""
+        params = {'doctor_id': self.doctor.id, 'start_date': '2025-06-01', 'end_date': '2025-06-01'}
+        self.client.get('/api/appointments/doctor_availability/', params)
+        DoctorAppointment.objects.create(
+            doctor=self.doctor,
+            patient=self.patient,
+            appointment_date=date(2025, 6, 1),  # a Sunday
+            start_time=time(9, 0),
+            end_time=time(9, 30)
+        )
+
+        response = self.client.get('/api/appointments/doctor_availability/', params)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['doctor']['existing_appointments']), 1)
+
+
+class PartitionHelpersTest(SimpleTestCase):
+    def test_month_arithmetic(self):
+        """Test months roll over year boundaries in both directions"""
+        self.assertEqual(partitioning.add_months(date(2025, 11, 1), 3), date(2026, 2, 1))
+        self.assertEqual(partitioning.add_months(date(2025, 1, 1), -1), date(2024, 12, 1))
+        self.assertEqual(
+            list(partitioning.months(date(2025, 11, 15), date(2026, 1, 2))),
+            [date(2025, 11, 1), date(2025, 12, 1), date(2026, 1, 1)]
+        )
+
+    def test_partition_names_round_trip(self):
+        """Test partition names encode their month and skip the default partition"""
+        name = partitioning.partition_name('doctor_appointments', date(2025, 3, 1))
+
+        self.assertEqual(name, 'doctor_appointments_p202503')
+        self.assertEqual(partitioning.parse_partition_month('doctor_appointments', name), date(2025, 3, 1))
+        self.assertIsNone(partitioning.parse_partition_month('doctor_appointments', 'doctor_appointments_default'))
+        self.assertIsNone(partitioning.parse_partition_month('notifications', name))
+
+
+class PartitionedTablesTest(TestCase):
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Partitioning requires PostgreSQL')
+    def test_tables_are_partitioned_by_month(self):
+        """Test migrations leave each table partitioned with a partition for this month"""
+        this_month = partitioning.month_start(date.today())
+        with connection.cursor() as cursor:
+            for table in partitioning.PARTITIONED_TABLES:
+                self.assertTrue(partitioning.is_partitioned(cursor, table))
+                self.assertIn(this_month, dict(partitioning.partitions(cursor, table)).values())
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Partitioning requires PostgreSQL')
+    def test_referenced_tables_stay_plain(self):
+        """Test records and notifications are plain tables with a unique record_id and real foreign keys"""
+        from django.db import IntegrityError, transaction
+        from records.models import HealthRecord
+
+        with connection.cursor() as cursor:
+            self.assertFalse(partitioning.is_partitioned(cursor, 'health_records'))
+            self.assertFalse(partitioning.is_partitioned(cursor, 'notifications'))
+        patient = User.objects.create_user(
+            username='testpatient', password='testpass123', email='patient@test.com', role=User.Role.PATIENT
+        )
+        HealthRecord.objects.create(record_id='HR-1', patient=patient, title='A', description='')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            HealthRecord.objects.create(record_id='HR-1', patient=patient, title='B', description='')
+
+    def test_only_unreferenced_tables_are_partitioned(self):
+        """Test archiving a partition cannot orphan rows of another model"""
+        for table in partitioning.PARTITIONED_TABLES:
+            self.assertEqual(partitioning.referencing_models(table), [])
+        self.assertIn('records.DoctorAnnotation', partitioning.referencing_models('health_records'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.read_aliases = []
+        routing.monitor.reset()
+
+    def get_response(self, request):
+        self.read_aliases.append(router.db_for_read(User))
+        return HttpResponse()
+
+    def run_request(self, request, lag=0.5):
+        with mock.patch.object(routing, 'measure_lag', return_value=lag):
+            return ReplicaRoutingMiddleware(self.get_response)(request)
+
+    def test_safe_requests_read_from_replica(self):
+        """Test GET requests read from a healthy replica and writes stay on the primary"""
+        self.run_request(self.factory.get('/api/doctors/'))
+
+        self.assertEqual(self.read_aliases, ['replica_1'])
+        self.assertEqual(router.db_for_write(User), 'default')
+        self.assertEqual(router.db_for_read(User), 'default')
+
+    def test_writes_pin_client_to_primary(self):
+        """Test reads after a write go to the primary while the pin cookie is valid"""
+        response = self.run_request(self.factory.post('/api/records/'))
+        cookie = response.cookies[settings.DATABASE_PIN_COOKIE].value
+
+        request = self.factory.get('/api/records/')
+        request.COOKIES[settings.DATABASE_PIN_COOKIE] = cookie
+        self.run_request(request)
+
+        self.assertEqual(self.read_aliases, ['default', 'default'])
+
+    def test_lagging_replica_leaves_rotation(self):
+        """Test a replica behind by more than the maximum lag is not used"""
+        self.run_request(self.factory.get('/api/doctors/'), lag=settings.DATABASE_REPLICA_MAX_LAG + 1)
+
+        self.assertEqual(self.read_aliases, ['default'])
+
+
+class HealthEndpointTest(TestCase):
+    def test_healthz_reports_database_latency(self):
+        """Test liveness reports database round trip and connection reuse settings"""
+        response = self.client.get('/healthz')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['status'], 'ok')
+        self.assertIn('latency_ms', data['database'])
+        self.assertIn('enabled', data['pool'])
+
+    def test_readyz_fails_without_database(self):
+        """Test readiness is 503 when the database probe fails, liveness stays 200"""
+        with mock.patch.object(health, 'probe', side_effect=OperationalError('connection refused')):
+            ready = self.client.get('/readyz')
+            alive = self.client.get('/healthz')
+
+        self.assertEqual(ready.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(ready.json()['database']['ok'])
+        self.assertEqual(alive.status_code, status.HTTP_200_OK)
+
+
+class WaitForDbTest(SimpleTestCase):
+    @mock.patch('healthrecords.management.commands.wait_for_db.time.sleep')
+    @mock.patch('healthrecords.management.commands.wait_for_db.probe')
+    def test_retries_with_backoff(self, probe, sleep):
+        """Test the command probes until the database answers, doubling the delay"""
+        probe.side_effect = [OperationalError, OperationalError, OperationalError, 1.0]
+
+        call_command('wait_for_db', '--initial-delay', '0.5', stdout=io.StringIO())
+
+        self.assertEqual(probe.call_count, 4)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.5, 1.0, 2.0])
+
+    @mock.patch('healthrecords.management.commands.wait_for_db.time.sleep')
+    @mock.patch('healthrecords.management.commands.wait_for_db.probe', side_effect=OperationalError)
+    def test_gives_up_after_timeout(self, probe, sleep):
+        """Test the command fails instead of waiting forever"""
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', '--timeout', '0', stdout=io.StringIO())
+
+
+@override_settings(NOTIFICATION_BACKGROUND_FLUSH=False, NOTIFICATION_BATCH_SIZE=500)
+class NotificationFanoutTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        spool = override_settings(NOTIFICATION_SPOOL_PATH=os.path.join(directory.name, 'notifications.ndjson'))
+        spool.enable()
+        self.addCleanup(spool.disable)
+        notifications.get_buffer().discard()
+
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            role=User.Role.DOCTOR,
+            first_name='Ada',
+            last_name='Lovelace',
+            specialization='Cardiology',
+            appointment_duration=30,
+            max_patients_per_day=10
+        )
+        self.doctor.set_availability('SUNDAY', '08:00', '17:00')
+        self.records = HealthRecord.objects.bulk_create([
+            HealthRecord(record_id=f'HR-{i}', patient=self.patient, doctor=self.doctor,
+                         title=f'Visit {i}', description='')
+            for i in range(20)
+        ])
+        self.client = APIClient()
+        authenticate(self.client, self.doctor)
+
+    def annotate(self, record):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/records/{record.id}/add_annotation/', {'content': 'Reviewed'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_annotations_are_inserted_in_one_batch(self):
+        """Test annotating many records only queues notifications; one flush inserts them"""
+        for record in self.records:
+            self.annotate(record)
+        self.assertFalse(Notification.objects.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            notifications.flush()
+        inserts = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('INSERT INTO "notifications"')]
+        self.assertEqual(len(inserts), 1)
+        sent = Notification.objects.filter(recipient=self.patient)
+        self.assertEqual(sent.count(), 20)
+        self.assertEqual(NotificationCounter.unread_for(self.patient.pk), 20)
+        first = sent.get(related_record=self.records[0])
+        self.assertEqual(first.notification_type, Notification.NotificationType.ANNOTATION_ADDED)
+        self.assertEqual(first.message, 'Dr. Ada Lovelace added an annotation to Visit 0')
+
+    def test_identical_pending_notifications_are_dropped(self):
+        """Test repeats are collapsed while unread and sent again once read"""
+        self.annotate(self.records[0])
+        self.annotate(self.records[0])
+        notifications.flush()
+        self.assertEqual(Notification.objects.count(), 1)
+
+        self.annotate(self.records[0])
+        notifications.flush()
+        self.assertEqual(Notification.objects.count(), 1)
+
+        Notification.objects.get().mark_as_read()
+        self.annotate(self.records[0])
+        notifications.flush()
+        self.assertEqual(Notification.objects.filter(is_read=False).count(), 1)
+
+    def test_first_appointment_assigns_patient(self):
+        """Test only a patient's first appointment with a doctor notifies the doctor"""
+        for day in (1, 8):  # Sundays
+            with self.captureOnCommitCallbacks(execute=True):
+                DoctorAppointment.objects.create(
+                    doctor=self.doctor, patient=self.patient, appointment_date=date(2025, 6, day),
+                    start_time=time(9), end_time=time(9, 30)
+                )
+        notifications.flush()
+        notification = Notification.objects.get()
+        self.assertEqual(notification.recipient, self.doctor)
+        self.assertEqual(notification.notification_type, Notification.NotificationType.PATIENT_ASSIGNED)
+
+    def test_create_annotation_notification(self):
+        """Test the synchronous helper stores the notification"""
+        notification = Notification.create_annotation_notification(self.doctor, self.patient, self.records[1])
+        self.assertEqual(Notification.objects.get(), notification)
+        self.assertEqual(notification.related_record_id, self.records[1].id)
+
+
+class NotificationInboxTest(TestCase):
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.other = User.objects.create_user(username='other', password='testpass123', role=User.Role.PATIENT)
+        Notification.save_unread([
+            Notification(recipient=user, notification_type=Notification.NotificationType.ANNOTATION_ADDED,
+                         title='New Annotation', message=f'Note {i}')
+            for i in range(5) for user in (self.patient, self.other)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+
+    def test_inbox_pages_newest_first(self):
+        """Test keyset pages cover the user's notifications once, newest first"""
+        messages, cursor = [], ''
+        while True:
+            response = self.client.get('/api/notifications/', {'limit': 2, 'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            messages += [notification['message'] for notification in response.data['results']]
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+        expected = list(
+            Notification.objects.filter(recipient=self.patient).order_by('-created_at', '-id')
+            .values_list('message', flat=True)
+        )
+        self.assertEqual(messages, expected)
+        self.assertEqual(len(messages), 5)
+        self.assertEqual(self.client.get('/api/notifications/', {'cursor': 'bad'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_unread_count_reads_one_row(self):
+        """Test the unread count comes from the counter, not a COUNT over notifications"""
+        with self.assertNumQueries(1) as queries:
+            response = self.client.get('/api/notifications/unread_count/')
+        self.assertEqual(response.data, {'unread': 5})
+        self.assertIn('notification_counters', queries.captured_queries[0]['sql'])
+
+    def test_mark_read_adjusts_the_counter(self):
+        """Test bulk and mark-all updates only touch the user's unread rows and keep the counter exact"""
+        mine = list(Notification.objects.filter(recipient=self.patient).values_list('pk', flat=True))
+        theirs = Notification.objects.filter(recipient=self.other).values_list('pk', flat=True).first()
+
+        response = self.client.post('/api/notifications/mark_read/', {'ids': mine[:2] + [theirs]}, format='json')
+        self.assertEqual(response.data, {'updated': 2, 'unread': 3})
+        response = self.client.post('/api/notifications/mark_read/', {'ids': mine[:2]}, format='json')
+        self.assertEqual(response.data, {'updated': 0, 'unread': 3})
+        self.assertEqual(self.client.post('/api/notifications/mark_read/', {'ids': []}, format='json').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post('/api/notifications/mark_all_read/')
+        self.assertEqual(response.data, {'updated': 3, 'unread': 0})
+        self.assertEqual(NotificationCounter.unread_for(self.other.pk), 5)
+        self.assertFalse(self.client.get('/api/notifications/', {'unread': 1}).data['results'])
+
+        Notification.objects.filter(recipient=self.other).first().delete()
+        NotificationCounter.objects.filter(user=self.other).update(unread=99)
+        NotificationCounter.recount([self.other.pk])
+        self.assertEqual(NotificationCounter.unread_for(self.other.pk), 4)
+
+    def test_admin_edits_keep_the_counter(self):
+        """Test notifications added or toggled in the admin move the unread counter"""
+        admin_user = User.objects.create_superuser(username='admin', password='testpass123', email='admin@test.com')
+        request = RequestFactory().post('/admin/')
+        request.user = admin_user
+        model_admin = NotificationAdmin(Notification, admin.site)
+
+        notification = Notification.objects.filter(recipient=self.patient).first()
+        notification.is_read = True
+        model_admin.save_model(request, notification, None, True)
+        self.assertEqual(NotificationCounter.unread_for(self.patient.pk), 4)
+        notification.recipient = self.other
+        notification.is_read = False
+        model_admin.save_model(request, notification, None, True)
+        self.assertEqual(NotificationCounter.unread_for(self.patient.pk), 4)
+        self.assertEqual(NotificationCounter.unread_for(self.other.pk), 6)
+
+        added = Notification(recipient=self.patient, notification_type=Notification.NotificationType.ANNOTATION_ADDED,
+                             title='New Annotation', message='From the admin')
+        model_admin.save_model(request, added, None, False)
+        self.assertEqual(NotificationCounter.unread_for(self.patient.pk), 5)
+
+
+class PushStreamTest(TransactionTestCase):
+    # The stream looks users up through close_old_connections(), which ends a test transaction
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            role=User.Role.DOCTOR
+        )
+        self.addCleanup(push.hub.streams.clear)
+
+    async def request(self, query=b'', headers=()):
+        """Run the push app until the client disconnects; returns the status and body sent"""
+        disconnect = asyncio.Event()
+        sent = []
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/events/', 'query_string': query,
+                 'headers': list(headers)}
+        task = asyncio.ensure_future(push.PushApplication()(scope, receive, send))
+        return task, disconnect, sent
+
+    def body(self, sent):
+        return b''.join(message.get('body', b'') for message in sent[1:])
+
+    async def test_requires_a_valid_token(self):
+        """Test streams without a token, or with an invalid one, are rejected"""
+        for query in (b'', b'token=garbage'):
+            task, disconnect, sent = await self.request(query)
+            await task
+            self.assertEqual(sent[0]['status'], 401)
+            self.assertIn(b'error', sent[1]['body'])
+
+    async def test_events_reach_only_their_recipients(self):
+        """Test a published event is streamed to its recipient's connection and no one else's"""
+        patient_token = str(AccessToken.for_user(self.patient))
+        doctor_token = str(AccessToken.for_user(self.doctor))
+        patient, patient_disconnect, patient_sent = await self.request(f'token={patient_token}'.encode())
+        doctor, doctor_disconnect, doctor_sent = await self.request(
+            headers=[(b'authorization', f'Bearer {doctor_token}'.encode())]
+        )
+        while len(push.hub.streams) < 2:
+            await asyncio.sleep(0.01)
+
+        for payload in push.encode_events([([self.patient.pk], 'notification', {'id': 7, 'title': 'Hi'})]):
+            push.hub.dispatch(payload)
+        await asyncio.sleep(0.01)
+        patient_disconnect.set()
+        doctor_disconnect.set()
+        await asyncio.gather(patient, doctor)
+
+        self.assertEqual(patient_sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), patient_sent[0]['headers'])
+        self.assertIn(b'event: notification\ndata: {"id": 7, "title": "Hi"}\n\n', self.body(patient_sent))
+        self.assertNotIn(b'event: notification', self.body(doctor_sent))
+        self.assertFalse(push.hub.streams)
+
+    async def test_database_errors_answer_503(self):
+        """Test a failing user lookup is answered with 503 instead of raising"""
+        token = str(AccessToken.for_user(self.patient))
+        with mock.patch.object(push.JWTAuthentication, 'get_user', side_effect=OperationalError('server closed')):
+            task, disconnect, sent = await self.request(f'token={token}'.encode())
+            await task
+        self.assertEqual(sent[0]['status'], 503)
+        self.assertFalse(push.hub.streams)
+
+
+class PushTest(TestCase):
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            role=User.Role.DOCTOR
+        )
+        self.doctor.set_availability('SUNDAY', '08:00', '17:00')
+        self.addCleanup(push.hub.streams.clear)
+
+    def test_payloads_fit_in_a_notify(self):
+        """Test events are packed into payloads under PostgreSQL's NOTIFY limit"""
+        events = [([1, 2], 'notification', {'message': 'x' * 500, 'n': n}) for n in range(40)]
+        events.append(([3], 'notification', {'message': 'x' * 10000}))
+        payloads = push.encode_events(events)
+        self.assertGreater(len(payloads), 1)
+        self.assertTrue(all(len(payload.encode()) < push.MAX_PAYLOAD for payload in payloads))
+        decoded = [event for payload in payloads for event in json.loads(payload)]
+        self.assertEqual([event[2].get('n') for event in decoded[:40]], list(range(40)))
+        self.assertEqual(decoded[-1], [[3], 'resync', {}])
+
+    def test_slow_clients_are_told_to_resync(self):
+        """Test a full stream drops its backlog for a single resync event"""
+        async def fill():
+            stream = push.Stream(2)
+            for n in range(3):
+                stream.put(b'event %d' % n)
+            return [await stream.get() for _ in range(stream.queue.qsize())]
+
+        self.assertEqual(asyncio.run(fill()), [push.RESYNC])
+
+    def test_failed_notify_does_not_fail_the_request(self):
+        """Test a NOTIFY error after commit is logged instead of raised"""
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.execute.side_effect = OperationalError('server closed')
+        with mock.patch.object(push, 'connection') as database, self.assertLogs('core.push', 'WARNING'):
+            database.vendor = 'postgresql'
+            database.cursor.return_value = cursor
+            with self.captureOnCommitCallbacks(execute=True):
+                push.publish([([self.patient.pk], 'notification', {'id': 1})])
+
+    def test_appointment_changes_are_published(self):
+        """Test status changes and reschedules are pushed to both participants, other edits are not"""
+        appointment = DoctorAppointment.objects.create(
+            doctor=self.doctor, patient=self.patient, appointment_date=date(2025, 6, 1),
+            start_time=time(9), end_time=time(9, 30)
+        )
+        with mock.patch.object(push, 'publish') as publish:
+            appointment.notes = 'Bring previous results'
+            appointment.save()
+            publish.assert_not_called()
+
+            appointment.status = User.AppointmentStatus.CANCELLED
+            appointment.save()
+        [(user_ids, event, data)] = publish.call_args.args[0]
+        self.assertEqual((user_ids, event), ([self.doctor.pk, self.patient.pk], 'appointment'))
+        self.assertEqual((data['id'], data['status']), (appointment.pk, 'CANCELLED'))
+
+    def test_inserted_notifications_are_published(self):
+        """Test the notification writer pushes what it inserted"""
+        record = HealthRecord.objects.create(record_id='HR-1', patient=self.patient, doctor=self.doctor,
+                                             title='Visit', description='')
+        with mock.patch.object(push, 'publish') as publish:
+            notifications.write_notifications([
+                (self.patient.pk, Notification.NotificationType.ANNOTATION_ADDED, 'New annotation', 'Reviewed',
+                 record.pk),
+            ])
+        [(user_ids, event, data)] = list(publish.call_args.args[0])
+        self.assertEqual((user_ids, event), ([self.patient.pk], 'notification'))
+        self.assertEqual(data['id'], Notification.objects.get().pk)
+        self.assertEqual(data['related_record'], record.pk)
@@ -1,12 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserManagementViewSet, AuthViewSet, RegisterView, DoctorViewSet, PatientViewSet,AppointmentViewSet
+from .views import UserManagementViewSet, AuthViewSet, RegisterView, DoctorViewSet, PatientViewSet,AppointmentViewSet, NotificationViewSet
 
 router = DefaultRouter()
 router.register(r'users', UserManagementViewSet, basename='users')
 router.register(r'doctors', DoctorViewSet, basename='doctor')
 router.register(r'patients', PatientViewSet, basename='patient')
 router.register(r'appointments', AppointmentViewSet, basename='appointment')
+router.register(r'notifications', NotificationViewSet, basename='notification')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -11,9 +11,17 @@ from .serializers import (
     UserUpdateSerializer,
     LoginSerializer,
     RegisterSerializer,
-    DoctorAvailabilityUpdateSerializer
+    DoctorAvailabilityUpdateSerializer,
+    PatientLookupSerializer
 )
-from .permissions import IsAdminUser, IsDoctor, IsPatient
+from .permissions import IsAdminUser, IsDoctor, IsPatient, IsStaffUser
+from .search import lookup_patients
+from .fieldsets import SparseFieldsViewMixin, minimal_response, prefers_minimal
+from .fastserializers import FastListMixin
+from .eager import EagerLoadingMixin
+from .conditional import ConditionalRequestMixin, conditional_response, instance_validators
+from audit.mixins import AuditMixin
+from .cache import doctor_directory, doctor_schedule, stats as response_cache_stats
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
@@ -26,10 +34,15 @@ from records.models import HealthRecord
 from .serializers import (
     AppointmentBookingSerializer,
     AppointmentResponseSerializer,
+    AppointmentFastSerializer,
     DoctorAvailabilityResponseSerializer
 )
 from .permissions import IsPatient
 import time
+from django.db.models import Q
+from .cursors import decode_cursor, encode_cursor
+from .models import Notification, NotificationCounter
+from .serializers import MarkReadSerializer, NotificationSerializer
 
 User = get_user_model()
 
@@ -65,7 +78,7 @@ class RegisterView(APIView):
             return Response(response_data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class UserManagementViewSet(viewsets.ModelViewSet):
+class UserManagementViewSet(EagerLoadingMixin, ConditionalRequestMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing users
     """
@@ -74,8 +87,10 @@ class UserManagementViewSet(viewsets.ModelViewSet):
     authentication_classes = [JWTAuthentication]
 
     def get_permissions(self):
-        if self.action in ['list', 'destroy']:
+        if self.action in ['list', 'destroy', 'cache_stats']:
             return [IsAdminUser()]
+        if self.action == 'lookup':
+            return [IsStaffUser()]
         return [permissions.IsAuthenticated()]
 
     def get_queryset(self):
@@ -118,16 +133,20 @@ class UserManagementViewSet(viewsets.ModelViewSet):
                 {'message': 'You can only update your own profile'},
                 status=status.HTTP_403_FORBIDDEN
             )
+        response = self.check_object_preconditions(request)
+        if response is not None:
+            return response
 
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
-        return Response({
+        response = Response({
             'message': 'User updated successfully',
             'user': UserSerializer(user).data
         })
+        return instance_validators(request, user).apply(response)
 
     def destroy(self, request, *args, **kwargs):
         # Only admin can delete users
@@ -151,8 +170,9 @@ class UserManagementViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         doctors = User.objects.filter(role=User.Role.DOCTOR)
-        serializer = self.get_serializer(doctors, many=True)
-        return Response(serializer.data)
+        return doctor_directory.cached(
+            request, lambda: Response(self.get_serializer(doctors, many=True).data)
+        )
 
     @action(detail=False, methods=['get'])
     def patients(self, request):
@@ -169,11 +189,43 @@ class UserManagementViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def me(self, request):
         """Get current user's profile"""
-        serializer = self.get_serializer(request.user)
-        return Response(serializer.data)
+        return conditional_response(
+            request, instance_validators(request, request.user),
+            lambda: Response(self.get_serializer(request.user).data)
+        )
 
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """Response cache hit/miss counters (Admin only)"""
+        return Response(response_cache_stats())
 
-class DoctorViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def lookup(self, request):
+        """Fuzzy patient lookup for front-desk staff, ranked by similarity"""
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            return Response(
+                {'message': 'Please provide a search term'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = int(request.query_params.get('limit', 0))
+            if limit < 0:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {'message': 'limit must be a positive integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        patients = lookup_patients(term, limit=limit or None)
+        serializer = PatientLookupSerializer(patients, many=True)
+        return Response({
+            'message': 'Patients retrieved successfully',
+            'patients': serializer.data
+        })
+
+
+class DoctorViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     """
     API endpoint for doctor-specific operations
     """
@@ -251,7 +303,7 @@ class DoctorViewSet(viewsets.ModelViewSet):
             })
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class PatientViewSet(viewsets.ModelViewSet):
+class PatientViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     """
     API endpoint for patient-specific operations
     """
@@ -326,12 +378,15 @@ class PatientViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(AuditMixin, EagerLoadingMixin, ConditionalRequestMixin,
+                         FastListMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for handling appointment-related operations
     """
     permission_classes = [IsAuthenticated]
     serializer_class = AppointmentResponseSerializer
+    fast_serializer_class = AppointmentFastSerializer
+    conditional_related = ('doctor', 'patient')
 
     def get_queryset(self):
         user = self.request.user
@@ -344,6 +399,9 @@ class AppointmentViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def available_doctors(self, request):
         """Get list of available doctors with their schedules"""
+        return doctor_directory.cached(request, self._available_doctors)
+
+    def _available_doctors(self):
         try:
             doctors = User.objects.filter(role=User.Role.DOCTOR)
             doctors_data = []
@@ -382,6 +440,11 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 'message': 'Missing required parameters'
             }, status=status.HTTP_400_BAD_REQUEST)
 
+        return doctor_schedule.cached(
+            request, lambda: self._doctor_availability(doctor_id, start_date, end_date), scope=doctor_id
+        )
+
+    def _doctor_availability(self, doctor_id, start_date, end_date):
         try:
             doctor = User.objects.get(id=doctor_id, role=User.Role.DOCTOR)
             
@@ -440,10 +503,12 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 title=f"Appointment with Dr. {appointment.doctor.get_full_name()}",
                 description="",  # Empty description
                 patient=request.user,
-                doctor=appointment.doctor,
-                attachments=None  # No attachments initially
+                doctor=appointment.doctor
             )
 
+            if prefers_minimal(request):
+                return minimal_response(appointment, status.HTTP_201_CREATED)
+
             return Response({
                 'message': 'Appointment booked successfully',
                 'appointment': AppointmentResponseSerializer(appointment).data,
@@ -478,6 +543,9 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             appointment.status = User.AppointmentStatus.CANCELLED
             appointment.save()
 
+            if prefers_minimal(request):
+                return minimal_response(appointment)
+
             return Response({
                 'message': 'Appointment cancelled successfully',
                 'appointment': AppointmentResponseSerializer(appointment).data
@@ -508,6 +576,9 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             appointment.end_time = serializer.validated_data['end_time']
             appointment.save()
 
+            if prefers_minimal(request):
+                return minimal_response(appointment)
+
             return Response({
                 'message': 'Appointment rescheduled successfully',
                 'appointment': AppointmentResponseSerializer(appointment).data
@@ -517,4 +588,68 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             return Response({
                 'message': 'Error rescheduling appointment',
                 'error': str(e)
-            }, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+
+INBOX_PAGE_SIZE = 50
+INBOX_MAX_PAGE_SIZE = 200
+
+
+class NotificationViewSet(viewsets.GenericViewSet):
+    """
+    The signed-in user's notifications: a keyset-paginated inbox (newest
+    first, served from the (recipient, created_at, id) index), the unread
+    count from the user's ``NotificationCounter`` row, and marking some or all
+    notifications read with one UPDATE.
+    """
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Notification.objects.filter(recipient=self.request.user)
+
+    def list(self, request):
+        """Notifications newest first; ?unread=1 for unread ones, ?cursor= for the next page"""
+        params = request.query_params
+        notifications = self.get_queryset()
+        try:
+            if params.get('unread') in ('1', 'true'):
+                notifications = notifications.filter(is_read=False)
+            if params.get('cursor'):
+                created_at, notification_id = decode_cursor(params['cursor'], int)
+                notifications = notifications.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=notification_id)
+                )
+            limit = params.get('limit', str(INBOX_PAGE_SIZE))
+            if not limit.isdigit() or int(limit) < 1:
+                raise ValueError('limit must be a positive integer')
+            limit = min(int(limit), INBOX_MAX_PAGE_SIZE)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = list(notifications.order_by('-created_at', '-id')[:limit + 1])
+        next_cursor = encode_cursor(page[limit - 1].created_at, page[limit - 1].pk) if len(page) > limit else None
+        return Response({
+            'results': self.get_serializer(page[:limit], many=True).data,
+            'next_cursor': next_cursor,
+        })
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        """Number of unread notifications, read from the user's counter row"""
+        return Response({'unread': NotificationCounter.unread_for(request.user.pk)})
+
+    @action(detail=False, methods=['post'])
+    def mark_read(self, request):
+        """Mark the given notification ids read"""
+        serializer = MarkReadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        updated = Notification.mark_read(request.user.pk, serializer.validated_data['ids'])
+        return Response({'updated': updated, 'unread': NotificationCounter.unread_for(request.user.pk)})
+
+    @action(detail=False, methods=['post'])
+    def mark_all_read(self, request):
+        """Mark every notification read"""
+        updated = Notification.mark_read(request.user.pk)
+        return Response({'updated': updated, 'unread': NotificationCounter.unread_for(request.user.pk)})
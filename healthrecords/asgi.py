@@ -2,6 +2,8 @@
 ASGI config for healthrecords project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests to ``PUSH_PATH`` are answered by the server-sent events app in
+``core/push.py``; everything else goes to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'healthrecords.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from core.push import router  # noqa: E402  (needs the app registry)
+
+application = router(django_application)
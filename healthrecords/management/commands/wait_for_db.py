@@ -1,19 +1,40 @@
 import time
-from django.core.management.base import BaseCommand
-from django.db import connections
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.db.utils import OperationalError
 
+from core.health import probe
+
+
 class Command(BaseCommand):
     """Django command to pause execution until database is available"""
 
+    help = 'Connect and run SELECT 1 until it succeeds, backing off exponentially between attempts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--timeout', type=float, default=60, help='Give up after this many seconds')
+        parser.add_argument('--initial-delay', type=float, default=0.5)
+        parser.add_argument('--max-delay', type=float, default=5)
+
     def handle(self, *args, **options):
         self.stdout.write('Waiting for database...')
-        db_conn = None
-        while not db_conn:
+        deadline = time.monotonic() + options['timeout']
+        delay = options['initial_delay']
+        attempt = 1
+        while True:
             try:
-                db_conn = connections['default']
-            except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
+                latency = probe(options['database'])
+                break
+            except OperationalError as e:
+                # A failed connect leaves a half-open wrapper behind; start fresh next time
+                connections[options['database']].close()
+                if time.monotonic() + delay > deadline:
+                    raise CommandError(f'Database unavailable after {attempt} attempts: {e}')
+                self.stdout.write(f'Database unavailable (attempt {attempt}), waiting {delay:.1f}s...')
+                time.sleep(delay)
+                delay = min(delay * 2, options['max_delay'])
+                attempt += 1
 
-        self.stdout.write(self.style.SUCCESS('Database available!')) 
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f'Database available! ({latency:.1f} ms)'))
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -28,6 +30,11 @@ DEBUG = int(os.environ.get('DEBUG', 1))
 
 ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost 127.0.0.1 [::1]').split()
 
+# `manage.py test` or pytest: process-wide writers stay synchronous and spool
+# to a throwaway directory instead of var/
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+TEST_SPOOL_DIR = tempfile.mkdtemp(prefix='healthrecords-test-') if TESTING else None
+
 
 # Application definition
 
@@ -38,16 +45,20 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # Third party apps
     'rest_framework',
     'corsheaders',
     # Local apps
     'core.apps.CoreConfig',
     'records.apps.RecordsConfig',
+    'audit.apps.AuditConfig',
+    'healthrecords.apps.HealthrecordsConfig',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -91,6 +102,45 @@ DATABASES = {
     }
 }
 
+# Connection reuse. DATABASE_POOL=1 uses Django's psycopg 3 pool (install the
+# "pool" extra); otherwise each worker keeps its connection for CONN_MAX_AGE
+# seconds and checks it before reuse
+if bool(int(os.environ.get('DATABASE_POOL', 0))):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('CONN_MAX_AGE', 60))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Read replicas: POSTGRES_REPLICAS="host[:port][/name],..." adds aliases
+# replica_1, replica_2, ... with the primary's credentials (see core/routing.py)
+DATABASE_REPLICAS = []
+for index, spec in enumerate(filter(None, os.environ.get('POSTGRES_REPLICAS', '').split(',')), 1):
+    address, _, name = spec.strip().partition('/')
+    host, _, port = address.partition(':')
+    DATABASE_REPLICAS.append(f'replica_{index}')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host or DATABASES['default']['HOST'],
+        'PORT': port or DATABASES['default']['PORT'],
+        'NAME': name or DATABASES['default']['NAME'],
+        'OPTIONS': {**DATABASES['default'].get('OPTIONS', {}), 'connect_timeout': 2},
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.routing.ReplicaRouter']
+# Replicas further behind than this (seconds) are taken out of rotation
+DATABASE_REPLICA_MAX_LAG = float(os.environ.get('DATABASE_REPLICA_MAX_LAG', 5))
+DATABASE_REPLICA_CHECK_INTERVAL = float(os.environ.get('DATABASE_REPLICA_CHECK_INTERVAL', 10))
+# After a write, the client reads from the primary for this many seconds
+DATABASE_PIN_SECONDS = int(os.environ.get('DATABASE_PIN_SECONDS', 10))
+DATABASE_PIN_COOKIE = 'db_primary_until'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -172,5 +222,139 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # File upload settings
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
+# Multipart uploads above this size are streamed to a temporary file
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1048576  # 1MB
 FILE_UPLOAD_PERMISSIONS = 0o644
+
+# Attachment downloads (see core/downloads.py): '' streams from Django,
+# 'nginx' sends X-Accel-Redirect to ATTACHMENT_OFFLOAD_PREFIX + file name,
+# 'sendfile' sends X-Sendfile with the absolute path
+ATTACHMENT_OFFLOAD = os.environ.get('ATTACHMENT_OFFLOAD', '')
+ATTACHMENT_OFFLOAD_PREFIX = os.environ.get('ATTACHMENT_OFFLOAD_PREFIX', '/protected-media/')
+
+# Attachment storage (see core/objectstore.py): files under MEDIA_ROOT, or an
+# S3-compatible bucket when ATTACHMENT_S3_BUCKET is set. With a bucket, clients
+# upload and download through presigned URLs and workers only handle metadata.
+ATTACHMENT_S3_BUCKET = os.environ.get('ATTACHMENT_S3_BUCKET', '')
+ATTACHMENT_S3_ENDPOINT = os.environ.get('ATTACHMENT_S3_ENDPOINT', 'http://127.0.0.1:9000')
+# Host that clients use for presigned URLs, when it differs from the one above
+ATTACHMENT_S3_PUBLIC_ENDPOINT = os.environ.get('ATTACHMENT_S3_PUBLIC_ENDPOINT', '')
+ATTACHMENT_S3_REGION = os.environ.get('ATTACHMENT_S3_REGION', 'us-east-1')
+ATTACHMENT_S3_ACCESS_KEY = os.environ.get('ATTACHMENT_S3_ACCESS_KEY', 'local')
+ATTACHMENT_S3_SECRET_KEY = os.environ.get('ATTACHMENT_S3_SECRET_KEY', 'local-secret')
+ATTACHMENT_URL_EXPIRY = int(os.environ.get('ATTACHMENT_URL_EXPIRY', 300))  # seconds
+# Buckets of the local stand-in, `manage.py run_object_store` (core/localstore.py)
+OBJECT_STORE_ROOT = os.environ.get('OBJECT_STORE_ROOT', os.path.join(BASE_DIR, 'var', 'objectstore'))
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'attachments': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'cold_attachments': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': os.environ.get('ATTACHMENT_COLD_ROOT', os.path.join(BASE_DIR, 'var', 'cold'))},
+    },
+}
+if ATTACHMENT_S3_BUCKET:
+    STORAGES['attachments'] = {
+        'BACKEND': 'core.objectstore.S3Storage',
+        'OPTIONS': {
+            'endpoint_url': ATTACHMENT_S3_ENDPOINT,
+            'public_endpoint_url': ATTACHMENT_S3_PUBLIC_ENDPOINT or None,
+            'bucket': ATTACHMENT_S3_BUCKET,
+            'region': ATTACHMENT_S3_REGION,
+            'access_key': ATTACHMENT_S3_ACCESS_KEY,
+            'secret_key': ATTACHMENT_S3_SECRET_KEY,
+            'url_expiry': ATTACHMENT_URL_EXPIRY,
+        },
+    }
+
+# Cold tier (see records/tiering.py): `manage.py tier_attachments` compresses
+# blobs older than ATTACHMENT_COLD_AFTER_DAYS into STORAGES['cold_attachments'].
+# Reads decompress on the fly; recently read ones are kept decompressed in an
+# LRU cache of ATTACHMENT_CACHE_MAX_BYTES
+ATTACHMENT_COLD_AFTER_DAYS = int(os.environ.get('ATTACHMENT_COLD_AFTER_DAYS', 90))
+ATTACHMENT_COLD_LEVEL = 12  # zstd level
+ATTACHMENT_CACHE_DIR = os.environ.get('ATTACHMENT_CACHE_DIR', os.path.join(BASE_DIR, 'var', 'attachment-cache'))
+ATTACHMENT_CACHE_MAX_BYTES = int(os.environ.get('ATTACHMENT_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+# Resumable uploads (see records/uploads.py)
+UPLOAD_SESSION_DIR = os.environ.get('UPLOAD_SESSION_DIR', os.path.join(BASE_DIR, 'var', 'uploads'))
+UPLOAD_SESSION_TTL_HOURS = int(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 24))
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 100 * 1024 * 1024))
+UPLOAD_BLOCK_SIZE = 64 * 1024
+# How long a chunk holds its session without progress (renewed while it streams)
+UPLOAD_LEASE_SECONDS = int(os.environ.get('UPLOAD_LEASE_SECONDS', 60))
+
+# Attachment previews (see records/previews.py): JPEG thumbnails no larger than
+# these many pixels, rendered by `manage.py run_preview_worker`
+PREVIEW_SIZES = {'thumb': 256, 'page': 1024}
+PREVIEW_WORKER_PROCESSES = int(os.environ.get('PREVIEW_WORKER_PROCESSES', 0))  # 0: one per CPU
+PREVIEW_TASKS_PER_CHILD = 500
+PREVIEW_BATCH_SIZE = int(os.environ.get('PREVIEW_BATCH_SIZE', 32))
+PREVIEW_POLL_INTERVAL = 2
+PREVIEW_MAX_ATTEMPTS = 5
+PREVIEW_RETRY_DELAY = 30  # seconds, doubled after every failed attempt
+PREVIEW_JOB_TIMEOUT = 300  # running jobs older than this are taken over
+PREVIEW_RENDER_TIMEOUT = 60
+PREVIEW_PDFTOPPM = os.environ.get('PREVIEW_PDFTOPPM', 'pdftoppm')
+
+# Media reconciliation (see records/reconcile.py, `manage.py reconcile_media`):
+# orphaned files are moved here, outside MEDIA_ROOT, and purged later
+MEDIA_QUARANTINE_ROOT = os.environ.get('MEDIA_QUARANTINE_ROOT', os.path.join(BASE_DIR, 'var', 'quarantine'))
+MEDIA_GC_CHECKPOINT = os.environ.get('MEDIA_GC_CHECKPOINT', os.path.join(BASE_DIR, 'var', 'media-gc.json'))
+MEDIA_GC_MIN_AGE_HOURS = 24  # younger files may belong to an uncommitted transaction
+MEDIA_GC_RATE = 100  # files moved or deleted per second
+
+# User search settings
+USER_SEARCH_MIN_SIMILARITY = float(os.environ.get('USER_SEARCH_MIN_SIMILARITY', 0.3))
+USER_SEARCH_MAX_RESULTS = int(os.environ.get('USER_SEARCH_MAX_RESULTS', 50))
+
+# Warn when serialization triggers lazy loads (see core/eager.py)
+EAGER_LOADING_DEBUG = bool(int(os.environ.get('EAGER_LOADING_DEBUG', DEBUG)))
+
+# Caching: local memory by default; CACHE_BACKEND/CACHE_LOCATION select e.g.
+# django.core.cache.backends.filebased.FileBasedCache with a directory, or
+# django.core.cache.backends.redis.RedisCache with a redis:// URL
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'healthrecords'),
+    }
+}
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 3600))
+
+# Access audit log (see audit/writer.py): events are buffered in-process and
+# inserted in batches by a background thread; the spool file takes batches
+# while the database is failing or slow
+AUDIT_ENABLED = bool(int(os.environ.get('AUDIT_ENABLED', 0 if TESTING else 1)))
+AUDIT_BACKGROUND_FLUSH = bool(int(os.environ.get('AUDIT_BACKGROUND_FLUSH', 0 if TESTING else 1)))
+AUDIT_FLUSH_INTERVAL_MS = int(os.environ.get('AUDIT_FLUSH_INTERVAL_MS', 500))
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 500))
+AUDIT_BUFFER_CAPACITY = int(os.environ.get('AUDIT_BUFFER_CAPACITY', 50000))
+AUDIT_SPOOL_PATH = os.environ.get(
+    'AUDIT_SPOOL_PATH', os.path.join(TEST_SPOOL_DIR or os.path.join(BASE_DIR, 'var'), 'audit-spool.ndjson')
+)
+AUDIT_USE_COPY = True
+
+# In-app notifications (see core/notifications.py): annotation and assignment
+# notifications are queued after commit and inserted in deduplicated batches
+NOTIFICATION_BACKGROUND_FLUSH = bool(int(os.environ.get('NOTIFICATION_BACKGROUND_FLUSH', 0 if TESTING else 1)))
+NOTIFICATION_FLUSH_INTERVAL_MS = int(os.environ.get('NOTIFICATION_FLUSH_INTERVAL_MS', 1000))
+NOTIFICATION_BATCH_SIZE = int(os.environ.get('NOTIFICATION_BATCH_SIZE', 500))
+NOTIFICATION_SPOOL_PATH = os.environ.get(
+    'NOTIFICATION_SPOOL_PATH',
+    os.path.join(TEST_SPOOL_DIR or os.path.join(BASE_DIR, 'var'), 'notification-spool.ndjson')
+)
+
+# Real-time push (see core/push.py): server-sent events at PUSH_PATH when
+# served over ASGI, fanned out across workers with PostgreSQL LISTEN/NOTIFY
+PUSH_ENABLED = bool(int(os.environ.get('PUSH_ENABLED', 1)))
+PUSH_PATH = os.environ.get('PUSH_PATH', '/api/events/')
+PUSH_CHANNEL = os.environ.get('PUSH_CHANNEL', 'healthrecords_push')
+PUSH_HEARTBEAT_SECONDS = float(os.environ.get('PUSH_HEARTBEAT_SECONDS', 25))
+PUSH_QUEUE_SIZE = int(os.environ.get('PUSH_QUEUE_SIZE', 32))
+
+# /readyz fails when a SELECT 1 on the primary takes longer than this
+HEALTH_DB_TIMEOUT_MS = float(os.environ.get('HEALTH_DB_TIMEOUT_MS', 250))
@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from core.health import healthz, readyz
 from .admin_config import configure_admin_site
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -28,8 +29,12 @@ from rest_framework_simplejwt.views import (
 configure_admin_site()
 
 urlpatterns = [
+    path('healthz', healthz, name='healthz'),
+    path('readyz', readyz, name='readyz'),
     path('admin/', admin.site.urls),
     path('api/', include('core.urls')),
+    path('api/', include('records.urls')),
+    path('api/', include('audit.urls')),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 ]
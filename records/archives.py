@@ -0,0 +1,146 @@
+"""
+Streaming ZIP archives of a patient's attachments.
+
+The attachments, their records and blobs are read in one query before the
+response starts. The archive is then written by ``zipfile`` to a sink that
+only keeps what was written since the generator last yielded, so neither the
+archive nor a temporary file ever exists: memory stays at about one block.
+Without a seekable output, ``zipfile`` puts each entry's CRC and sizes in a
+data descriptor after its bytes, and uses ZIP64 for entries of 4 GiB or more.
+Formats that are compressed already (PDF, JPEG, PNG, ...) are stored as they
+are; deflating them again costs CPU and saves nothing. Cold blobs are
+decompressed on the way (``records.tiering``).
+"""
+import mimetypes
+import os
+import re
+import zipfile
+
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from core.models import User
+
+from . import tiering
+from .models import AttachmentBlob, RecordAttachment
+
+ARCHIVE_BLOCK_SIZE = 64 * 1024
+
+STORED_TYPES = {
+    'application/pdf', 'application/zip', 'application/gzip', 'application/x-7z-compressed',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/heic', 'image/avif',
+}
+UNSAFE_NAME_RE = re.compile(r'[\x00-\x1f/\\:*?"<>|]+')
+
+
+class _Sink:
+    """Write-only file collecting what ``zipfile`` writes until it is drained."""
+
+    def __init__(self):
+        self.blocks = []
+
+    def write(self, data):
+        self.blocks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        blocks, self.blocks = self.blocks, []
+        return blocks
+
+
+def chart_attachments(records):
+    """Attachments of ``records`` (a queryset of record ids) with their record and blob, in chart order."""
+    return list(
+        RecordAttachment.objects
+        .select_related('record', 'blob')
+        .only('filename', 'content_type', 'created_at', 'record__record_id', 'record__created_at',
+              'blob__file', 'blob__size', 'blob__tier', 'blob__cold_file', 'blob__codec')
+        .filter(record__in=records)
+        .order_by('record__created_at', 'record_id', 'created_at', 'id')
+    )
+
+
+def compress_type(attachment):
+    content_type = attachment.content_type or mimetypes.guess_type(attachment.filename)[0]
+    return zipfile.ZIP_STORED if content_type in STORED_TYPES else zipfile.ZIP_DEFLATED
+
+
+def entry_names(attachments):
+    """One unique path per attachment: ``<record id>/<filename>``, numbered on clashes."""
+    seen = set()
+    for attachment in attachments:
+        folder = UNSAFE_NAME_RE.sub('_', attachment.record.record_id).strip('. ') or 'record'
+        stem, extension = os.path.splitext(UNSAFE_NAME_RE.sub('_', attachment.filename).strip() or 'attachment')
+        name, number = f'{folder}/{stem}{extension}', 1
+        while name.lower() in seen:
+            number += 1
+            name = f'{folder}/{stem} ({number}){extension}'
+        seen.add(name.lower())
+        yield name
+
+
+def read_blob(blob):
+    if blob.tier == AttachmentBlob.Tier.COLD:
+        yield from tiering.read(blob)
+        return
+    with blob.file.open('rb') as source:
+        yield from source.chunks(ARCHIVE_BLOCK_SIZE)
+
+
+def stream_archive(attachments):
+    """Yield a ZIP archive of ``attachments`` block by block."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for name, attachment in zip(entry_names(attachments), attachments):
+            info = zipfile.ZipInfo(name, timezone.localtime(attachment.created_at).timetuple()[:6])
+            info.compress_type = compress_type(attachment)
+            # Lets zipfile decide on ZIP64 before it writes the local header
+            info.file_size = attachment.blob.size
+            with archive.open(info, 'w') as entry:
+                for block in read_blob(attachment.blob):
+                    entry.write(block)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def archive_response(attachments, filename):
+    response = StreamingHttpResponse(stream_archive(attachments), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
+class AttachmentArchiveMixin:
+    """
+    Adds ``GET <prefix>/attachments/archive/?patient=<id>`` to a health record
+    viewset: every attachment of the patient's records the viewset's
+    ``get_queryset`` allows, as one streamed ZIP. Patients get their own chart
+    without the parameter.
+    """
+
+    @action(detail=False, methods=['get'], url_path='attachments/archive')
+    def attachments_archive(self, request):
+        """Download all attachments of a patient's chart as a ZIP archive"""
+        patient = request.query_params.get('patient', '')
+        if not patient and request.user.role == User.Role.PATIENT:
+            patient = str(request.user.pk)
+        if not patient.isdigit():
+            return Response({'error': 'patient must be a user id'}, status=status.HTTP_400_BAD_REQUEST)
+
+        records = (
+            self.get_queryset().select_related(None).prefetch_related(None)
+            .filter(patient_id=int(patient)).values('pk')
+        )
+        attachments = chart_attachments(records)
+        if not attachments:
+            raise Http404('No attachments')
+        return archive_response(attachments, f'chart-{patient}-attachments-{timezone.now():%Y%m%d}.zip')
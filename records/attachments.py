@@ -0,0 +1,197 @@
+"""
+Content-addressed, deduplicated attachment storage.
+
+Attachment bytes are stored once per SHA-256 digest as an ``AttachmentBlob``
+(``blobs/ab/cd/<digest>``); each ``RecordAttachment`` points at a blob and
+``ref_count`` counts them. An upload is hashed while it is copied to a
+temporary file in ``UPLOAD_BLOCK_SIZE`` blocks (uploads Django already
+spooled to disk are hashed in place), so it is read once and never held in
+memory. Known content is discarded and only gains a reference; new content is
+moved into place, not copied.
+
+With object storage (``STORAGES['attachments']`` backed by
+``core.objectstore.S3Storage``) a client can also upload straight to the
+bucket with a presigned URL whose signature covers the SHA-256
+(``records/uploads.py``). The object is staged under a name of its own upload
+session; ``attach_stored()`` copies it to the blob's name inside the store,
+or only takes a reference when the content is already stored.
+
+Blobs moved to the cold tier (``records/tiering.py``) have no ``file``;
+uploading the same bytes again stores them hot and drops the cold copy.
+
+Removing the last attachment of a blob leaves the row at ``ref_count`` 0 and,
+after commit, ``release_blob()`` deletes the file and the row under the row
+lock. An upload of the same bytes takes the same lock, so it either revives
+the blob first or finds it gone and stores the file again.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import previews, tiering
+from .models import AttachmentBlob, HealthRecord, RecordAttachment, attachment_blob_path
+
+
+class MovableFile(File):
+    """A file on local disk; ``FileSystemStorage`` moves it instead of copying."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def hash_stream(stream, output=None):
+    """Return ``(sha256 hexdigest, size)`` of ``stream``, copying it to ``output`` on the way."""
+    hasher = hashlib.sha256()
+    size = 0
+    for block in iter(lambda: stream.read(settings.UPLOAD_BLOCK_SIZE), b''):
+        hasher.update(block)
+        size += len(block)
+        if output is not None:
+            output.write(block)
+    return hasher.hexdigest(), size
+
+
+def _store(blob, path):
+    storage = blob.file.storage
+    name = attachment_blob_path(blob, blob.sha256)
+    if storage.exists(name):
+        # Left behind by an interrupted release; the name says it holds the same bytes
+        storage.delete(name)
+    with open(path, 'rb') as source:
+        blob.file.name = storage.save(name, MovableFile(source, name=name))
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def blob_storage():
+    return AttachmentBlob._meta.get_field('file').storage
+
+
+def direct_storage():
+    """The attachment storage if it issues presigned URLs, else ``None``."""
+    storage = blob_storage()
+    return storage if getattr(storage, 'presigned_urls', False) else None
+
+
+def _place(blob, path, staged):
+    if staged is None:
+        _store(blob, path)
+    else:
+        name = attachment_blob_path(blob, blob.sha256)
+        blob.file.name = blob.file.storage.copy(staged, name)
+
+
+def _reference(sha256, size, path, staged=None):
+    """
+    Lock or create the blob for ``sha256`` and take a reference. The bytes are
+    in the local file ``path``, which is consumed, or in the storage object
+    ``staged``, which is left for the caller to delete.
+    """
+    blob = AttachmentBlob.objects.select_for_update().filter(pk=sha256).first()
+    if blob is None:
+        try:
+            with transaction.atomic():
+                # A concurrent upload of the same bytes waits here for ours to commit
+                blob = AttachmentBlob.objects.create(sha256=sha256, size=size)
+        except IntegrityError:
+            blob = AttachmentBlob.objects.select_for_update().get(pk=sha256)
+        else:
+            _place(blob, path, staged)
+            blob.save(update_fields=['file'])
+    elif blob.tier == AttachmentBlob.Tier.COLD:
+        # The content is wanted again: keep the fresh copy instead of the compressed one
+        _place(blob, path, staged)
+        tiering.mark_hot(blob)
+    elif blob.ref_count == 0 and not blob.file.storage.exists(blob.file.name):
+        # Released and deleted after this row was read; put the bytes back
+        _place(blob, path, staged)
+    if path is not None:
+        _discard(path)
+    AttachmentBlob.objects.filter(pk=sha256).update(ref_count=F('ref_count') + 1)
+    return blob
+
+
+def _touch(record_id):
+    # The record's representation lists its attachments; move its ETag/Last-Modified
+    HealthRecord.objects.filter(pk=record_id).update(updated_at=timezone.now())
+
+
+def _attach(record, sha256, size, filename, content_type, user, path=None, staged=None):
+    with transaction.atomic():
+        blob = _reference(sha256, size, path, staged)
+        attachment = RecordAttachment.objects.create(
+            record=record, blob=blob, filename=os.path.basename(filename),
+            content_type=content_type, size=size, uploaded_by=user
+        )
+        _touch(attachment.record_id)
+    return attachment
+
+
+def attach_path(record, path, sha256, size, filename, content_type='', user=None):
+    """
+    Attach the local file at ``path`` whose digest is already known (e.g. a
+    completed upload session). The file is moved into the blob store or
+    deleted when the content is already stored.
+    """
+    return _attach(record, sha256, size, filename, content_type, user, path=path)
+
+
+def attach_stored(record, staged, sha256, size, filename, content_type='', user=None):
+    """
+    Attach the object ``staged`` in the attachment storage, which the store
+    verified to hash to ``sha256``. The caller deletes ``staged`` afterwards.
+    """
+    return _attach(record, sha256, size, filename, content_type, user, staged=staged)
+
+
+def attach(record, file, filename=None, content_type=None, user=None):
+    """Hash ``file`` (an uploaded or any Django ``File``) while spooling it and attach it to ``record``."""
+    filename = filename or file.name
+    content_type = content_type if content_type is not None else getattr(file, 'content_type', '') or ''
+    file.seek(0)
+    if hasattr(file, 'temporary_file_path'):
+        # Django already spooled the upload to disk: hash it there and move it
+        sha256, size = hash_stream(file)
+        return attach_path(record, file.temporary_file_path(), sha256, size, filename, content_type, user)
+
+    spool = tempfile.NamedTemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR, suffix='.upload', delete=False)
+    try:
+        with spool:
+            sha256, size = hash_stream(file, spool)
+        return attach_path(record, spool.name, sha256, size, filename, content_type, user)
+    finally:
+        _discard(spool.name)
+
+
+def release_blob(sha256):
+    """Delete the blob and its file if no attachment references it any more."""
+    with transaction.atomic():
+        blob = AttachmentBlob.objects.select_for_update().filter(pk=sha256, ref_count=0).first()
+        if blob is None:
+            return False
+        if blob.file:
+            blob.file.delete(save=False)
+        if blob.cold_file:
+            blob.cold_file.delete(save=False)
+        tiering.discard_cached(sha256)
+        previews.discard(sha256)
+        blob.delete()
+    return True
+
+
+def forget_attachment(attachment):
+    """Drop ``attachment``'s reference; called from its post_delete signal."""
+    AttachmentBlob.objects.filter(pk=attachment.blob_id).update(ref_count=F('ref_count') - 1)
+    _touch(attachment.record_id)
+    transaction.on_commit(lambda: release_blob(attachment.blob_id))
@@ -0,0 +1,286 @@
+"""
+Compression for the cold attachment tier (see records/tiering.py).
+
+Like ``rendering.py`` this module imports nothing from Django. Files are
+stored as a single zstd frame with a content checksum. PNG scans get a
+lossless pre-step first: their pixels are already deflate-compressed, which
+zstd cannot shrink further. So the IDAT stream is inflated, and the zlib
+parameters that reproduce it byte for byte are searched for. The cold file
+then holds the raw pixel data (which zstd compresses far better), the other
+chunks verbatim, and those parameters. Decompression re-deflates on the fly
+and emits the original IDAT chunks, CRCs included: the bytes are identical,
+so the blob's SHA-256 still holds. PNGs whose stream zlib cannot reproduce
+(other encoders, unusual settings) are stored as plain zstd.
+
+Re-deflating relies on the zlib build producing the same output. The zlib
+version is recorded, and on a different runtime the output is rebuilt and
+checked against the original SHA-256 before any byte is returned.
+"""
+import hashlib
+import json
+import struct
+import tempfile
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # Optional: install the "cold" extra
+    zstandard = None
+
+ZSTD = 'zstd'
+PNG = 'png+zstd'
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_MAGIC = b'PNGZ\x01'
+BLOCK_SIZE = 64 * 1024
+# Bytes of the IDAT stream that candidate zlib settings must reproduce before a full check
+PROBE_SIZE = 256 * 1024
+# Chunks after the image data are kept in memory while decoding
+MAX_POSTLUDE = 1024 * 1024
+
+
+class CodecError(Exception):
+    """A cold file is corrupt or cannot be reproduced on this runtime."""
+
+
+def available():
+    return zstandard is not None
+
+
+def _require():
+    if zstandard is None:
+        raise RuntimeError('zstandard is required for the cold tier')
+
+
+def _png_layout(source):
+    """
+    ``(prelude end, [(offset, length)] of IDAT data, postlude start)`` or
+    ``None`` if ``source`` is not a PNG with one contiguous run of IDAT chunks.
+    """
+    source.seek(0)
+    if source.read(8) != PNG_SIGNATURE:
+        return None
+    position, idat, prelude_end, postlude_start = 8, [], None, None
+    while True:
+        header = source.read(8)
+        if len(header) < 8:
+            return None
+        length, kind = struct.unpack('>I4s', header)
+        if kind == b'IDAT':
+            if postlude_start is not None:
+                return None
+            if prelude_end is None:
+                prelude_end = position
+            idat.append((position + 8, length))
+        elif idat and postlude_start is None:
+            postlude_start = position
+        position += 12 + length
+        source.seek(position)
+        if kind == b'IEND':
+            break
+    if not idat or source.read(1):
+        return None
+    return prelude_end, idat, postlude_start
+
+
+def _read_idat(source, idat):
+    for offset, length in idat:
+        source.seek(offset)
+        while length:
+            block = source.read(min(BLOCK_SIZE, length))
+            if not block:
+                raise CodecError('Truncated PNG')
+            length -= len(block)
+            yield block
+
+
+def _inflate(source, idat):
+    inflater = zlib.decompressobj()
+    for block in _read_idat(source, idat):
+        raw = inflater.decompress(block)
+        if raw:
+            yield raw
+    if not inflater.eof or inflater.unused_data:
+        raise CodecError('IDAT is not a single zlib stream')
+
+
+def _candidates(header):
+    """zlib settings to try, the level hinted by the stream header first."""
+    wbits = (header[0] >> 4) + 8
+    hinted = {0: [1], 1: [2, 3, 4, 5], 2: [6], 3: [9, 7, 8]}[header[1] >> 6]
+    levels = hinted + [level for level in range(10) if level not in hinted]
+    return [
+        {'level': level, 'wbits': wbits, 'memlevel': memlevel, 'strategy': strategy}
+        for level in levels
+        for memlevel in (8, 9)
+        for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED)
+    ]
+
+
+def _deflater(params):
+    return zlib.compressobj(params['level'], zlib.DEFLATED, params['wbits'], params['memlevel'], params['strategy'])
+
+
+def _reproduces(path, idat, params, limit=None):
+    """Whether ``params`` re-deflate the inflated IDAT data into the original stream."""
+    with open(path, 'rb') as source, open(path, 'rb') as compressed:
+        return _compare(source, _read_idat(compressed, idat), idat, params, limit)
+
+
+def _compare(source, original, idat, params, limit):
+    expected = bytearray()
+    deflater = _deflater(params)
+    fed = 0
+
+    def matches(output):
+        while len(expected) < len(output):
+            block = next(original, None)
+            if block is None:
+                return False
+            expected.extend(block)
+        same = expected[:len(output)] == output
+        del expected[:len(output)]
+        return same
+
+    for raw in _inflate(source, idat):
+        if not matches(deflater.compress(raw)):
+            return False
+        fed += len(raw)
+        if limit is not None and fed >= limit:
+            return True
+    if not matches(deflater.flush()):
+        return False
+    return not expected and next(original, None) is None
+
+
+def _png_params(path, idat):
+    with open(path, 'rb') as source:
+        source.seek(idat[0][0])
+        header = source.read(2)
+    if len(header) < 2 or (header[0] * 256 + header[1]) % 31 or header[0] & 0x0f != 8:
+        return None
+    try:
+        for params in _candidates(header):
+            # Most settings diverge within the first few blocks
+            if _reproduces(path, idat, params, PROBE_SIZE) and _reproduces(path, idat, params):
+                return params
+    except (zlib.error, CodecError):
+        return None
+    return None
+
+
+def compress(source_path, output, level=12, threads=0):
+    """Write ``source_path`` compressed to the binary file ``output``; returns the codec used."""
+    _require()
+    compressor = zstandard.ZstdCompressor(level=level, write_checksum=True, threads=threads)
+    with open(source_path, 'rb') as source:
+        layout = _png_layout(source)
+        params = _png_params(source_path, layout[1]) if layout else None
+        if params is not None and (layout[2] is None or _size(source) - layout[2] <= MAX_POSTLUDE):
+            prelude_end, idat, postlude_start = layout
+            source.seek(0)
+            prelude = source.read(prelude_end)
+            postlude = b''
+            if postlude_start is not None:
+                source.seek(postlude_start)
+                postlude = source.read()
+            source.seek(0)
+            digest = hashlib.sha256()
+            for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+                digest.update(block)
+            meta = json.dumps({
+                **params, 'zlib': zlib.ZLIB_RUNTIME_VERSION, 'chunks': [length for _, length in idat],
+                'prelude': len(prelude), 'postlude': len(postlude),
+                'sha256': digest.hexdigest(), 'size': _size(source),
+            }).encode()
+            with compressor.stream_writer(output, closefd=False) as writer:
+                writer.write(PNG_MAGIC + struct.pack('>I', len(meta)) + meta + prelude + postlude)
+                for raw in _inflate(source, idat):
+                    writer.write(raw)
+            return PNG
+        source.seek(0)
+        compressor.copy_stream(source, output, read_size=BLOCK_SIZE)
+    return ZSTD
+
+
+def _size(source):
+    position = source.tell()
+    size = source.seek(0, 2)
+    source.seek(position)
+    return size
+
+
+def _read_exactly(reader, size):
+    data = bytearray()
+    while len(data) < size:
+        block = reader.read(size - len(data))
+        if not block:
+            raise CodecError('Truncated cold file')
+        data.extend(block)
+    return bytes(data)
+
+
+def _png_blocks(reader, meta):
+    chunks = iter(meta['chunks'])
+    prelude = _read_exactly(reader, meta['prelude'])
+    postlude = _read_exactly(reader, meta['postlude'])
+    yield prelude
+    deflater = _deflater(meta)
+    pending = bytearray()
+    current = next(chunks, None)
+
+    def full_chunks():
+        nonlocal current
+        blocks = []
+        while current is not None and len(pending) >= current:
+            data = bytes(pending[:current])
+            del pending[:current]
+            blocks.append(struct.pack('>I', current) + b'IDAT' + data
+                          + struct.pack('>I', zlib.crc32(data, zlib.crc32(b'IDAT'))))
+            current = next(chunks, None)
+        return b''.join(blocks)
+
+    for raw in iter(lambda: reader.read(BLOCK_SIZE), b''):
+        pending.extend(deflater.compress(raw))
+        if block := full_chunks():
+            yield block
+    pending.extend(deflater.flush())
+    if block := full_chunks():
+        yield block
+    if current is not None or pending:
+        raise CodecError('Re-deflated image data does not match the stored chunk layout')
+    yield postlude
+
+
+def _verified(blocks, sha256, size):
+    """Spool ``blocks`` and return them only if they hash to ``sha256``."""
+    digest = hashlib.sha256()
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+        for block in blocks:
+            digest.update(block)
+            spool.write(block)
+        if digest.hexdigest() != sha256 or spool.tell() != size:
+            raise CodecError('PNG cannot be reproduced with this zlib build')
+        spool.seek(0)
+        yield from iter(lambda: spool.read(BLOCK_SIZE), b'')
+
+
+def decompress(source, codec, block_size=BLOCK_SIZE):
+    """Yield the original bytes of the cold file ``source`` (a binary file object)."""
+    _require()
+    decompressor = zstandard.ZstdDecompressor()
+    try:
+        if codec == ZSTD:
+            yield from decompressor.read_to_iter(source, read_size=block_size, write_size=block_size)
+            return
+        if codec != PNG:
+            raise CodecError(f'Unknown codec {codec!r}')
+        with decompressor.stream_reader(source, read_size=block_size, closefd=False) as reader:
+            if _read_exactly(reader, len(PNG_MAGIC)) != PNG_MAGIC:
+                raise CodecError('Not a packed PNG')
+            meta = json.loads(_read_exactly(reader, struct.unpack('>I', _read_exactly(reader, 4))[0]))
+            blocks = _png_blocks(reader, meta)
+            if meta['zlib'] != zlib.ZLIB_RUNTIME_VERSION:
+                blocks = _verified(blocks, meta['sha256'], meta['size'])
+            yield from blocks
+    except zstandard.ZstdError as e:
+        raise CodecError(f'Corrupt cold file: {e}')
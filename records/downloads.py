@@ -0,0 +1,75 @@
+"""Permission-checked attachment downloads for record viewsets."""
+import os
+
+from django.conf import settings
+from django.http import Http404
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from core.downloads import serve_file
+
+from . import previews, tiering
+from .models import AttachmentBlob, RecordAttachment
+
+
+class AttachmentDownloadMixin:
+    """
+    ``GET <record>/attachments/<id>/download/`` (and ``<record>/download/`` for
+    the latest attachment): one indexed query through the viewset's own scoping
+    decides access and finds the blob, then ``core.downloads`` serves or
+    offloads the file under the attachment's own name (cold blobs are
+    decompressed by ``records.tiering``). ``.../preview/`` serves
+    the rendered thumbnail, or a placeholder until the preview worker is done.
+    """
+
+    def _attachment(self, pk, attachment_id=None):
+        records = self.get_queryset().select_related(None).prefetch_related(None).filter(pk=pk).values('pk')
+        attachments = (
+            RecordAttachment.objects
+            .select_related('blob', 'record')
+            .only('filename', 'record__id', 'record__patient_id', 'blob__file', 'blob__size',
+                  'blob__tier', 'blob__cold_file', 'blob__codec')
+            .filter(record__in=records)
+        )
+        if attachment_id is None:
+            attachment = attachments.order_by('-created_at', '-id').first()
+        else:
+            attachment = attachments.filter(pk=attachment_id).first()
+        if attachment is None:
+            raise Http404('No attachment')
+        return attachment
+
+    def _serve_attachment(self, request, attachment):
+        # Attributes the download to the record's patient in the access log
+        self.audited_object = attachment.record
+        if attachment.blob.tier == AttachmentBlob.Tier.COLD:
+            return tiering.serve(request, attachment.blob, attachment.filename)
+        return serve_file(request, attachment.blob.file, filename=attachment.filename)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Download the record's latest attachment (supports Range and conditional requests)"""
+        return self._serve_attachment(request, self._attachment(pk))
+
+    @action(detail=True, methods=['get'], url_path=r'attachments/(?P<attachment_id>[0-9]+)/download')
+    def download_attachment(self, request, pk=None, attachment_id=None):
+        """Download one attachment of the record"""
+        return self._serve_attachment(request, self._attachment(pk, attachment_id))
+
+    @action(detail=True, methods=['get'], url_path=r'attachments/(?P<attachment_id>[0-9]+)/preview')
+    def preview_attachment(self, request, pk=None, attachment_id=None):
+        """Thumbnail (?size=thumb) or first-page preview (?size=page) of an image or PDF attachment"""
+        size = request.query_params.get('size', 'thumb')
+        if size not in settings.PREVIEW_SIZES:
+            return Response(
+                {'error': f"size must be one of: {', '.join(settings.PREVIEW_SIZES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        attachment = self._attachment(pk, attachment_id)
+        self.audited_object = attachment.record
+        preview = previews.cached_preview(attachment.blob_id, size)
+        if preview is None:
+            return previews.placeholder(attachment.blob_id, attachment.filename, size)
+        stem = os.path.splitext(attachment.filename)[0]
+        return serve_file(request, preview, filename=f'{stem}-{size}.jpg', as_attachment=False)
@@ -0,0 +1,198 @@
+"""
+Streaming NDJSON/CSV export of health records.
+
+Records are read through a server-side cursor (``iterator(chunk_size=...)``)
+with doctors, patients, annotations and attachments eager-loaded per chunk,
+and written to a ``StreamingHttpResponse`` as they are produced, so peak
+memory depends on the chunk size rather than on the number of exported
+records.
+"""
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .models import DoctorAnnotation, RecordAttachment
+
+EXPORT_CHUNK_SIZE = 2000
+# Flush the response buffer once it grows past this many characters
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+CSV_COLUMNS = (
+    'id', 'record_id', 'record_type', 'title', 'description',
+    'patient_id', 'patient_username', 'doctor_id', 'doctor_username',
+    'doctor_specialization', 'attachments', 'annotation_count', 'annotations',
+    'created_at', 'updated_at',
+)
+
+
+def export_queryset(queryset):
+    """Eager-load everything a record row needs."""
+    return queryset.select_related('patient', 'doctor').prefetch_related(None).prefetch_related(
+        Prefetch(
+            'annotations',
+            queryset=DoctorAnnotation.objects.select_related('doctor').order_by('created_at')
+        ),
+        Prefetch(
+            'attachments',
+            queryset=RecordAttachment.objects.only('id', 'record_id', 'blob_id', 'filename', 'size', 'created_at')
+        )
+    )
+
+
+def record_row(record):
+    doctor = record.doctor
+    return {
+        'id': record.id,
+        'record_id': record.record_id,
+        'record_type': record.record_type,
+        'title': record.title,
+        'description': record.description,
+        'patient': {
+            'id': record.patient_id,
+            'username': record.patient.username,
+        },
+        'doctor': {
+            'id': doctor.id,
+            'username': doctor.username,
+            'specialization': doctor.specialization,
+        } if doctor else None,
+        'attachments': [
+            {
+                'id': attachment.id,
+                'filename': attachment.filename,
+                'size': attachment.size,
+                'sha256': attachment.blob_id,
+            }
+            for attachment in record.attachments.all()
+        ],
+        'annotations': [
+            {
+                'id': annotation.id,
+                'doctor_id': annotation.doctor_id,
+                'doctor_name': f"{annotation.doctor.first_name} {annotation.doctor.last_name}",
+                'content': annotation.content,
+                'created_at': annotation.created_at,
+            }
+            for annotation in record.annotations.all()
+        ],
+        'created_at': record.created_at,
+        'updated_at': record.updated_at,
+    }
+
+
+def _buffered(lines):
+    """Group small lines into larger chunks to cut per-write overhead."""
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    encoder = DjangoJSONEncoder()
+    for record in export_queryset(queryset).iterator(chunk_size=chunk_size):
+        yield encoder.encode(record_row(record)) + '\n'
+
+
+def stream_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    line = io.StringIO()
+    writer = csv.writer(line)
+
+    def render(values):
+        line.seek(0)
+        line.truncate()
+        writer.writerow(values)
+        return line.getvalue()
+
+    yield render(CSV_COLUMNS)
+    for record in export_queryset(queryset).iterator(chunk_size=chunk_size):
+        row = record_row(record)
+        doctor = row['doctor'] or {}
+        yield render([
+            row['id'], row['record_id'], row['record_type'], row['title'], row['description'],
+            row['patient']['id'], row['patient']['username'],
+            doctor.get('id', ''), doctor.get('username', ''), doctor.get('specialization') or '',
+            ';'.join(attachment['filename'] for attachment in row['attachments']), len(row['annotations']),
+            json.dumps(row['annotations'], cls=DjangoJSONEncoder),
+            row['created_at'].isoformat(), row['updated_at'].isoformat(),
+        ])
+
+
+def export_response(queryset, fmt, filename):
+    stream = stream_csv(queryset) if fmt == 'csv' else stream_ndjson(queryset)
+    response = StreamingHttpResponse(_buffered(stream), content_type=EXPORT_FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def _parse_bound(value, end=False):
+    """Parse a date or datetime query parameter; dates cover the whole day."""
+    day = parse_date(value)
+    if day is not None:
+        parsed = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f'Invalid date: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class RecordExportMixin:
+    """
+    Adds ``GET <prefix>/export/?output=ndjson|csv`` to a health record viewset.
+
+    The export honours the viewset's ``get_queryset`` access rules and can be
+    narrowed with ``patient``, ``doctor``, ``start`` and ``end`` parameters.
+    """
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream records as NDJSON or CSV"""
+        fmt = request.query_params.get('output', 'ndjson')
+        if fmt not in EXPORT_FORMATS:
+            return Response(
+                {'error': f'output must be one of: {", ".join(EXPORT_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        records = self.get_queryset()
+        try:
+            for param in ('patient', 'doctor'):
+                value = request.query_params.get(param)
+                if value:
+                    if not value.isdigit():
+                        raise ValueError(f'{param} must be a user id')
+                    records = records.filter(**{f'{param}_id': int(value)})
+            if request.query_params.get('start'):
+                records = records.filter(created_at__gte=_parse_bound(request.query_params['start']))
+            if request.query_params.get('end'):
+                records = records.filter(created_at__lt=_parse_bound(request.query_params['end'], end=True))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        filename = f"health-records-{timezone.now():%Y%m%d-%H%M%S}"
+        return export_response(records.order_by('created_at', 'id'), fmt, filename)
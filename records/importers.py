@@ -0,0 +1,232 @@
+"""
+Streaming bulk import of historical health records.
+
+Rows are read lazily from NDJSON or CSV files, validated a batch at a time
+against in-memory patient/doctor lookup tables and written with either
+``bulk_create`` or PostgreSQL ``COPY``. Only one batch is held in memory, so
+memory use does not grow with the size of the input file.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.models import User
+from .models import HealthRecord
+from .summaries import rebuild_patient_summaries
+
+COPY_COLUMNS = (
+    'record_id', 'record_type', 'title', 'description',
+    'patient_id', 'doctor_id', 'created_at', 'updated_at',
+)
+LOOKUP_KEYS = ('username', 'email', 'id')
+
+
+def detect_format(path):
+    return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+
+def read_rows(path, fmt, checkpoint=None):
+    """
+    Yield ``(row_number, data, error, position)`` for every input row.
+
+    ``position`` is the checkpoint to persist once the row has been handled;
+    NDJSON resumes by seeking to a byte offset, CSV by skipping rows.
+    """
+    checkpoint = checkpoint or {}
+    row_number = checkpoint.get('rows', 0)
+
+    if fmt == 'ndjson':
+        offset = checkpoint.get('offset', 0)
+        with open(path, 'rb') as source:
+            source.seek(offset)
+            for raw in source:
+                offset += len(raw)
+                row_number += 1
+                position = {'rows': row_number, 'offset': offset}
+                line = raw.strip()
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError as e:
+                    yield row_number, None, f'Invalid JSON: {e}', position
+                    continue
+                if not isinstance(data, dict):
+                    yield row_number, None, 'Each line must be a JSON object', position
+                    continue
+                yield row_number, data, None, position
+        return
+
+    with open(path, newline='', encoding='utf-8') as source:
+        reader = csv.DictReader(source)
+        for index, data in enumerate(reader, start=1):
+            if index <= row_number:
+                continue
+            yield index, data, None, {'rows': index}
+
+
+@contextmanager
+def preserve_timestamps():
+    """Let bulk_create keep the legacy created_at/updated_at values."""
+    fields = [HealthRecord._meta.get_field(name) for name in ('created_at', 'updated_at')]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class RecordImporter:
+    """Validate and load batches of raw import rows."""
+
+    def __init__(self, patient_key='username', doctor_key='username', method='bulk', source_tag=''):
+        if patient_key not in LOOKUP_KEYS or doctor_key not in LOOKUP_KEYS:
+            raise ValueError(f'Lookup keys must be one of {", ".join(LOOKUP_KEYS)}')
+        if method == 'copy' and connection.vendor != 'postgresql':
+            raise ValueError('COPY loading requires PostgreSQL')
+        self.patient_key = patient_key
+        self.doctor_key = doctor_key
+        self.method = method
+        self.source_tag = source_tag
+        self.record_types = {}
+        for value, label in HealthRecord.RecordType.choices:
+            self.record_types[value.lower()] = value
+            self.record_types[label.lower()] = value
+        self.patients = self._lookup(User.Role.PATIENT, patient_key)
+        self.doctors = self._lookup(User.Role.DOCTOR, doctor_key)
+
+    @staticmethod
+    def _normalize(key, value):
+        value = str(value or '').strip()
+        return value.lower() if key == 'email' else value
+
+    def _lookup(self, role, key):
+        rows = User.objects.filter(role=role).values_list(key, 'id')
+        return {
+            self._normalize(key, value): pk
+            for value, pk in rows.iterator(chunk_size=20000) if value
+        }
+
+    def _timestamp(self, value):
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f'Invalid timestamp: {value}')
+            parsed = datetime.combine(day, time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed, dt_timezone.utc)
+        return parsed
+
+    def validate(self, row_number, data, now=None):
+        """Return ``(record_values, errors)`` for a single raw row."""
+        errors = {}
+        values = {}
+
+        patient = self._normalize(self.patient_key, data.get('patient'))
+        values['patient_id'] = self.patients.get(patient)
+        if values['patient_id'] is None:
+            errors['patient'] = f'Unknown patient: {patient or "(empty)"}'
+
+        doctor = self._normalize(self.doctor_key, data.get('doctor'))
+        values['doctor_id'] = self.doctors.get(doctor) if doctor else None
+        if doctor and values['doctor_id'] is None:
+            errors['doctor'] = f'Unknown doctor: {doctor}'
+
+        record_type = str(data.get('record_type') or HealthRecord.RecordType.CONSULTATION)
+        values['record_type'] = self.record_types.get(record_type.strip().lower())
+        if values['record_type'] is None:
+            errors['record_type'] = f'Invalid record type: {record_type}'
+
+        title = str(data.get('title') or '').strip()
+        if not title:
+            errors['title'] = 'Title is required'
+        elif len(title) > HealthRecord._meta.get_field('title').max_length:
+            errors['title'] = 'Title is too long'
+        values['title'] = title
+        values['description'] = str(data.get('description') or '')
+
+        record_id = str(data.get('record_id') or '').strip()
+        if not record_id:
+            # Deterministic ids make re-running the same file idempotent
+            digest = hashlib.sha1(f'{self.source_tag}:{row_number}'.encode()).hexdigest()
+            record_id = f'IMP{digest[:24]}'
+        if len(record_id) > HealthRecord._meta.get_field('record_id').max_length:
+            errors['record_id'] = 'Record id is too long'
+        values['record_id'] = record_id
+
+        try:
+            now = now or timezone.now()
+            values['created_at'] = self._timestamp(data.get('created_at')) or now
+            values['updated_at'] = self._timestamp(data.get('updated_at')) or values['created_at']
+        except ValueError as e:
+            errors['created_at'] = str(e)
+
+        return (None if errors else values), errors
+
+    def existing_record_ids(self, record_ids):
+        return set(
+            HealthRecord.objects.filter(record_id__in=record_ids).values_list('record_id', flat=True)
+        )
+
+    def load(self, rows):
+        """Write a list of validated record dicts in a single transaction."""
+        if not rows:
+            return
+        with transaction.atomic():
+            if self.method == 'copy':
+                self._copy(rows)
+            else:
+                with preserve_timestamps():
+                    HealthRecord.objects.bulk_create(
+                        [HealthRecord(**values) for values in rows],
+                        batch_size=len(rows)
+                    )
+            # Neither loader sends post_save, so refresh the touched patients' summaries
+            rebuild_patient_summaries({values['patient_id'] for values in rows})
+
+    def _copy(self, rows):
+        # Strings are always quoted so empty descriptions stay empty strings;
+        # FORCE_NULL turns the quoted empty doctor_id back into NULL.
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+        for values in rows:
+            writer.writerow([values[column] for column in COPY_COLUMNS])
+        buffer.seek(0)
+        columns = ', '.join(COPY_COLUMNS)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {HealthRecord._meta.db_table} ({columns}) FROM STDIN '
+                f'WITH (FORMAT csv, FORCE_NULL (doctor_id))',
+                buffer
+            )
+
+
+def load_checkpoint(path, source):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as handle:
+        checkpoint = json.load(handle)
+    if checkpoint.get('source') != source:
+        return {}
+    return checkpoint
+
+
+def save_checkpoint(path, source, position, totals):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as handle:
+        json.dump({'source': source, **position, 'totals': totals}, handle)
+    os.replace(tmp_path, path)
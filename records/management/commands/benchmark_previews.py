@@ -0,0 +1,122 @@
+import os
+import random
+import shutil
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from records import previews, rendering
+from records.models import AttachmentBlob, PreviewJob
+
+# Synthetic blobs get fake digests with this prefix so they are easy to remove
+PREFIX = 'bench'
+SOURCE_DIR = 'bench-previews'
+
+
+class Command(BaseCommand):
+    """Measure preview pipeline throughput on a synthetic backlog"""
+
+    help = ('Queue preview jobs for a backlog of synthetic scans and PDFs, drain it with the worker pool '
+            'and report files per second and the projected time for the whole backlog')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=100_000, help='Backlog size')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Only render this many jobs and extrapolate to --files')
+        parser.add_argument('--sources', type=int, default=20,
+                            help='Distinct source files the backlog points at')
+        parser.add_argument('--megapixels', type=float, default=12, help='Size of the synthetic scans')
+        parser.add_argument('--processes', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic jobs and previews')
+        parser.add_argument('--cleanup', action='store_true', help='Delete synthetic data and exit')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self._cleanup()
+            return
+        if not rendering.available():
+            raise CommandError('Pillow is not installed; install the "previews" extra')
+        if options['files'] < 1 or options['sources'] < 1:
+            raise CommandError('--files and --sources must be positive')
+
+        self._cleanup(quiet=True)
+        sources = self._sources(options['sources'], options['megapixels'])
+        # Each blob gets its own digest (and so its own cached outputs) but
+        # shares one of a few source files, which keeps seeding cheap
+        started = time.perf_counter()
+        batch = 5000
+        for start in range(0, options['files'], batch):
+            stop = min(start + batch, options['files'])
+            blobs = AttachmentBlob.objects.bulk_create([
+                AttachmentBlob(sha256=f'{PREFIX}{i:059d}', file=sources[i % len(sources)][0], size=0, ref_count=1)
+                for i in range(start, stop)
+            ])
+            PreviewJob.objects.bulk_create([
+                PreviewJob(blob=blob, kind=sources[i % len(sources)][1])
+                for i, blob in enumerate(blobs, start)
+            ])
+        self.stdout.write(f'Queued {options["files"]:,} jobs in {time.perf_counter() - started:.1f}s')
+
+        limit = options['limit']
+        if limit:
+            # Park everything past the sample so the worker drains only the sample
+            parked = PreviewJob.objects.filter(
+                blob__sha256__startswith=PREFIX, blob__sha256__gte=f'{PREFIX}{limit:059d}'
+            ).update(status=PreviewJob.Status.DONE)
+            self.stdout.write(f'Rendering a sample of {options["files"] - parked:,} jobs')
+
+        started = time.perf_counter()
+        stats = previews.run_worker(
+            processes=options['processes'], batch_size=options['batch_size'], drain=True
+        )
+        elapsed = time.perf_counter() - started
+        rendered = stats['done'] + stats['failed'] + stats['retried']
+        rate = rendered / elapsed if elapsed else 0
+        self.stdout.write(
+            f'Rendered {stats["done"]:,} ({stats["failed"]} failed, {stats["retried"]} to retry) '
+            f'in {elapsed:.1f}s: {rate:,.1f} files/s with '
+            f'{options["processes"] or settings.PREVIEW_WORKER_PROCESSES or os.cpu_count()} processes'
+        )
+        if rate:
+            hours = options['files'] / rate / 3600
+            self.stdout.write(self.style.SUCCESS(f'Projected time for {options["files"]:,} files: {hours:.2f}h'))
+
+        if not options['keep']:
+            self._cleanup(quiet=True)
+
+    def _sources(self, count, megapixels):
+        """Noisy JPEG scans and, when pdftoppm is available, one-page PDFs."""
+        from PIL import Image
+
+        directory = default_storage.path(SOURCE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+        height = width * 3 // 4
+        with_pdf = shutil.which(settings.PREVIEW_PDFTOPPM) is not None
+        rng = random.Random(0)
+        sources = []
+        for index in range(count):
+            # Noise at a lower resolution, scaled up: compresses like a real scan
+            image = Image.frombytes('L', (width // 8, height // 8), rng.randbytes(width // 8 * (height // 8)))
+            image = image.resize((width, height)).convert('RGB')
+            if with_pdf and index % 2:
+                name = f'{SOURCE_DIR}/source-{index}.pdf'
+                image.save(default_storage.path(name), 'PDF', resolution=150)
+                sources.append((name, PreviewJob.Kind.PDF))
+            else:
+                name = f'{SOURCE_DIR}/source-{index}.jpg'
+                image.save(default_storage.path(name), 'JPEG', quality=90)
+                sources.append((name, PreviewJob.Kind.IMAGE))
+        return sources
+
+    def _cleanup(self, quiet=False):
+        blobs = AttachmentBlob.objects.filter(sha256__startswith=PREFIX)
+        for sha256 in blobs.values_list('sha256', flat=True).iterator():
+            previews.discard(sha256)
+        deleted, _ = blobs.delete()
+        shutil.rmtree(default_storage.path(SOURCE_DIR), ignore_errors=True)
+        if not quiet:
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} synthetic rows'))
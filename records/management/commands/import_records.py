@@ -0,0 +1,136 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from records.importers import (
+    RecordImporter,
+    detect_format,
+    load_checkpoint,
+    read_rows,
+    save_checkpoint,
+)
+
+
+class Command(BaseCommand):
+    """Stream historical health records from NDJSON or CSV into the database"""
+
+    help = (
+        'Bulk import health records from an NDJSON or CSV export. Each row needs '
+        'patient, title and optionally doctor, record_type, description, record_id, '
+        'created_at and updated_at. Progress is checkpointed after every batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON or CSV file to import')
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help='Input format (detected from the file extension by default)')
+        parser.add_argument('--method', choices=['bulk', 'copy'], default='bulk',
+                            help='Load with bulk_create or PostgreSQL COPY')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows validated and committed per transaction')
+        parser.add_argument('--patient-key', choices=['username', 'email', 'id'], default='username',
+                            help='User column the patient value refers to')
+        parser.add_argument('--doctor-key', choices=['username', 'email', 'id'], default='username',
+                            help='User column the doctor value refers to')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint.json)')
+        parser.add_argument('--rejects', help='Rejected rows file (default: <path>.rejects.ndjson)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore any existing checkpoint and start from the first row')
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.isfile(path):
+            raise CommandError(f'File not found: {path}')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        fmt = options['format'] or detect_format(path)
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint.json'
+        rejects_path = options['rejects'] or f'{path}.rejects.ndjson'
+        checkpoint = {} if options['restart'] else load_checkpoint(checkpoint_path, path)
+        totals = checkpoint.get('totals', {'imported': 0, 'rejected': 0, 'skipped': 0})
+
+        try:
+            importer = RecordImporter(
+                patient_key=options['patient_key'],
+                doctor_key=options['doctor_key'],
+                method=options['method'],
+                source_tag=os.path.basename(path),
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if checkpoint:
+            self.stdout.write(f'Resuming after row {checkpoint["rows"]}')
+        self.stdout.write(
+            f'Loaded {len(importer.patients)} patients and {len(importer.doctors)} doctors'
+        )
+
+        started = time.perf_counter()
+        self.imported_before = totals['imported']
+        batch, rejects, consumed, position = [], [], 0, None
+        with open(rejects_path, 'a' if checkpoint else 'w') as rejects_file:
+            for row_number, data, error, position in read_rows(path, fmt, checkpoint):
+                consumed += 1
+                if error:
+                    rejects.append({'row': row_number, 'errors': {'row': error}})
+                else:
+                    values, errors = importer.validate(row_number, data, now=timezone.now())
+                    if errors:
+                        rejects.append({'row': row_number, 'errors': errors, 'data': data})
+                    else:
+                        batch.append((row_number, values, data))
+
+                if consumed >= options['batch_size']:
+                    self._flush(importer, batch, rejects, rejects_file, totals)
+                    save_checkpoint(checkpoint_path, path, position, totals)
+                    self._progress(totals, started)
+                    batch, rejects, consumed = [], [], 0
+
+            if consumed:
+                self._flush(importer, batch, rejects, rejects_file, totals)
+                save_checkpoint(checkpoint_path, path, position, totals)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {totals["imported"]} imported, {totals["skipped"]} already present, '
+            f'{totals["rejected"]} rejected in {elapsed:.1f}s'
+        ))
+        if totals['rejected']:
+            self.stdout.write(f'Rejected rows written to {rejects_path}')
+
+    def _flush(self, importer, batch, rejects, rejects_file, totals):
+        existing = importer.existing_record_ids([values['record_id'] for _, values, _ in batch])
+        rows, seen = [], set()
+        for row_number, values, data in batch:
+            record_id = values['record_id']
+            if record_id in existing:
+                # Already loaded, e.g. by a run that stopped before checkpointing
+                totals['skipped'] += 1
+            elif record_id in seen:
+                rejects.append({
+                    'row': row_number,
+                    'errors': {'record_id': f'Duplicate record id in input: {record_id}'},
+                    'data': data,
+                })
+            else:
+                seen.add(record_id)
+                rows.append(values)
+
+        importer.load(rows)
+        totals['imported'] += len(rows)
+
+        for reject in rejects:
+            rejects_file.write(json.dumps(reject, default=str) + '\n')
+        rejects_file.flush()
+        totals['rejected'] += len(rejects)
+
+    def _progress(self, totals, started):
+        elapsed = time.perf_counter() - started
+        rate = (totals['imported'] - self.imported_before) / elapsed if elapsed else 0
+        self.stdout.write(
+            f'  {totals["imported"]} imported, {totals["rejected"]} rejected ({rate:,.0f} rows/s)'
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import User
+from records.summaries import rebuild_summaries
+
+
+class Command(BaseCommand):
+    """Recompute denormalized record counters and patient summaries"""
+
+    help = ('Rebuild HealthRecord annotation counters and PatientRecordSummary rows, '
+            'one transaction per batch of patients')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, action='append', dest='patients',
+                            help='Only rebuild this patient id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Patients per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        patient_ids = options['patients'] or list(
+            User.objects.filter(role=User.Role.PATIENT).order_by('pk').values_list('pk', flat=True)
+        )
+        summaries = 0
+        for start in range(0, len(patient_ids), options['batch_size']):
+            summaries += rebuild_summaries(patient_ids[start:start + options['batch_size']])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {summaries} summaries for {len(patient_ids)} patients'
+        ))
@@ -0,0 +1,79 @@
+import signal
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from records.reconcile import purge_quarantine, reconcile
+
+
+class Command(BaseCommand):
+    """Find files in MEDIA_ROOT that no row refers to"""
+
+    help = ('Walk MEDIA_ROOT from the last checkpoint, check files in batches against every FileField '
+            'and quarantine (or delete) orphans older than --min-age-hours. Bound each run with '
+            '--max-files/--max-seconds, or run it continuously with --loop.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--action', choices=['report', 'quarantine', 'delete'], default='quarantine')
+        parser.add_argument('--min-age-hours', type=float, default=None,
+                            help='Leave younger files alone (default MEDIA_GC_MIN_AGE_HOURS)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Files checked per query')
+        parser.add_argument('--rate', type=float, default=None,
+                            help='Files moved or deleted per second, 0 for no limit (default MEDIA_GC_RATE)')
+        parser.add_argument('--max-files', type=int, default=None, help='Stop after scanning about this many files')
+        parser.add_argument('--max-seconds', type=float, default=None, help='Stop after this long')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start a new pass')
+        parser.add_argument('--loop', action='store_true', help='Keep running, pausing between runs')
+        parser.add_argument('--pause', type=float, default=60, help='Seconds between runs with --loop')
+        parser.add_argument('--purge-quarantine-days', type=int, default=None,
+                            help='Also delete quarantined files older than this many days')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        if options['loop'] and not (options['max_files'] or options['max_seconds']):
+            # Each run should end now and then so the loop can save progress and pause
+            options['max_seconds'] = 300
+        min_age = options['min_age_hours']
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write('Stopping after the current run...')
+            stop.set()
+
+        if options['loop']:
+            signal.signal(signal.SIGTERM, request_stop)
+            signal.signal(signal.SIGINT, request_stop)
+
+        restart = options['restart']
+        while True:
+            started = time.perf_counter()
+            stats = reconcile(
+                action=options['action'],
+                min_age=timedelta(hours=min_age) if min_age is not None else None,
+                batch_size=options['batch_size'], rate=options['rate'],
+                max_files=options['max_files'], max_seconds=options['max_seconds'],
+                restart=restart, log=self._log if options['verbosity'] > 1 else None,
+            )
+            restart = False
+            verb = {'report': 'Found', 'quarantine': 'Quarantined', 'delete': 'Deleted'}[options['action']]
+            count, size = (
+                (stats['orphans'], stats['orphan_bytes']) if options['action'] == 'report'
+                else (stats['removed'], stats['removed_bytes'])
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"Scanned {stats['scanned']:,} files in {time.perf_counter() - started:.1f}s; "
+                f"{verb} {count:,} orphans ({size:,} bytes); "
+                + ('pass complete' if stats['finished'] else 'resuming from the checkpoint next time')
+            ))
+            if options['purge_quarantine_days'] is not None:
+                purged = purge_quarantine(options['purge_quarantine_days'])
+                if purged:
+                    self.stdout.write(f"Purged quarantine folders {', '.join(purged)}")
+            if not options['loop'] or stop.wait(options['pause']):
+                break
+
+    def _log(self, name, size):
+        self.stdout.write(f'  {name} ({size:,} bytes)')
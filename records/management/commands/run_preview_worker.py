@@ -0,0 +1,41 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from records import previews, rendering
+
+
+class Command(BaseCommand):
+    """Render queued attachment previews"""
+
+    help = ('Claim preview jobs from the database and render thumbnails in a process pool. '
+            'Run one or more of these next to the web servers; SIGTERM finishes running renders and exits.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Render processes (default PREVIEW_WORKER_PROCESSES, or one per CPU)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Jobs claimed per query (default PREVIEW_BATCH_SIZE)')
+        parser.add_argument('--drain', action='store_true',
+                            help='Exit once the queue is empty instead of polling')
+
+    def handle(self, *args, **options):
+        if not rendering.available():
+            raise CommandError('Pillow is not installed; install the "previews" extra')
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write('Stopping after the running renders...')
+            stop.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        stats = previews.run_worker(
+            processes=options['processes'], batch_size=options['batch_size'],
+            drain=options['drain'], should_stop=stop.is_set
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {stats['done']} previews, {stats['retried']} to retry, {stats['failed']} failed"
+        ))
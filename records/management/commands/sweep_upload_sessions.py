@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from records.uploads import sweep
+
+
+class Command(BaseCommand):
+    """Abort abandoned resumable uploads"""
+
+    help = ('Abort upload sessions past their expiry (UPLOAD_SESSION_TTL_HOURS after the last chunk) '
+            'and delete partial files without an active session. Schedule hourly.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report without deleting anything')
+
+    def handle(self, *args, **options):
+        sessions, files = sweep(dry_run=options['dry_run'])
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {sessions} expired sessions and {files} orphaned partial files'
+        ))
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from records import coldcodec, tiering
+
+
+class Command(BaseCommand):
+    """Move attachment blobs nobody reads any more to the compressed cold tier"""
+
+    help = ('Compress blobs older than --older-than-days (default ATTACHMENT_COLD_AFTER_DAYS) into '
+            "STORAGES['cold_attachments'] and delete their hot copies. With --rehydrate, move cold "
+            'blobs back instead.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None,
+                            help='Only blobs first stored before this many days ago')
+        parser.add_argument('--limit', type=int, default=None, help='Move at most this many blobs')
+        parser.add_argument('--rehydrate', action='store_true', help='Decompress cold blobs back to the hot tier')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be moved')
+
+    def handle(self, *args, **options):
+        if not coldcodec.available():
+            raise CommandError('zstandard is not installed; install the "cold" extra')
+        if options['limit'] is not None and options['limit'] < 1:
+            raise CommandError('--limit must be positive')
+        started = time.perf_counter()
+        stats = tiering.run(
+            older_than_days=options['older_than_days'], limit=options['limit'],
+            rehydrate=options['rehydrate'], dry_run=options['dry_run'],
+            log=self._log if options['verbosity'] > 1 else None,
+        )
+        elapsed = time.perf_counter() - started
+        if options['dry_run']:
+            verb = 'Would rehydrate' if options['rehydrate'] else 'Would tier'
+            self.stdout.write(f"{verb} {stats['blobs']:,} blobs ({stats['bytes']:,} bytes)")
+            return
+        if options['rehydrate']:
+            summary = f"Rehydrated {stats['blobs']:,} blobs ({stats['bytes']:,} bytes) in {elapsed:.1f}s"
+        else:
+            ratio = stats['bytes'] / stats['stored_bytes'] if stats['stored_bytes'] else 0
+            summary = (
+                f"Tiered {stats['blobs']:,} blobs in {elapsed:.1f}s: {stats['bytes']:,} -> "
+                f"{stats['stored_bytes']:,} bytes ({ratio:.2f}x; {stats[coldcodec.PNG]:,} PNG, "
+                f"{stats[coldcodec.ZSTD]:,} zstd)"
+            )
+        if stats['failed']:
+            summary += f"; {stats['failed']:,} failed (see the log)"
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def _log(self, blob):
+        if blob.tier == blob.Tier.COLD:
+            self.stdout.write(f'  {blob.sha256} {blob.size:,} -> {blob.stored_size:,} bytes ({blob.codec})')
+        else:
+            self.stdout.write(f'  {blob.sha256} {blob.size:,} bytes')
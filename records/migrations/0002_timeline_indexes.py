@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctorannotation',
+            index=models.Index(fields=['record', '-created_at'], name='annotations_record_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthrecord',
+            index=models.Index(fields=['patient', '-created_at'], name='records_patient_created_idx'),
+        ),
+    ]
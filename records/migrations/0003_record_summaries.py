@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_summaries(apps, schema_editor):
+    HealthRecord = apps.get_model('records', 'HealthRecord')
+    DoctorAnnotation = apps.get_model('records', 'DoctorAnnotation')
+    PatientRecordSummary = apps.get_model('records', 'PatientRecordSummary')
+
+    counts = DoctorAnnotation.objects.filter(record_id=OuterRef('pk')).order_by().values('record_id')
+    HealthRecord.objects.update(
+        annotation_count=Coalesce(Subquery(counts.annotate(total=Count('pk')).values('total')), 0),
+        last_annotated_at=Subquery(counts.annotate(latest=Max('created_at')).values('latest'))
+    )
+    rows = HealthRecord.objects.order_by().values('patient_id', 'record_type').annotate(
+        record_count=Count('pk'),
+        latest_record_at=Max('created_at')
+    )
+    PatientRecordSummary.objects.bulk_create([PatientRecordSummary(**row) for row in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0002_timeline_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthrecord',
+            name='annotation_count',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='healthrecord',
+            name='last_annotated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='PatientRecordSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('record_type', models.CharField(choices=[('CONSULTATION', 'Consultation'), ('LAB_RESULT', 'Lab Result'), ('PRESCRIPTION', 'Prescription'), ('VACCINATION', 'Vaccination'), ('OTHER', 'Other')], max_length=20)),
+                ('record_count', models.PositiveIntegerField(default=0)),
+                ('latest_record_at', models.DateTimeField(blank=True, null=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='record_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Patient Record Summary',
+                'verbose_name_plural': 'Patient Record Summaries',
+                'db_table': 'patient_record_summaries',
+                'constraints': [models.UniqueConstraint(fields=('patient', 'record_type'), name='unique_patient_record_type')],
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,124 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:41
+
+import hashlib
+import os
+
+import django.db.models.deletion
+import records.models
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+BLOCK_SIZE = 64 * 1024
+
+
+class MovableFile(File):
+    # FileSystemStorage moves files that have a temporary path instead of copying them
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def move_attachments(apps, schema_editor):
+    """Turn each record's single attachment into a RecordAttachment on a shared blob."""
+    HealthRecord = apps.get_model('records', 'HealthRecord')
+    AttachmentBlob = apps.get_model('records', 'AttachmentBlob')
+    RecordAttachment = apps.get_model('records', 'RecordAttachment')
+
+    records = HealthRecord.objects.exclude(attachments='').exclude(attachments__isnull=True)
+    for record_id, patient_id, name in records.values_list('id', 'patient_id', 'attachments').iterator():
+        if not default_storage.exists(name):
+            continue
+        hasher = hashlib.sha256()
+        size = 0
+        with default_storage.open(name, 'rb') as source:
+            for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+                hasher.update(block)
+                size += len(block)
+        sha = hasher.hexdigest()
+
+        blob = AttachmentBlob.objects.filter(sha256=sha).first()
+        if blob is None:
+            blob = AttachmentBlob(sha256=sha, size=size, ref_count=0)
+            with default_storage.open(name, 'rb') as source:
+                blob.file.save(sha, MovableFile(source, name=name), save=False)
+            blob.save()
+            if default_storage.exists(name):
+                default_storage.delete(name)
+        else:
+            # Same bytes already stored: keep one copy
+            default_storage.delete(name)
+        AttachmentBlob.objects.filter(pk=sha).update(ref_count=models.F('ref_count') + 1)
+        RecordAttachment.objects.create(
+            record_id=record_id, blob_id=sha, filename=os.path.basename(name),
+            size=size, uploaded_by_id=patient_id
+        )
+
+
+def restore_attachments(apps, schema_editor):
+    """Point each record back at the file of its latest attachment."""
+    HealthRecord = apps.get_model('records', 'HealthRecord')
+    RecordAttachment = apps.get_model('records', 'RecordAttachment')
+
+    latest = {}
+    for record_id, name in RecordAttachment.objects.order_by('created_at').values_list('record_id', 'blob__file'):
+        latest[record_id] = name
+    for record_id, name in latest.items():
+        HealthRecord.objects.filter(pk=record_id).update(attachments=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0005_upload_sessions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('file', models.FileField(max_length=255, upload_to=records.models.attachment_blob_path)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Attachment Blob',
+                'verbose_name_plural': 'Attachment Blobs',
+                'db_table': 'attachment_blobs',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecordAttachment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=255)),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('size', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='references', to='records.attachmentblob')),
+                # The reverse accessor would clash with HealthRecord.attachments until it is removed below
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='records.healthrecord')),
+                ('uploaded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='uploaded_attachments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Record Attachment',
+                'verbose_name_plural': 'Record Attachments',
+                'db_table': 'record_attachments',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['record', 'created_at'], name='attachments_record_created_idx')],
+            },
+        ),
+        migrations.RunPython(move_attachments, restore_attachments),
+        migrations.RemoveField(
+            model_name='healthrecord',
+            name='attachments',
+        ),
+        migrations.AlterField(
+            model_name='recordattachment',
+            name='record',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='records.healthrecord'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0006_record_attachments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PreviewJob',
+            fields=[
+                ('blob', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='preview_job', serialize=False, to='records.attachmentblob')),
+                ('kind', models.CharField(choices=[('image', 'Image'), ('pdf', 'PDF')], max_length=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Preview Job',
+                'verbose_name_plural': 'Preview Jobs',
+                'db_table': 'preview_jobs',
+                'indexes': [models.Index(fields=['status', 'run_after'], name='preview_jobs_status_run_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:55
+
+import records.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0007_preview_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='direct',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='attachmentblob',
+            name='file',
+            field=models.FileField(max_length=255, storage=records.models.attachment_storage, upload_to=records.models.attachment_blob_path),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:03
+
+import records.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0008_direct_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='codec',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='cold_file',
+            field=models.FileField(blank=True, max_length=255, storage=records.models.cold_attachment_storage, upload_to=records.models.cold_blob_path),
+        ),
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='stored_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='tier',
+            field=models.CharField(choices=[('HOT', 'Hot'), ('COLD', 'Cold')], default='HOT', max_length=4),
+        ),
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='tiered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='attachmentblob',
+            index=models.Index(fields=['tier', 'created_at'], name='blobs_tier_created_idx'),
+        ),
+    ]
@@ -1,13 +1,32 @@
-from django.db import models
+from django.db import models, transaction
 from core.models import User
-import os
 from django.core.exceptions import ValidationError
+from django.core.files.storage import storages
+from django.utils import timezone
 import time
+import uuid
 
 def health_record_file_path(instance, filename):
-    # Generate file path: health_records/id/filename
+    # Former upload_to of HealthRecord.attachments, still referenced by migration 0001
     return f'health_records/{instance.id}/{filename}'
 
+def attachment_blob_path(instance, filename):
+    # Content-addressed: blobs/ab/cd/abcd... (sharded to keep directories small)
+    sha = instance.sha256
+    return f'blobs/{sha[:2]}/{sha[2:4]}/{sha}'
+
+def attachment_storage():
+    # STORAGES['attachments']: local files or an S3-compatible bucket
+    return storages['attachments']
+
+def cold_blob_path(instance, filename):
+    sha = instance.sha256
+    return f'cold/{sha[:2]}/{sha[2:4]}/{sha}.zst'
+
+def cold_attachment_storage():
+    # STORAGES['cold_attachments']: compressed blobs of the cold tier (records/tiering.py)
+    return storages['cold_attachments']
+
 class HealthRecord(models.Model):
     class RecordType(models.TextChoices):
         CONSULTATION = 'CONSULTATION', 'Consultation'
@@ -43,20 +62,22 @@ class HealthRecord(models.Model):
         null=True,
         blank=True
     )
-    attachments = models.FileField(
-        upload_to=health_record_file_path,
-        blank=True,
-        null=True,
-        help_text='Upload images or PDF files'
-    )
+    # Maintained by records.summaries; never written by regular saves
+    annotation_count = models.PositiveIntegerField(default=0, db_default=0, editable=False)
+    last_annotated_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    COUNTER_FIELDS = ('annotation_count', 'last_annotated_at')
+
     class Meta:
         db_table = 'health_records'
         verbose_name = 'Health Record'
         verbose_name_plural = 'Health Records'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['patient', '-created_at'], name='records_patient_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.record_id} - {self.title} - {self.patient.username}"
@@ -71,14 +92,16 @@ class HealthRecord(models.Model):
         # Generate record_id if it doesn't exist
         if not self.record_id:
             self.record_id = f"HR{int(time.time())}"
-        super().save(*args, **kwargs)
-
-    def delete(self, *args, **kwargs):
-        # Delete the attachment file when the record is deleted
-        if self.attachments:
-            if os.path.isfile(self.attachments.path):
-                os.remove(self.attachments.path)
-        super().delete(*args, **kwargs)
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # Counters are updated in place with F() expressions; don't overwrite them with stale values
+            skipped = set(self.COUNTER_FIELDS) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        # Summary counters are maintained by post_save handlers in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
 class DoctorAnnotation(models.Model):
     record = models.ForeignKey(
@@ -101,6 +124,186 @@ class DoctorAnnotation(models.Model):
         verbose_name = 'Doctor Annotation'
         verbose_name_plural = 'Doctor Annotations'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['record', '-created_at'], name='annotations_record_created_idx'),
+        ]
 
     def __str__(self):
         return f"Annotation by {self.doctor.username} on {self.record.title}"
+
+    def save(self, *args, **kwargs):
+        # The record's annotation counter is updated by a post_save handler in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+class PatientRecordSummary(models.Model):
+    """Per-patient record count and latest record time for one record type."""
+    patient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='record_summaries'
+    )
+    record_type = models.CharField(max_length=20, choices=HealthRecord.RecordType.choices)
+    record_count = models.PositiveIntegerField(default=0)
+    latest_record_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'patient_record_summaries'
+        verbose_name = 'Patient Record Summary'
+        verbose_name_plural = 'Patient Record Summaries'
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'record_type'], name='unique_patient_record_type'),
+        ]
+
+    def __str__(self):
+        return f"{self.patient_id} - {self.record_type}: {self.record_count}"
+
+class AttachmentBlob(models.Model):
+    """File content stored once per SHA-256; ``ref_count`` counts the attachments using it (records/attachments.py)."""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    class Tier(models.TextChoices):
+        HOT = 'HOT', 'Hot'
+        COLD = 'COLD', 'Cold'
+
+    # Empty while the blob is in the cold tier
+    file = models.FileField(upload_to=attachment_blob_path, storage=attachment_storage, max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    tier = models.CharField(max_length=4, choices=Tier.choices, default=Tier.HOT)
+    cold_file = models.FileField(
+        upload_to=cold_blob_path, storage=cold_attachment_storage, max_length=255, blank=True
+    )
+    codec = models.CharField(max_length=20, blank=True)
+    stored_size = models.PositiveBigIntegerField(null=True, blank=True)
+    tiered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'attachment_blobs'
+        verbose_name = 'Attachment Blob'
+        verbose_name_plural = 'Attachment Blobs'
+        indexes = [
+            models.Index(fields=['tier', 'created_at'], name='blobs_tier_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count} refs)"
+
+class RecordAttachment(models.Model):
+    """A file attached to a health record; the bytes live in a shared ``AttachmentBlob``."""
+    record = models.ForeignKey(
+        HealthRecord,
+        on_delete=models.CASCADE,
+        related_name='attachments'
+    )
+    blob = models.ForeignKey(
+        AttachmentBlob,
+        on_delete=models.PROTECT,
+        related_name='references'
+    )
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()
+    uploaded_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        related_name='uploaded_attachments',
+        null=True,
+        blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'record_attachments'
+        verbose_name = 'Record Attachment'
+        verbose_name_plural = 'Record Attachments'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['record', 'created_at'], name='attachments_record_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} on record {self.record_id}"
+
+class PreviewJob(models.Model):
+    """Durable queue entry for rendering a blob's thumbnails (records/previews.py)."""
+    class Kind(models.TextChoices):
+        IMAGE = 'image', 'Image'
+        PDF = 'pdf', 'PDF'
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        RUNNING = 'RUNNING', 'Running'
+        DONE = 'DONE', 'Done'
+        FAILED = 'FAILED', 'Failed'
+
+    # Previews are keyed by content, so identical uploads share one job
+    blob = models.OneToOneField(
+        AttachmentBlob,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='preview_job'
+    )
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'preview_jobs'
+        verbose_name = 'Preview Job'
+        verbose_name_plural = 'Preview Jobs'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='preview_jobs_status_run_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} preview of {self.blob_id} - {self.status}"
+
+class UploadSession(models.Model):
+    """A resumable attachment upload; bytes live in a partial file until completed (records/uploads.py)."""
+    class Status(models.TextChoices):
+        ACTIVE = 'ACTIVE', 'Active'
+        COMPLETED = 'COMPLETED', 'Completed'
+        ABORTED = 'ABORTED', 'Aborted'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    record = models.ForeignKey(
+        HealthRecord,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    # Sent straight to object storage with a presigned URL instead of in chunks
+    direct = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.ACTIVE)
+    expires_at = models.DateTimeField()
+    # Set while a chunk streams in, so no other chunk writes meanwhile
+    leased_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'upload_sessions'
+        verbose_name = 'Upload Session'
+        verbose_name_plural = 'Upload Sessions'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='uploads_status_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size}) - {self.status}"
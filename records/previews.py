@@ -0,0 +1,244 @@
+"""
+Background thumbnails and first-page previews for attachments.
+
+Adding an image or PDF attachment inserts a ``PreviewJob`` row in the same
+transaction, so the request never renders anything and no job is lost if a
+worker is down. ``python manage.py run_preview_worker`` claims pending jobs in
+batches with ``SELECT ... FOR UPDATE SKIP LOCKED`` (several workers can share
+the table), renders them in a process pool (``records/rendering.py``) and
+marks them done. Failed renders are retried with exponential backoff up to
+``PREVIEW_MAX_ATTEMPTS``; jobs left running by a crashed worker are reclaimed
+after ``PREVIEW_JOB_TIMEOUT`` seconds.
+
+Outputs are cached on disk by content hash, one JPEG per ``PREVIEW_SIZES``
+entry, under ``previews/ab/cd/<sha256>-<size>.jpg`` in the media storage;
+identical uploads share them and they are deleted with the blob.
+"""
+import logging
+import multiprocessing
+import os
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.html import escape
+
+from . import rendering, tiering
+from .models import AttachmentBlob, PreviewJob
+
+logger = logging.getLogger(__name__)
+
+# What serve_file() needs from a stored file
+PreviewFile = namedtuple('PreviewFile', 'name path')
+
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{side}" height="{side}" viewBox="0 0 100 100">'
+    '<rect width="100" height="100" fill="#e5e7eb"/>'
+    '<text x="50" y="55" font-family="sans-serif" font-size="14" text-anchor="middle" fill="#6b7280">{label}</text>'
+    '</svg>'
+)
+
+KINDS = {
+    '.jpg': PreviewJob.Kind.IMAGE,
+    '.jpeg': PreviewJob.Kind.IMAGE,
+    '.png': PreviewJob.Kind.IMAGE,
+    '.pdf': PreviewJob.Kind.PDF,
+}
+
+
+def preview_kind(filename):
+    return KINDS.get(os.path.splitext(filename)[1].lower())
+
+
+def preview_name(sha256, size):
+    return f'previews/{sha256[:2]}/{sha256[2:4]}/{sha256}-{size}.jpg'
+
+
+def enqueue(blob_id, filename):
+    """Queue previews for a blob unless it is not previewable or already queued."""
+    kind = preview_kind(filename)
+    if kind is not None:
+        PreviewJob.objects.bulk_create([PreviewJob(blob_id=blob_id, kind=kind)], ignore_conflicts=True)
+
+
+def cached_preview(sha256, size):
+    """The rendered preview of ``sha256``, or ``None`` while it is not ready."""
+    name = preview_name(sha256, size)
+    path = default_storage.path(name)
+    return PreviewFile(name, path) if os.path.exists(path) else None
+
+
+def placeholder(sha256, filename, size):
+    """
+    Response shown until the preview is rendered. A job marked done whose
+    output has gone missing (cache cleared) is queued again.
+    """
+    status = PreviewJob.objects.filter(pk=sha256).values_list('status', flat=True).first()
+    if status == PreviewJob.Status.DONE:
+        PreviewJob.objects.filter(pk=sha256).update(
+            status=PreviewJob.Status.PENDING, run_after=timezone.now(), attempts=0, updated_at=timezone.now()
+        )
+        status = PreviewJob.Status.PENDING
+    state = {
+        PreviewJob.Status.PENDING: 'pending',
+        PreviewJob.Status.RUNNING: 'pending',
+        PreviewJob.Status.FAILED: 'failed',
+    }.get(status, 'unavailable')
+
+    side = settings.PREVIEW_SIZES[size]
+    label = escape(os.path.splitext(filename)[1].lstrip('.').upper() or 'FILE')
+    response = HttpResponse(PLACEHOLDER_SVG.format(side=side, label=label), content_type='image/svg+xml')
+    response['X-Preview-Status'] = state
+    response['Cache-Control'] = 'no-store'
+    if state == 'pending':
+        response['Retry-After'] = str(settings.PREVIEW_POLL_INTERVAL * 2)
+    return response
+
+
+def discard(sha256):
+    """Delete the rendered previews of a blob."""
+    for size in settings.PREVIEW_SIZES:
+        try:
+            os.remove(default_storage.path(preview_name(sha256, size)))
+        except FileNotFoundError:
+            pass
+
+
+def claim(limit, now=None):
+    """
+    Lock up to ``limit`` runnable jobs, mark them running and return
+    ``(sha256, kind, blob file name)`` for each.
+    """
+    now = now or timezone.now()
+    stale = now - timedelta(seconds=settings.PREVIEW_JOB_TIMEOUT)
+    runnable = (
+        Q(status=PreviewJob.Status.PENDING, run_after__lte=now)
+        | Q(status=PreviewJob.Status.RUNNING, locked_at__lt=stale)
+    )
+    with transaction.atomic():
+        jobs = list(
+            PreviewJob.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(runnable)
+            .order_by('run_after')
+            .values_list('blob_id', 'kind', 'blob__file')[:limit]
+        )
+        if jobs:
+            PreviewJob.objects.filter(pk__in=[job[0] for job in jobs]).update(
+                status=PreviewJob.Status.RUNNING, locked_at=now, attempts=F('attempts') + 1,
+                updated_at=now
+            )
+    return jobs
+
+
+def complete(sha256s):
+    """Mark successfully rendered jobs done in one query."""
+    if sha256s:
+        PreviewJob.objects.filter(pk__in=sha256s).update(
+            status=PreviewJob.Status.DONE, last_error='', locked_at=None, updated_at=timezone.now()
+        )
+
+
+def fail(sha256, error, permanent=False):
+    """Schedule a retry with exponential backoff, or give up."""
+    now = timezone.now()
+    job = PreviewJob.objects.filter(pk=sha256).only('attempts').first()
+    if job is None:
+        return
+    if permanent or job.attempts >= settings.PREVIEW_MAX_ATTEMPTS:
+        status, run_after = PreviewJob.Status.FAILED, now
+    else:
+        status = PreviewJob.Status.PENDING
+        run_after = now + timedelta(seconds=settings.PREVIEW_RETRY_DELAY * 2 ** (job.attempts - 1))
+    PreviewJob.objects.filter(pk=sha256).update(
+        status=status, run_after=run_after, last_error=str(error)[:2000], locked_at=None, updated_at=now
+    )
+
+
+def release(sha256s):
+    """Put claimed but unfinished jobs back, e.g. when a worker shuts down."""
+    if sha256s:
+        PreviewJob.objects.filter(pk__in=sha256s, status=PreviewJob.Status.RUNNING).update(
+            status=PreviewJob.Status.PENDING, locked_at=None, attempts=F('attempts') - 1,
+            updated_at=timezone.now()
+        )
+
+
+def _source(sha256, name):
+    if not name:
+        # Cold blob: render from the decompressed copy in the read cache
+        return tiering.local_copy(AttachmentBlob.objects.get(pk=sha256))
+    storage = AttachmentBlob._meta.get_field('file').storage
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        # Object storage: the render process downloads it through a presigned URL
+        return storage.url(name, expire=settings.PREVIEW_JOB_TIMEOUT)
+
+
+def _render_args(sha256, kind, name):
+    outputs = [(side, default_storage.path(preview_name(sha256, size)))
+               for size, side in settings.PREVIEW_SIZES.items()]
+    return (_source(sha256, name), kind, outputs,
+            settings.PREVIEW_PDFTOPPM, settings.PREVIEW_RENDER_TIMEOUT)
+
+
+def _record(futures, in_flight, stats):
+    finished = []
+    for future in futures:
+        sha256 = in_flight.pop(future)
+        error = future.exception()
+        if error is None:
+            finished.append(sha256)
+            continue
+        permanent = isinstance(error, rendering.RenderError)
+        logger.warning('Preview of %s failed: %s', sha256, error)
+        fail(sha256, error, permanent)
+        stats['failed' if permanent else 'retried'] += 1
+    complete(finished)
+    stats['done'] += len(finished)
+
+
+def run_worker(processes=None, batch_size=None, drain=False, poll=None, should_stop=lambda: False):
+    """
+    Render queued previews until ``should_stop()`` (or, with ``drain``, until
+    the queue is empty). Returns a ``Counter`` of done/retried/failed jobs.
+    """
+    processes = processes or settings.PREVIEW_WORKER_PROCESSES or os.cpu_count()
+    batch_size = batch_size or settings.PREVIEW_BATCH_SIZE
+    poll = settings.PREVIEW_POLL_INTERVAL if poll is None else poll
+    # Keep every process busy while the next batch is claimed
+    capacity = max(batch_size, processes * 2)
+    stats = Counter()
+    in_flight = {}
+
+    # spawn: children must not inherit database connections or the audit writer thread
+    pool = ProcessPoolExecutor(
+        processes, mp_context=multiprocessing.get_context('spawn'),
+        max_tasks_per_child=settings.PREVIEW_TASKS_PER_CHILD
+    )
+    try:
+        while not should_stop():
+            if len(in_flight) <= capacity // 2:
+                for sha256, kind, name in claim(min(batch_size, capacity - len(in_flight))):
+                    in_flight[pool.submit(rendering.render, *_render_args(sha256, kind, name))] = sha256
+            if not in_flight:
+                if drain:
+                    break
+                connection.close_if_unusable_or_obsolete()
+                time.sleep(poll)
+                continue
+            done, _ = wait(in_flight, timeout=poll, return_when=FIRST_COMPLETED)
+            _record(done, in_flight, stats)
+    finally:
+        # Renders already running finish; queued ones go back to the table
+        pool.shutdown(cancel_futures=True)
+        release([sha256 for future, sha256 in in_flight.items() if future.cancelled()])
+        _record([future for future in in_flight if not future.cancelled()], in_flight, stats)
+    return stats
@@ -0,0 +1,215 @@
+"""
+Reconciling ``MEDIA_ROOT`` with the database.
+
+Files can outlive their rows: a transaction that stored a blob and then
+rolled back, a crash between deleting a blob row and its file, previews of
+deleted blobs, or files written by older releases (``health_records/<id>/``).
+``reconcile()`` walks the media tree with ``os.scandir`` in a stable,
+sorted order and checks files in batches against every ``FileField`` in the
+project (one ``IN`` query per field and batch) plus the previews derived from
+blobs. Orphans are moved to ``MEDIA_QUARANTINE_ROOT`` (or deleted) at a
+limited rate.
+
+Progress is saved to a checkpoint file after every batch, so a run can stop
+at any time (``max_files``/``max_seconds``) and the next one resumes after the
+last checked path; a multi-terabyte volume is covered over many short runs.
+Files younger than ``min_age`` are never touched, since they may belong to a
+transaction that has not committed yet, and each orphan is re-checked just
+before it is moved.
+"""
+import json
+import os
+import shutil
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from .models import AttachmentBlob
+
+PREVIEW_PREFIX = 'previews/'
+
+
+class RateLimiter:
+    """Sleep so that ``tick()`` is called at most ``rate`` times per second (0: unlimited)."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = time.monotonic()
+
+    def tick(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if now < self.next_at:
+            time.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as checkpoint:
+            return json.load(checkpoint)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_checkpoint(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f'{path}.tmp'
+    with open(partial, 'w') as checkpoint:
+        json.dump(state, checkpoint)
+    os.replace(partial, path)
+
+
+def _walk(root, parts, after, excluded):
+    try:
+        with os.scandir(os.path.join(root, *parts)) as entries:
+            # Sorted, so that a saved position identifies everything already checked
+            entries = sorted(entries, key=lambda entry: entry.name)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for entry in entries:
+        path = parts + (entry.name,)
+        if after is not None and path < after[:len(path)]:
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            if entry.path not in excluded:
+                # Only the directories on the checkpoint's own path are partially done
+                yield from _walk(root, path, after if after and path == after[:len(path)] else None, excluded)
+        elif entry.is_file(follow_symlinks=False) and (after is None or path > after):
+            yield '/'.join(path), entry
+
+
+def iter_files(root, after=None, exclude=()):
+    """Yield ``(relative name, DirEntry)`` for files under ``root`` in sorted order, after ``after``."""
+    excluded = {os.path.abspath(path) for path in exclude}
+    yield from _walk(os.path.abspath(root), (), tuple(after.split('/')) if after else None, excluded)
+
+
+def file_fields():
+    """``(model, field name)`` of every concrete ``FileField`` in the project."""
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField)
+    ]
+
+
+def referenced(names):
+    """The subset of storage ``names`` that a row still refers to."""
+    names = set(names)
+    found = set()
+    for model, field in file_fields():
+        found.update(model._base_manager.filter(**{f'{field}__in': names}).values_list(field, flat=True))
+
+    # Previews are named after the blob they were rendered from
+    previews = {}
+    for name in names - found:
+        if name.startswith(PREVIEW_PREFIX):
+            previews[name] = os.path.basename(name).rsplit('-', 1)[0]
+    if previews:
+        blobs = set(AttachmentBlob.objects.filter(sha256__in=set(previews.values())).values_list('sha256', flat=True))
+        found.update(name for name, sha256 in previews.items() if sha256 in blobs)
+    return found
+
+
+def _remove(root, name, action, quarantine_root, cutoff):
+    """Move or delete one orphan unless it changed since it was listed."""
+    path = os.path.join(root, name)
+    try:
+        if os.stat(path).st_mtime > cutoff:
+            return False
+        if action == 'delete':
+            os.remove(path)
+        else:
+            target = os.path.join(quarantine_root, timezone.now().strftime('%Y-%m-%d'), name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # A rename when the quarantine is on the same volume
+            shutil.move(path, target)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def reconcile(action='quarantine', min_age=None, batch_size=1000, rate=None,
+              max_files=None, max_seconds=None, restart=False, log=None):
+    """
+    Check the media tree from the saved position onwards. ``action`` is
+    ``'report'``, ``'quarantine'`` or ``'delete'``. Returns counts of scanned
+    and orphaned files, removed files and bytes, and whether the pass finished.
+    """
+    root = settings.MEDIA_ROOT
+    checkpoint_path = settings.MEDIA_GC_CHECKPOINT
+    state = {} if restart else load_checkpoint(checkpoint_path)
+    if not state.get('position'):
+        state = {'position': None, 'pass_started_at': timezone.now().isoformat()}
+    exclude = [settings.MEDIA_QUARANTINE_ROOT, settings.UPLOAD_SESSION_DIR]
+    if min_age is None:
+        min_age = timedelta(hours=settings.MEDIA_GC_MIN_AGE_HOURS)
+    cutoff = (timezone.now() - min_age).timestamp()
+    limiter = RateLimiter(settings.MEDIA_GC_RATE if rate is None else rate)
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    stats = Counter()
+
+    def check(batch):
+        stats['scanned'] += len(batch)
+        candidates = {name: entry for name, entry in batch if entry.stat().st_mtime <= cutoff}
+        orphans = sorted(set(candidates) - referenced(candidates))
+        if orphans and action != 'report':
+            # A reference may have appeared since the first query
+            orphans = sorted(set(orphans) - referenced(orphans))
+        for name in orphans:
+            stats['orphans'] += 1
+            size = candidates[name].stat().st_size
+            stats['orphan_bytes'] += size
+            if log:
+                log(name, size)
+            if action != 'report':
+                limiter.tick()
+                if _remove(root, name, action, settings.MEDIA_QUARANTINE_ROOT, cutoff):
+                    stats['removed'] += 1
+                    stats['removed_bytes'] += size
+        state['position'] = batch[-1][0]
+        save_checkpoint(checkpoint_path, state)
+
+    batch = []
+    finished = True
+    for item in iter_files(root, state['position'], exclude):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            check(batch)
+            batch = []
+            if ((max_files and stats['scanned'] >= max_files)
+                    or (deadline and time.monotonic() >= deadline)):
+                finished = False
+                break
+    if batch:
+        check(batch)
+    if finished:
+        # Start over on the next run
+        save_checkpoint(checkpoint_path, {
+            'position': None, 'last_pass_finished_at': timezone.now().isoformat(),
+            'last_pass_started_at': state.get('pass_started_at'),
+        })
+    stats['finished'] = int(finished)
+    return stats
+
+
+def purge_quarantine(days):
+    """Delete quarantine folders older than ``days`` days; returns their names."""
+    root = settings.MEDIA_QUARANTINE_ROOT
+    oldest = (timezone.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+    try:
+        folders = sorted(entry.name for entry in os.scandir(root) if entry.is_dir(follow_symlinks=False))
+    except FileNotFoundError:
+        return []
+    purged = [name for name in folders if name < oldest]
+    for name in purged:
+        shutil.rmtree(os.path.join(root, name))
+    return purged
@@ -0,0 +1,100 @@
+"""
+Thumbnail rendering for the preview worker pool (see records/previews.py).
+
+This module runs in worker processes started with ``spawn`` and deliberately
+imports nothing from Django. Images are decoded with Pillow, asking the JPEG
+decoder for a reduced-size draft first so a 40-megapixel scan is never fully
+decoded; PDFs have their first page rasterized by poppler's ``pdftoppm`` at
+the largest requested size. Sources given as URLs (attachments in object
+storage) are downloaded to the render's scratch directory first. Outputs are
+written to a temporary name and renamed into place, so readers never see a
+partial file.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import urllib.error
+import urllib.request
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:  # Optional: install the "previews" extra
+    Image = None
+
+
+class RenderError(Exception):
+    """The source cannot be rendered; retrying will not help."""
+
+
+def available():
+    return Image is not None
+
+
+def _fetch(url, timeout, workdir):
+    path = os.path.join(workdir, 'source')
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response, open(path, 'wb') as output:
+            shutil.copyfileobj(response, output)
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            raise RenderError('Source file not found')
+        raise
+    return path
+
+
+def _open_pdf(source, side, pdftoppm, timeout, workdir):
+    prefix = os.path.join(workdir, 'page')
+    try:
+        subprocess.run(
+            [pdftoppm, '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(side), '-png', source, prefix],
+            check=True, capture_output=True, timeout=timeout
+        )
+    except subprocess.CalledProcessError as e:
+        raise RenderError(e.stderr.decode(errors='replace').strip() or 'pdftoppm failed')
+    return Image.open(prefix + '.png')
+
+
+def _open_image(source, side):
+    try:
+        image = Image.open(source)
+    except UnidentifiedImageError:
+        raise RenderError('Unrecognized image format')
+    except Image.DecompressionBombError as e:
+        raise RenderError(str(e))
+    # JPEG decodes directly at 1/2, 1/4 or 1/8 scale when that is still large enough
+    image.draft('RGB', (side, side))
+    return ImageOps.exif_transpose(image)
+
+
+def render(source, kind, outputs, pdftoppm='pdftoppm', timeout=60, quality=80):
+    """
+    Render ``source`` (``kind`` is ``'image'`` or ``'pdf'``) to JPEG files no
+    larger than ``side`` pixels for each ``(side, path)`` in ``outputs``.
+    """
+    if Image is None:
+        raise RuntimeError('Pillow is required to render previews')
+    largest = max(side for side, _ in outputs)
+    with tempfile.TemporaryDirectory() as workdir:
+        if source.startswith(('http://', 'https://')):
+            source = _fetch(source, timeout, workdir)
+        if kind == 'pdf':
+            image = _open_pdf(source, largest, pdftoppm, timeout, workdir)
+        elif kind == 'image':
+            image = _open_image(source, largest)
+        else:
+            raise RenderError(f'Cannot preview {kind} files')
+
+        with image:
+            try:
+                image = image.convert('RGB')
+            except OSError as e:
+                # Truncated or corrupt image data
+                raise RenderError(str(e))
+            # Largest first, so each thumbnail is reduced from the previous one
+            for side, path in sorted(outputs, reverse=True):
+                image.thumbnail((side, side), Image.Resampling.LANCZOS)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                partial = f'{path}.{os.getpid()}.tmp'
+                image.save(partial, 'JPEG', quality=quality, optimize=True)
+                os.replace(partial, path)
@@ -1,6 +1,10 @@
+import re
 from rest_framework import serializers
-from .models import HealthRecord, DoctorAnnotation
+from django.conf import settings
+from .models import HealthRecord, DoctorAnnotation, RecordAttachment, UploadSession
 from django.contrib.auth import get_user_model
+from core.fastserializers import FastSerializer
+from core.fieldsets import SparseFieldsMixin
 from core.serializers import UserProfileSerializer
 
 User = get_user_model()
@@ -10,10 +14,46 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 'role')
 
-class HealthRecordSerializer(serializers.ModelSerializer):
+class DoctorAnnotationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    doctor_name = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DoctorAnnotation
+        fields = ('id', 'content', 'doctor', 'doctor_name', 'created_at', 'updated_at')
+        read_only_fields = ('doctor', 'created_at', 'updated_at')
+        # Relations read by method fields, for the eager-loading plan
+        eager_load = ('doctor',)
+
+    def get_doctor_name(self, obj):
+        return f"{obj.doctor.first_name} {obj.doctor.last_name}"
+
+class RecordAttachmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    sha256 = serializers.CharField(source='blob_id', read_only=True)
+
+    class Meta:
+        model = RecordAttachment
+        fields = ('id', 'filename', 'content_type', 'size', 'sha256', 'created_at')
+        read_only_fields = fields
+
+class AttachmentUploadSerializer(serializers.Serializer):
+    file = serializers.FileField()
+
+    def validate_file(self, value):
+        # Check file size (10MB limit)
+        if value.size > 10 * 1024 * 1024:
+            raise serializers.ValidationError("File size must be no more than 10MB")
+
+        # Check file type
+        ext = value.name.split('.')[-1].lower()
+        if ext not in ['pdf', 'jpg', 'jpeg', 'png']:
+            raise serializers.ValidationError("Only PDF and image files are allowed")
+        return value
+
+class HealthRecordSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     patient = UserProfileSerializer(read_only=True)
     assigned_doctors = UserProfileSerializer(many=True, read_only=True)
     annotations = DoctorAnnotationSerializer(many=True, read_only=True)
+    attachments = RecordAttachmentSerializer(many=True, read_only=True)
     doctor_ids = serializers.ListField(
         child=serializers.IntegerField(),
         write_only=True,
@@ -31,18 +71,6 @@ class HealthRecordSerializer(serializers.ModelSerializer):
             attrs['patient'] = self.context['request'].user
         return attrs
 
-    def validate_attachments(self, value):
-        if value:
-            # Check file size (10MB limit)
-            if value.size > 10 * 1024 * 1024:
-                raise serializers.ValidationError("File size must be no more than 10MB")
-            
-            # Check file type
-            ext = value.name.split('.')[-1].lower()
-            if ext not in ['pdf', 'jpg', 'jpeg', 'png']:
-                raise serializers.ValidationError("Only PDF and image files are allowed")
-        return value
-
     def create(self, validated_data):
         doctor_ids = validated_data.pop('doctor_ids', [])
         record = HealthRecord.objects.create(**validated_data)
@@ -59,13 +87,51 @@ class HealthRecordSerializer(serializers.ModelSerializer):
             instance.assigned_doctors.set(doctor_ids)
         return instance
 
-class DoctorAnnotationSerializer(serializers.ModelSerializer):
-    doctor_name = serializers.SerializerMethodField()
+class HealthRecordFastSerializer(FastSerializer):
+    """values()-based read path producing the same output as HealthRecordSerializer"""
+    serializer_class = HealthRecordSerializer
+    method_fields = {
+        'annotations.doctor_name': (
+            ('doctor__first_name', 'doctor__last_name'),
+            lambda first_name, last_name: f"{first_name} {last_name}"
+        ),
+    }
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    record = serializers.PrimaryKeyRelatedField(queryset=HealthRecord.objects.none())
 
     class Meta:
-        model = DoctorAnnotation
-        fields = ('id', 'content', 'doctor', 'doctor_name', 'created_at', 'updated_at')
-        read_only_fields = ('doctor', 'created_at', 'updated_at')
+        model = UploadSession
+        fields = ('id', 'record', 'filename', 'content_type', 'size', 'offset',
+                  'status', 'sha256', 'direct', 'expires_at', 'created_at')
+        read_only_fields = ('offset', 'status', 'expires_at', 'created_at')
 
-    def get_doctor_name(self, obj):
-        return f"{obj.doctor.first_name} {obj.doctor.last_name}" 
\ No newline at end of file
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sessions can only target records the requesting user may attach files to
+        records = self.context.get('records')
+        if records is not None:
+            self.fields['record'].queryset = records
+
+    def validate_filename(self, value):
+        ext = value.split('.')[-1].lower()
+        if ext not in ['pdf', 'jpg', 'jpeg', 'png']:
+            raise serializers.ValidationError("Only PDF and image files are allowed")
+        return value
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"File size must be between 1 byte and {settings.UPLOAD_MAX_SIZE // (1024 * 1024)}MB"
+            )
+        return value
+
+    def validate(self, attrs):
+        if attrs.get('direct'):
+            # The digest is signed into the upload URL, so it must be known up front
+            if not re.fullmatch(r'[0-9a-fA-F]{64}', attrs.get('sha256', '')):
+                raise serializers.ValidationError({'sha256': 'Direct uploads need the file\'s SHA-256 (hex)'})
+        else:
+            # Chunked uploads compute it as the bytes arrive
+            attrs.pop('sha256', None)
+        return attrs
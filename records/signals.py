@@ -0,0 +1,64 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from core import notifications
+from core.models import Notification
+
+from . import attachments, previews, summaries
+from .models import DoctorAnnotation, HealthRecord, RecordAttachment
+
+
+def _summary_key(record):
+    # Read loaded values only; touching deferred fields would query per instance
+    return record.__dict__.get('patient_id'), record.__dict__.get('record_type')
+
+
+@receiver(post_init, sender=HealthRecord)
+def remember_summary_key(sender, instance, **kwargs):
+    # Moving a record to another patient or type moves it between summary rows
+    instance._summary_key = _summary_key(instance)
+
+
+@receiver(post_save, sender=HealthRecord)
+def update_record_summary(sender, instance, created, **kwargs):
+    key = _summary_key(instance)
+    if created:
+        summaries.record_added(*key, instance.created_at)
+    elif None not in instance._summary_key and key != instance._summary_key:
+        summaries.record_removed(*instance._summary_key, instance.created_at)
+        summaries.record_added(*key, instance.created_at)
+    instance._summary_key = key
+
+
+@receiver(post_delete, sender=HealthRecord)
+def remove_record_summary(sender, instance, **kwargs):
+    if None not in instance._summary_key:
+        summaries.record_removed(*instance._summary_key, instance.created_at)
+
+
+@receiver(post_save, sender=DoctorAnnotation)
+def count_annotation(sender, instance, created, **kwargs):
+    if created:
+        summaries.annotation_added(instance.record_id, instance.created_at)
+
+
+@receiver(post_save, sender=DoctorAnnotation)
+def notify_annotated_patient(sender, instance, created, **kwargs):
+    if created:
+        notifications.queue(Notification.annotation_added(instance.doctor, instance.record))
+
+
+@receiver(post_delete, sender=DoctorAnnotation)
+def uncount_annotation(sender, instance, **kwargs):
+    summaries.annotation_removed(instance.record_id, instance.created_at)
+
+
+@receiver(post_save, sender=RecordAttachment)
+def queue_attachment_preview(sender, instance, created, **kwargs):
+    if created:
+        previews.enqueue(instance.blob_id, instance.filename)
+
+
+@receiver(post_delete, sender=RecordAttachment)
+def release_attachment_blob(sender, instance, **kwargs):
+    attachments.forget_attachment(instance)
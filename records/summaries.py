@@ -0,0 +1,127 @@
+"""
+Denormalized record and patient summaries.
+
+``HealthRecord.annotation_count``/``last_annotated_at`` and
+``PatientRecordSummary`` rows (record count and latest record time per patient
+and record type) are kept current by the handlers in ``records.signals``. Every
+change is a single ``UPDATE`` with ``F()`` expressions, so concurrent writers
+never lose increments. Bulk loads that bypass signals, and any drift, are
+repaired with ``rebuild_summaries()`` / ``manage.py rebuild_record_summaries``.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import DoctorAnnotation, HealthRecord, PatientRecordSummary
+
+
+def _latest(field, value):
+    return Greatest(Coalesce(F(field), Value(value)), Value(value))
+
+
+def _latest_record_subquery():
+    return Subquery(
+        HealthRecord.objects.filter(
+            patient_id=OuterRef('patient_id'),
+            record_type=OuterRef('record_type')
+        ).order_by('-created_at').values('created_at')[:1]
+    )
+
+
+def _latest_annotation_subquery():
+    return Subquery(
+        DoctorAnnotation.objects.filter(record_id=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+    )
+
+
+def record_added(patient_id, record_type, created_at):
+    summaries = PatientRecordSummary.objects.filter(patient_id=patient_id, record_type=record_type)
+    changes = {'record_count': F('record_count') + 1, 'latest_record_at': _latest('latest_record_at', created_at)}
+    if summaries.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            PatientRecordSummary.objects.create(
+                patient_id=patient_id,
+                record_type=record_type,
+                record_count=1,
+                latest_record_at=created_at
+            )
+    except IntegrityError:
+        # Another transaction created the row first
+        summaries.update(**changes)
+
+
+def record_removed(patient_id, record_type, created_at):
+    summaries = PatientRecordSummary.objects.filter(patient_id=patient_id, record_type=record_type)
+    summaries.update(record_count=F('record_count') - 1)
+    # Only recompute the latest time when the removed record may have been it
+    summaries.filter(latest_record_at__lte=created_at).update(latest_record_at=_latest_record_subquery())
+
+
+def annotation_added(record_id, created_at):
+    HealthRecord.objects.filter(pk=record_id).update(
+        annotation_count=F('annotation_count') + 1,
+        last_annotated_at=_latest('last_annotated_at', created_at)
+    )
+
+
+def annotation_removed(record_id, created_at):
+    records = HealthRecord.objects.filter(pk=record_id)
+    # The record lists its annotations; move its ETag/Last-Modified forward
+    records.update(annotation_count=F('annotation_count') - 1, updated_at=timezone.now())
+    records.filter(last_annotated_at__lte=created_at).update(last_annotated_at=_latest_annotation_subquery())
+
+
+def rebuild_record_counters(patient_ids=None):
+    """Recompute annotation counters of the given patients' records (all when ``None``)."""
+    records = HealthRecord.objects.all()
+    if patient_ids is not None:
+        records = records.filter(patient_id__in=patient_ids)
+    counts = DoctorAnnotation.objects.filter(record_id=OuterRef('pk')).order_by().values('record_id')
+    return records.update(
+        annotation_count=Coalesce(Subquery(counts.annotate(total=Count('pk')).values('total')), 0),
+        last_annotated_at=Subquery(counts.annotate(latest=Max('created_at')).values('latest'))
+    )
+
+
+def rebuild_patient_summaries(patient_ids=None):
+    """Replace the summary rows of the given patients (all when ``None``)."""
+    records = HealthRecord.objects.all()
+    summaries = PatientRecordSummary.objects.all()
+    if patient_ids is not None:
+        records = records.filter(patient_id__in=patient_ids)
+        summaries = summaries.filter(patient_id__in=patient_ids)
+    rows = records.order_by().values('patient_id', 'record_type').annotate(
+        record_count=Count('pk'),
+        latest_record_at=Max('created_at')
+    )
+    with transaction.atomic():
+        summaries.delete()
+        PatientRecordSummary.objects.bulk_create([PatientRecordSummary(**row) for row in rows])
+    return len(rows)
+
+
+def rebuild_summaries(patient_ids=None):
+    with transaction.atomic():
+        rebuild_record_counters(patient_ids)
+        return rebuild_patient_summaries(patient_ids)
+
+
+def summary_payload(patient_id, summaries):
+    """Dashboard representation of one patient's summary rows."""
+    by_type = {
+        summary.record_type: {
+            'count': summary.record_count,
+            'latest_record_at': summary.latest_record_at,
+        }
+        for summary in summaries if summary.record_count
+    }
+    latest = [entry['latest_record_at'] for entry in by_type.values() if entry['latest_record_at']]
+    return {
+        'patient': patient_id,
+        'total_records': sum(entry['count'] for entry in by_type.values()),
+        'latest_record_at': max(latest) if latest else None,
+        'by_type': by_type,
+    }
@@ -0,0 +1,91 @@
+import io
+import shutil
+import tempfile
+import zipfile
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import User
+from records import attachments
+from records.models import HealthRecord
+
+PDF = b'%PDF-1.4 ' + bytes(range(256)) * 40
+NOTES = b'Blood pressure 120/80, follow up in six weeks.\n' * 200
+
+
+class AttachmentArchiveTest(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            role=User.Role.DOCTOR
+        )
+        self.record = HealthRecord.objects.create(
+            record_id='HR-1',
+            patient=self.patient,
+            doctor=self.doctor,
+            title='Referral',
+            description=''
+        )
+        self.other_record = HealthRecord.objects.create(
+            record_id='HR-2',
+            patient=self.patient,
+            title='Private notes',
+            description=''
+        )
+        attachments.attach(self.record, ContentFile(PDF, name='letter.pdf'))
+        attachments.attach(self.record, ContentFile(NOTES, name='notes.txt'))
+        attachments.attach(self.record, ContentFile(b'second letter', name='letter.pdf'))
+        attachments.attach(self.other_record, ContentFile(b'diary', name='diary.txt'))
+        self.client = APIClient()
+
+    def archive(self, response):
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_patient_downloads_chart(self):
+        """Test the archive streams every attachment after one query, storing compressed formats as they are"""
+        self.client.force_authenticate(user=self.patient)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/patient-records/attachments/archive/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.streaming)
+            archive = self.archive(response)
+
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertEqual(archive.namelist(), ['HR-1/letter.pdf', 'HR-1/notes.txt', 'HR-1/letter (2).pdf',
+                                              'HR-2/diary.txt'])
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.read('HR-1/letter.pdf'), PDF)
+        self.assertEqual(archive.read('HR-1/notes.txt'), NOTES)
+        self.assertEqual(archive.getinfo('HR-1/letter.pdf').compress_type, zipfile.ZIP_STORED)
+        notes = archive.getinfo('HR-1/notes.txt')
+        self.assertEqual(notes.compress_type, zipfile.ZIP_DEFLATED)
+        self.assertLess(notes.compress_size, len(NOTES) // 10)
+
+    def test_doctor_gets_only_assigned_records(self):
+        """Test a doctor's archive is limited to the records assigned to them"""
+        self.client.force_authenticate(user=self.doctor)
+        url = '/api/records/attachments/archive/'
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+
+        archive = self.archive(self.client.get(url, {'patient': self.patient.id}))
+        self.assertEqual(archive.namelist(), ['HR-1/letter.pdf', 'HR-1/notes.txt', 'HR-1/letter (2).pdf'])
+
+        other = User.objects.create_user(username='other', password='testpass123', role=User.Role.PATIENT)
+        self.assertEqual(self.client.get(url, {'patient': other.id}).status_code, status.HTTP_404_NOT_FOUND)
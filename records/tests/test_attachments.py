@@ -0,0 +1,107 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import User
+from records import attachments
+from records.models import AttachmentBlob, HealthRecord, RecordAttachment
+
+CONTENT = b'%PDF-1.4 lab results'
+
+
+class AttachmentStorageTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.record = HealthRecord.objects.create(
+            record_id='HR-1',
+            patient=self.patient,
+            title='Lab panel',
+            description=''
+        )
+        self.other_record = HealthRecord.objects.create(
+            record_id='HR-2',
+            patient=self.patient,
+            title='Follow-up panel',
+            description=''
+        )
+
+    def stored_files(self):
+        return [name for _, _, names in os.walk(self.media) for name in names]
+
+    def test_identical_content_is_stored_once(self):
+        """Test re-uploads of the same bytes share one blob and one file"""
+        first = attachments.attach(self.record, ContentFile(CONTENT, name='lab.pdf'))
+        second = attachments.attach(self.other_record, ContentFile(CONTENT, name='lab (1).pdf'))
+        attachments.attach(self.record, ContentFile(b'other', name='scan.png'))
+
+        digest = hashlib.sha256(CONTENT).hexdigest()
+        self.assertEqual(first.blob_id, digest)
+        self.assertEqual(second.blob_id, digest)
+        self.assertEqual(AttachmentBlob.objects.get(pk=digest).ref_count, 2)
+        self.assertEqual(first.blob.file.name, f'blobs/{digest[:2]}/{digest[2:4]}/{digest}')
+        self.assertEqual(sorted(self.stored_files()), sorted([digest, hashlib.sha256(b'other').hexdigest()]))
+        self.assertEqual(self.record.attachments.count(), 2)
+
+    def test_last_reference_removes_blob(self):
+        """Test the file is deleted only when no attachment uses it"""
+        first = attachments.attach(self.record, ContentFile(CONTENT, name='lab.pdf'))
+        attachments.attach(self.other_record, ContentFile(CONTENT, name='lab.pdf'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(AttachmentBlob.objects.get(pk=first.blob_id).ref_count, 1)
+        self.assertEqual(len(self.stored_files()), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other_record.delete()
+        self.assertFalse(AttachmentBlob.objects.filter(pk=first.blob_id).exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_upload_endpoint_appends_attachments(self):
+        """Test uploads add attachments instead of replacing the previous file"""
+        client = APIClient()
+        client.force_authenticate(user=self.patient)
+        url = f'/api/patient-records/{self.record.id}/upload_attachment/'
+
+        client.post(url, {'file': SimpleUploadedFile('lab.pdf', CONTENT)}, format='multipart')
+        response = client.post(url, {'file': SimpleUploadedFile('scan.png', b'png')}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['attachment']['filename'], 'scan.png')
+        download = client.get(response.data['file_url'])
+        self.assertEqual(b''.join(download.streaming_content), b'png')
+
+        record = client.get(f'/api/patient-records/{self.record.id}/').data
+        self.assertEqual([item['filename'] for item in record['attachments']], ['lab.pdf', 'scan.png'])
+        self.assertEqual(RecordAttachment.objects.filter(uploaded_by=self.patient).count(), 2)
+
+    def test_upload_endpoint_validates_file_type(self):
+        """Test only PDF and image files are accepted"""
+        client = APIClient()
+        client.force_authenticate(user=self.patient)
+
+        response = client.post(
+            f'/api/patient-records/{self.record.id}/upload_attachment/',
+            {'file': SimpleUploadedFile('notes.exe', b'MZ')}, format='multipart'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(AttachmentBlob.objects.exists())
@@ -0,0 +1,156 @@
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import User
+from records import attachments
+from records.models import HealthRecord, DoctorAnnotation, RecordAttachment
+
+
+class ConditionalRequestTest(TestCase):
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            role=User.Role.DOCTOR,
+            specialization='Cardiology'
+        )
+        self.record = HealthRecord.objects.create(
+            record_id='HR-1',
+            patient=self.patient,
+            doctor=self.doctor,
+            title='Consultation',
+            description='Test record'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+        self.url = f'/api/patient-records/{self.record.id}/'
+
+    def test_unchanged_record_returns_304_without_serializing(self):
+        """Test If-None-Match short-circuits after the validator query"""
+        etag = self.client.get(self.url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_annotation_changes_record_etag(self):
+        """Test nested annotations are part of the record's validators"""
+        etag = self.client.get(self.url)['ETag']
+        DoctorAnnotation.objects.create(record=self.record, doctor=self.doctor, content='Follow up')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data['annotations']), 1)
+
+    def test_deleting_newest_annotation_moves_last_modified(self):
+        """Test If-Modified-Since sees an annotation removal even though the newest one left"""
+        annotation = DoctorAnnotation.objects.create(record=self.record, doctor=self.doctor, content='Follow up')
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        User.objects.filter(pk=self.patient.pk).update(updated_at=an_hour_ago - timedelta(days=1))
+        HealthRecord.objects.filter(pk=self.record.pk).update(updated_at=an_hour_ago - timedelta(days=1))
+        DoctorAnnotation.objects.filter(pk=annotation.pk).update(updated_at=an_hour_ago)
+        last_modified = self.client.get(self.url)['Last-Modified']
+
+        annotation.delete()
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['annotations'], [])
+
+    def test_sparse_representation_has_its_own_etag(self):
+        """Test ?fields= responses do not share an ETag with the full representation"""
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, {'fields': 'id,title'}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {'id', 'title'})
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_collection_etag_tracks_membership(self):
+        """Test list validators change when a record is added"""
+        etag = self.client.get('/api/patient-records/my_records/')['ETag']
+        self.assertEqual(
+            self.client.get('/api/patient-records/my_records/', HTTP_IF_NONE_MATCH=etag).status_code,
+            status.HTTP_304_NOT_MODIFIED
+        )
+
+        HealthRecord.objects.create(
+            record_id='HR-2', patient=self.patient, title='Lab results', description=''
+        )
+        response = self.client.get('/api/patient-records/my_records/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+    def test_collection_deletes_change_the_etag(self):
+        """Test deleting an older record changes the list ETag and lists send no Last-Modified"""
+        HealthRecord.objects.create(record_id='HR-2', patient=self.patient, title='Lab results', description='')
+        response = self.client.get('/api/patient-records/my_records/')
+        self.assertNotIn('Last-Modified', response)
+
+        self.record.delete()
+        response = self.client.get('/api/patient-records/my_records/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+
+    def test_attachment_changes_record_etag(self):
+        """Test attachments are part of the record's validators even when removed directly"""
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with override_settings(MEDIA_ROOT=media):
+            attachments.attach(self.record, ContentFile(b'scan', name='scan.txt'))
+            etag = self.client.get(self.url)['ETag']
+            RecordAttachment.objects.filter(record=self.record).delete()
+
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['attachments'], [])
+
+    def test_stale_if_match_is_rejected(self):
+        """Test updates against an outdated ETag fail with 412"""
+        etag = self.client.get(self.url)['ETag']
+        HealthRecord.objects.filter(pk=self.record.pk).update(title='Changed elsewhere')
+        self.record.refresh_from_db()
+        self.record.save()
+
+        response = self.client.patch(self.url, {'title': 'Mine'}, format='json', HTTP_IF_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.title, 'Changed elsewhere')
+
+    def test_matching_if_match_updates_and_returns_new_etag(self):
+        """Test a current If-Match lets the update through"""
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.patch(self.url, {'title': 'Mine'}, format='json', HTTP_IF_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_profile_returns_304(self):
+        """Test /users/me/ honours If-None-Match"""
+        etag = self.client.get('/api/users/me/')['ETag']
+
+        response = self.client.get('/api/users/me/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
@@ -0,0 +1,178 @@
+import hashlib
+import shutil
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from unittest import mock
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.localstore import LocalObjectStore
+from core.models import User
+from core.objectstore import ObjectStoreError, S3Storage
+from records import attachments
+from records.models import AttachmentBlob, HealthRecord, RecordAttachment
+
+CONTENT = b'%PDF-1.4 ' + bytes(range(256)) * 20
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def request(url, method='GET', data=None, headers=None):
+    """``(status, headers, body)`` of a plain HTTP request, as a browser would send it."""
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data, headers or {}, method=method)) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+class DirectUploadTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(MEDIA_ROOT=f'{self.directory}/media')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        # The stand-in object store on an ephemeral port
+        app = LocalObjectStore(f'{self.directory}/objects', {'test-key': 'test-secret'})
+        server = make_server('127.0.0.1', 0, app, server_class=WSGIServer, handler_class=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        endpoint = f'http://127.0.0.1:{server.server_port}'
+        self.storage = S3Storage(endpoint, 'attachments', 'test-key', 'test-secret')
+        field = AttachmentBlob._meta.get_field('file')
+        patcher = mock.patch.object(field, 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.record = HealthRecord.objects.create(
+            record_id='HR-1',
+            patient=self.patient,
+            title='Scan',
+            description=''
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+
+    def test_storage_operations_are_signed(self):
+        """Test the storage API against the stand-in and that bad credentials are refused"""
+        name = self.storage.save('notes/a.txt', ContentFile(b'hello'))
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.storage.size(name), 5)
+        with self.storage.open(name) as stored:
+            self.assertEqual(stored.read(), b'hello')
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+
+        intruder = S3Storage(self.storage.endpoint_url, 'attachments', 'test-key', 'wrong-secret')
+        with self.assertRaises(ObjectStoreError) as raised:
+            intruder.save('notes/b.txt', ContentFile(b'hello'))
+        self.assertEqual(raised.exception.status, 403)
+
+    def test_direct_upload_and_download(self):
+        """Test a client uploads to and downloads from the bucket while the API only records metadata"""
+        response = self.client.post('/api/uploads/', {
+            'record': self.record.id, 'filename': 'scan.pdf', 'size': len(CONTENT),
+            'sha256': SHA256, 'direct': True
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        upload_url, headers = response.data['upload_url'], response.data['upload_headers']
+        complete_url = f"/api/uploads/{response.data['id']}/complete/"
+
+        self.assertEqual(self.client.post(complete_url).status_code, status.HTTP_409_CONFLICT)
+        # Other bytes, even of the right length, are rejected by the store
+        tampered = CONTENT[:-1] + b'!'
+        self.assertEqual(request(upload_url, 'PUT', tampered, headers)[0], 400)
+        self.assertEqual(request(upload_url, 'PUT', CONTENT, headers)[0], 200)
+
+        response = self.client.post(complete_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        attachment = RecordAttachment.objects.get()
+        self.assertEqual((attachment.blob_id, attachment.size), (SHA256, len(CONTENT)))
+
+        response = self.client.get(
+            f'/api/patient-records/{self.record.id}/attachments/{attachment.id}/download/'
+        )
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+        code, headers, body = request(response['Location'])
+        self.assertEqual((code, body), (200, CONTENT))
+        self.assertEqual(headers['Content-Type'], 'application/pdf')
+        self.assertIn('scan.pdf', headers['Content-Disposition'])
+
+    def test_direct_session_cannot_claim_stored_content(self):
+        """Test completing a direct session for an existing blob without uploading is rejected"""
+        other = User.objects.create_user(
+            username='otherpatient',
+            password='testpass123',
+            email='other@test.com',
+            role=User.Role.PATIENT
+        )
+        other_record = HealthRecord.objects.create(
+            record_id='HR-2', patient=other, title='Other scan', description=''
+        )
+        attachments.attach(other_record, ContentFile(CONTENT, name='scan.pdf'))
+
+        response = self.client.post('/api/uploads/', {
+            'record': self.record.id, 'filename': 'copy.pdf', 'size': len(CONTENT),
+            'sha256': SHA256, 'direct': True
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn(SHA256, response.data['upload_url'])
+        response = self.client.post(f"/api/uploads/{response.data['id']}/complete/")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(RecordAttachment.objects.filter(record=self.record).exists())
+
+    def test_direct_upload_of_stored_content_is_deduplicated(self):
+        """Test an uploaded copy of stored content shares the blob and its upload object is removed"""
+        attachments.attach(self.record, ContentFile(CONTENT, name='first.pdf'))
+        response = self.client.post('/api/uploads/', {
+            'record': self.record.id, 'filename': 'second.pdf', 'size': len(CONTENT),
+            'sha256': SHA256, 'direct': True
+        }, format='json')
+        session_id = response.data['id']
+        self.assertEqual(request(response.data['upload_url'], 'PUT', CONTENT, response.data['upload_headers'])[0], 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/uploads/{session_id}/complete/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(AttachmentBlob.objects.get().ref_count, 2)
+        self.assertFalse(self.storage.exists(f'uploads/{session_id}'))
+
+    def test_presigned_urls_cannot_be_altered(self):
+        """Test a changed key or signature invalidates a presigned URL"""
+        self.storage.save(f'blobs/{SHA256}', ContentFile(CONTENT))
+        url = self.storage.url(f'blobs/{SHA256}', filename='scan.pdf')
+        self.assertEqual(request(url)[0], 200)
+        self.assertEqual(request(url.replace(SHA256, '0' * 64))[0], 403)
+        self.assertEqual(request(url.replace('scan.pdf', 'other.pdf'))[0], 403)
+        self.assertEqual(request(url.split('?')[0])[0], 403)
+
+    def test_direct_uploads_need_object_storage(self):
+        """Test direct sessions are refused with local storage and need a digest"""
+        data = {'record': self.record.id, 'filename': 'scan.pdf', 'size': len(CONTENT), 'direct': True}
+        self.assertEqual(self.client.post('/api/uploads/', data, format='json').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        local = FileSystemStorage(f'{self.directory}/media')
+        with mock.patch.object(AttachmentBlob._meta.get_field('file'), 'storage', local):
+            response = self.client.post('/api/uploads/', {**data, 'sha256': SHA256}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('object storage', response.data['error'])
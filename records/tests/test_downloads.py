@@ -0,0 +1,92 @@
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import User
+from records import attachments
+from records.models import HealthRecord
+
+CONTENT = bytes(range(256)) * 40
+
+
+class AttachmentDownloadTest(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media, ATTACHMENT_OFFLOAD='')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.record = HealthRecord.objects.create(
+            record_id='HR-1',
+            patient=self.patient,
+            title='Scan',
+            description=''
+        )
+        self.attachment = attachments.attach(self.record, ContentFile(CONTENT, name='scan.pdf'))
+        self.url = f'/api/patient-records/{self.record.id}/attachments/{self.attachment.id}/download/'
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+
+    def test_download_checks_access_in_one_query(self):
+        """Test the whole file is streamed after a single access query"""
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_range_requests(self):
+        """Test byte ranges, suffix ranges and unsatisfiable ranges"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(CONTENT)}')
+        self.assertEqual(b''.join(response.streaming_content), CONTENT[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), CONTENT[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(CONTENT)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_conditional_requests(self):
+        """Test If-None-Match gets 304 and a stale If-Range gets the whole file"""
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_offload_to_proxy(self):
+        """Test nginx offloading returns only the internal redirect header"""
+        with override_settings(ATTACHMENT_OFFLOAD='nginx', ATTACHMENT_OFFLOAD_PREFIX='/protected-media/'):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.attachment.blob.file.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_other_patients_cannot_download(self):
+        """Test records outside the user's scope are not found"""
+        other = User.objects.create_user(
+            username='other', password='testpass123', email='other@test.com', role=User.Role.PATIENT
+        )
+        self.client.force_authenticate(user=other)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
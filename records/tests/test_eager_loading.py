@@ -0,0 +1,72 @@
+from django.db import connection
+from django.db.models import Prefetch
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.eager import LazyLoadWarning, eager_loading_plan
+from core.models import User
+from records.models import HealthRecord, DoctorAnnotation
+from records.serializers import HealthRecordSerializer, DoctorAnnotationSerializer
+from records.views import HealthRecordViewSet
+
+
+class EagerLoadingTest(TestCase):
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            first_name='Test',
+            last_name='Doctor',
+            role=User.Role.DOCTOR,
+            specialization='Cardiology'
+        )
+        self.record = HealthRecord.objects.create(
+            record_id='HR-1',
+            patient=self.patient,
+            doctor=self.doctor,
+            title='Consultation',
+            description=''
+        )
+        for content in ('First', 'Second', 'Third'):
+            DoctorAnnotation.objects.create(record=self.record, doctor=self.doctor, content=content)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+
+    def test_plan_follows_serializer_graph(self):
+        """Test nested serializers and Meta.eager_load shape the plan"""
+        model, select, prefetch = eager_loading_plan(HealthRecordSerializer)
+
+        self.assertIs(model, HealthRecord)
+        self.assertEqual(select, ['patient'])
+        self.assertEqual(len(prefetch), 2)
+        self.assertIsInstance(prefetch[0], Prefetch)
+        self.assertEqual(prefetch[0].prefetch_to, 'annotations')
+        self.assertEqual(prefetch[0].queryset.query.select_related, {'doctor': {}})
+        self.assertEqual(prefetch[1].prefetch_to, 'attachments')
+
+    def test_retrieve_query_count_is_constant(self):
+        """Test nested annotations and their doctors do not cause N+1 queries"""
+        # Validators, record with patient, annotations with doctors, attachments
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/records/{self.record.id}/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['annotations']), 3)
+
+    def test_debug_check_warns_on_lazy_load(self):
+        """Test the debug check flags queries run while rendering an object"""
+        view = HealthRecordViewSet()
+        view.action = 'annotations'
+        annotations = DoctorAnnotation.objects.all()
+
+        with self.assertWarns(LazyLoadWarning):
+            with connection.execute_wrapper(view._detect_lazy_load):
+                DoctorAnnotationSerializer(annotations, many=True).data
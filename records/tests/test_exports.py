@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import User
+from records.models import HealthRecord, DoctorAnnotation
+
+
+class RecordExportTest(TestCase):
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.other_patient = User.objects.create_user(
+            username='otherpatient',
+            password='testpass123',
+            email='other@test.com',
+            role=User.Role.PATIENT
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            first_name='Test',
+            last_name='Doctor',
+            role=User.Role.DOCTOR,
+            specialization='Cardiology'
+        )
+        self.record = HealthRecord.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            title='Test Consultation',
+            description='Test consultation record'
+        )
+        HealthRecord.objects.create(
+            record_id='HR-OTHER',
+            patient=self.other_patient,
+            title='Other patient',
+            description=''
+        )
+        DoctorAnnotation.objects.create(record=self.record, doctor=self.doctor, content='Looks fine')
+        self.client = APIClient()
+
+    def export(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_patient_exports_own_chart_as_ndjson(self):
+        """Test a patient's export only contains their own records"""
+        self.client.force_authenticate(user=self.patient)
+        body = self.export('/api/patient-records/export/')
+
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['doctor']['username'], 'testdoctor')
+        self.assertEqual(rows[0]['annotations'][0]['content'], 'Looks fine')
+        self.assertEqual(rows[0]['annotations'][0]['doctor_name'], 'Test Doctor')
+
+    def test_doctor_exports_csv(self):
+        """Test a doctor can export assigned records as CSV"""
+        self.client.force_authenticate(user=self.doctor)
+        body = self.export('/api/records/export/', output='csv')
+
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['patient_username'], 'testpatient')
+        self.assertEqual(rows[0]['annotation_count'], '1')
+
+    def test_date_range_filter(self):
+        """Test start and end bound the export by creation date"""
+        self.client.force_authenticate(user=self.patient)
+        body = self.export('/api/patient-records/export/', start='2000-01-01', end='2000-12-31')
+
+        self.assertEqual(body, '')
+
+    def test_invalid_output_format(self):
+        """Test unknown export formats are rejected"""
+        self.client.force_authenticate(user=self.patient)
+        response = self.client.get('/api/records/export/', {'output': 'xml'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
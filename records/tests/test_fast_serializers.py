@@ -0,0 +1,72 @@
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core.models import User
+from records.models import AttachmentBlob, HealthRecord, DoctorAnnotation, RecordAttachment
+from records.serializers import HealthRecordSerializer, HealthRecordFastSerializer
+
+
+class HealthRecordFastSerializerTest(TestCase):
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            first_name='Test',
+            last_name='Patient',
+            role=User.Role.PATIENT
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            first_name='Test',
+            last_name='Doctor',
+            role=User.Role.DOCTOR,
+            specialization='Cardiology'
+        )
+        record = HealthRecord.objects.create(
+            record_id='HR-1',
+            patient=self.patient,
+            doctor=self.doctor,
+            record_type=HealthRecord.RecordType.LAB_RESULT,
+            title='Blood panel',
+            description='Routine'
+        )
+        blob = AttachmentBlob.objects.create(sha256='a' * 64, file='blobs/aa/aa/' + 'a' * 64, size=10, ref_count=1)
+        RecordAttachment.objects.create(record=record, blob=blob, filename='panel.pdf', size=10)
+        DoctorAnnotation.objects.create(record=record, doctor=self.doctor, content='First')
+        DoctorAnnotation.objects.create(record=record, doctor=self.doctor, content='Second')
+        HealthRecord.objects.create(
+            record_id='HR-2',
+            patient=self.patient,
+            title='Unassigned',
+            description=''
+        )
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_output_matches_health_record_serializer(self):
+        """Test the values()-based serializer renders identical JSON"""
+        request = APIRequestFactory().get('/api/records/')
+        records = HealthRecord.objects.all()
+        expected = HealthRecordSerializer(records, many=True, context={'request': request}).data
+        actual = HealthRecordFastSerializer(context={'request': request}).render(records)
+
+        self.assertEqual(self.render(actual), self.render(expected))
+
+    def test_list_endpoint_uses_fixed_number_of_queries(self):
+        """Test the list endpoint loads records, annotations and attachments in three queries"""
+        client = APIClient()
+        client.force_authenticate(user=self.patient)
+        # Plus one aggregate for the ETag/Last-Modified validators
+        with self.assertNumQueries(4):
+            response = client.get('/api/patient-records/')
+
+        records = {record['record_id']: record for record in response.data}
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records['HR-1']['annotations'][0]['doctor_name'], 'Test Doctor')
+        self.assertEqual(records['HR-2']['annotations'], [])
+        self.assertEqual(records['HR-1']['attachments'][0]['sha256'], 'a' * 64)
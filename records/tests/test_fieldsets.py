@@ -0,0 +1,86 @@
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import User
+from records.models import HealthRecord, DoctorAnnotation
+
+
+class SparseFieldsetTest(TestCase):
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            first_name='Test',
+            last_name='Doctor',
+            role=User.Role.DOCTOR,
+            specialization='Cardiology'
+        )
+        for i in range(3):
+            record = HealthRecord.objects.create(
+                record_id=f'HR-{i}',
+                patient=self.patient,
+                doctor=self.doctor,
+                title=f'Record {i}',
+                description='Test record'
+            )
+            DoctorAnnotation.objects.create(record=record, doctor=self.doctor, content='Looks fine')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+
+    def test_default_response_is_unchanged(self):
+        """Test responses keep nested objects without fields or expand"""
+        response = self.client.get('/api/patient-records/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['patient']['username'], 'testpatient')
+        self.assertEqual(response.data[0]['annotations'][0]['content'], 'Looks fine')
+
+    def test_sparse_fields_skip_relation_queries(self):
+        """Test ?fields= limits the payload and skips relation loading"""
+        # One query for the validators, one for the records
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/patient-records/', {'fields': 'id,title,patient'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data[0]), {'id', 'title', 'patient'})
+        self.assertEqual(response.data[0]['patient'], self.patient.id)
+
+    def test_expand_and_dotted_fields(self):
+        """Test relations are nested only when expanded"""
+        response = self.client.get('/api/patient-records/', {
+            'fields': 'id,patient.username,annotations',
+            'expand': 'annotations',
+        })
+
+        record = response.data[0]
+        self.assertEqual(record['patient'], {'username': 'testpatient'})
+        self.assertEqual(record['annotations'][0]['doctor_name'], 'Test Doctor')
+
+    def test_collapsed_relations_are_primary_keys(self):
+        """Test unexpanded nested relations render as ids"""
+        response = self.client.get('/api/patient-records/', {'expand': 'patient'})
+
+        record = response.data[0]
+        self.assertEqual(record['patient']['id'], self.patient.id)
+        self.assertEqual(len(record['annotations']), 1)
+        self.assertIsInstance(record['annotations'][0], int)
+
+    def test_prefer_return_minimal(self):
+        """Test writes sent with Prefer: return=minimal only return the id"""
+        response = self.client.post(
+            '/api/patient-records/',
+            {'title': 'New record', 'description': 'Created'},
+            HTTP_PREFER='return=minimal'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response['Preference-Applied'], 'return=minimal')
+        self.assertEqual(response.data, {'id': HealthRecord.objects.get(title='New record').id})
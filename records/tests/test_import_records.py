@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.models import User
+from records.models import HealthRecord
+
+
+class ImportRecordsCommandTest(TestCase):
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            role=User.Role.DOCTOR,
+            specialization='Cardiology'
+        )
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write_ndjson(self, rows):
+        path = os.path.join(self.tmpdir.name, 'legacy.ndjson')
+        with open(path, 'w') as handle:
+            for row in rows:
+                handle.write(row if isinstance(row, str) else json.dumps(row))
+                handle.write('\n')
+        return path
+
+    def run_import(self, path, *args):
+        call_command('import_records', path, *args, stdout=StringIO())
+
+    def test_imports_valid_rows_and_rejects_invalid_ones(self):
+        """Test valid rows are loaded and invalid rows go to the rejects file"""
+        path = self.write_ndjson([
+            {'patient': 'testpatient', 'doctor': 'testdoctor', 'title': 'Blood panel',
+             'record_type': 'Lab Result', 'created_at': '2018-03-04T09:30:00Z'},
+            {'patient': 'unknown', 'title': 'Orphan'},
+            'not json',
+        ])
+        self.run_import(path, '--batch-size', '2')
+
+        record = HealthRecord.objects.get()
+        self.assertEqual(record.patient, self.patient)
+        self.assertEqual(record.doctor, self.doctor)
+        self.assertEqual(record.record_type, HealthRecord.RecordType.LAB_RESULT)
+        self.assertEqual(record.created_at.year, 2018)
+
+        with open(f'{path}.rejects.ndjson') as handle:
+            rejects = [json.loads(line) for line in handle]
+        self.assertEqual([reject['row'] for reject in rejects], [2, 3])
+
+    def test_resumes_from_checkpoint(self):
+        """Test a second run only processes rows after the checkpoint"""
+        path = self.write_ndjson([
+            {'patient': 'testpatient', 'title': f'Record {i}'} for i in range(5)
+        ])
+        self.run_import(path)
+        with open(f'{path}.checkpoint.json') as handle:
+            self.assertEqual(json.load(handle)['rows'], 5)
+
+        with open(path, 'a') as handle:
+            handle.write(json.dumps({'patient': 'testpatient', 'title': 'Record 5'}) + '\n')
+        self.run_import(path)
+
+        self.assertEqual(HealthRecord.objects.count(), 6)
+
+    def test_rerunning_is_idempotent(self):
+        """Test restarting an import does not duplicate records"""
+        path = self.write_ndjson([
+            {'patient': 'testpatient', 'title': f'Record {i}'} for i in range(3)
+        ])
+        self.run_import(path)
+        self.run_import(path, '--restart')
+
+        self.assertEqual(HealthRecord.objects.count(), 3)
+
+    def test_imports_csv(self):
+        """Test CSV input is detected from the file extension"""
+        path = os.path.join(self.tmpdir.name, 'legacy.csv')
+        with open(path, 'w') as handle:
+            handle.write('patient,doctor,title,description\n')
+            handle.write('testpatient,testdoctor,Checkup,"Routine, yearly"\n')
+        self.run_import(path)
+
+        record = HealthRecord.objects.get()
+        self.assertEqual(record.description, 'Routine, yearly')
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from core.models import User
+from records import attachments, previews, reconcile
+from records.models import HealthRecord
+
+
+class MediaReconciliationTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.var = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.addCleanup(shutil.rmtree, self.var)
+        settings = override_settings(
+            MEDIA_ROOT=self.media,
+            MEDIA_QUARANTINE_ROOT=os.path.join(self.var, 'quarantine'),
+            MEDIA_GC_CHECKPOINT=os.path.join(self.var, 'media-gc.json'),
+            UPLOAD_SESSION_DIR=os.path.join(self.media, 'uploads'),
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.record = HealthRecord.objects.create(
+            record_id='HR-1',
+            patient=patient,
+            title='Scan',
+            description=''
+        )
+        self.attachment = attachments.attach(self.record, ContentFile(b'%PDF-1.4 scan', name='scan.pdf'))
+        self.age(self.attachment.blob.file.name)
+
+    def write(self, name, content=b'orphan', old=True):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as output:
+            output.write(content)
+        if old:
+            self.age(name)
+        return path
+
+    def age(self, name, days=2):
+        then = time.time() - days * 86400
+        os.utime(os.path.join(self.media, name), (then, then))
+
+    def test_orphans_are_quarantined_and_referenced_files_kept(self):
+        """Test only old files without a row (or a blob, for previews) are moved out"""
+        legacy = self.write('health_records/1/old.pdf')
+        fresh = self.write('health_records/1/fresh.pdf', old=False)
+        partial = self.write('uploads/session.part')
+        kept_preview = self.write(previews.preview_name(self.attachment.blob_id, 'thumb'))
+        stale_preview = self.write(previews.preview_name('f' * 64, 'thumb'))
+        blob = os.path.join(self.media, self.attachment.blob.file.name)
+
+        stats = reconcile.reconcile(rate=0)
+
+        self.assertEqual((stats['orphans'], stats['removed'], stats['finished']), (2, 2, 1))
+        for path in (blob, fresh, partial, kept_preview):
+            self.assertTrue(os.path.exists(path), path)
+        for path in (legacy, stale_preview):
+            self.assertFalse(os.path.exists(path), path)
+        day = os.listdir(os.path.join(self.var, 'quarantine'))[0]
+        self.assertTrue(os.path.exists(os.path.join(self.var, 'quarantine', day, 'health_records/1/old.pdf')))
+
+        self.assertEqual(reconcile.purge_quarantine(0), [])
+        with override_settings(MEDIA_GC_MIN_AGE_HOURS=0):
+            self.assertEqual(reconcile.reconcile(action='report')['orphans'], 1)  # the fresh file
+
+    def test_deleted_attachment_blob_is_collected(self):
+        """Test a blob whose file survived its row is deleted"""
+        path = os.path.join(self.media, self.attachment.blob.file.name)
+        with self.captureOnCommitCallbacks(execute=False):
+            # The release never runs, as if the process died after the commit
+            self.attachment.delete()
+        self.attachment.blob.delete()
+
+        stats = reconcile.reconcile(action='delete', rate=0)
+
+        self.assertEqual(stats['removed'], 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(os.path.join(self.var, 'quarantine')))
+
+    def test_runs_resume_from_the_checkpoint(self):
+        """Test a bounded run saves its position and the next run continues after it"""
+        for index in range(5):
+            self.write(f'health_records/{index}/old.pdf')
+
+        first = reconcile.reconcile(action='report', batch_size=2, max_files=2)
+        self.assertEqual((first['scanned'], first['finished']), (2, 0))
+        self.assertEqual(reconcile.load_checkpoint(os.path.join(self.var, 'media-gc.json'))['position'],
+                         'health_records/0/old.pdf')  # after blobs/
+
+        rest = reconcile.reconcile(action='report', batch_size=2)
+        self.assertEqual((rest['scanned'], rest['orphans'], rest['finished']), (4, 4, 1))
+        self.assertIsNone(reconcile.load_checkpoint(os.path.join(self.var, 'media-gc.json'))['position'])
+
+        self.assertEqual(reconcile.reconcile(action='report', min_age=timedelta(0))['scanned'], 6)
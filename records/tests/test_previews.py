@@ -0,0 +1,124 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import User
+from records import attachments, previews, rendering
+from records.models import HealthRecord, PreviewJob
+
+
+def png_bytes(size=(1200, 900)):
+    from PIL import Image
+
+    output = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(output, 'PNG')
+    return output.getvalue()
+
+
+class PreviewPipelineTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.record = HealthRecord.objects.create(
+            record_id='HR-1',
+            patient=self.patient,
+            title='Scan',
+            description=''
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+
+    def attach(self, name, content):
+        attachment = attachments.attach(self.record, ContentFile(content, name=name))
+        url = f'/api/patient-records/{self.record.id}/attachments/{attachment.id}/preview/'
+        return attachment, url
+
+    def test_upload_queues_one_job_per_content(self):
+        """Test previewable uploads are queued once per blob and others not at all"""
+        first, _ = self.attach('scan.pdf', b'%PDF-1.4 scan')
+        self.attach('scan again.pdf', b'%PDF-1.4 scan')
+        self.attach('notes.txt', b'notes')
+
+        job = PreviewJob.objects.get()
+        self.assertEqual(job.blob_id, first.blob_id)
+        self.assertEqual(job.kind, PreviewJob.Kind.PDF)
+        self.assertEqual(job.status, PreviewJob.Status.PENDING)
+
+    def test_placeholder_until_rendered(self):
+        """Test the endpoint serves a placeholder, then the cached render"""
+        attachment, url = self.attach('scan.pdf', b'%PDF-1.4 scan')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertEqual(response['X-Preview-Status'], 'pending')
+        self.assertEqual(response['Cache-Control'], 'no-store')
+
+        path = os.path.join(self.media, previews.preview_name(attachment.blob_id, 'thumb'))
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as output:
+            output.write(b'\xff\xd8jpeg')
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        self.assertEqual(b''.join(response.streaming_content), b'\xff\xd8jpeg')
+
+        self.assertEqual(self.client.get(url, {'size': 'huge'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_failures_back_off_and_stale_jobs_are_reclaimed(self):
+        """Test retries are delayed, permanent failures stop and abandoned jobs run again"""
+        attachment, url = self.attach('scan.png', b'not really a png')
+
+        [(sha256, kind, name)] = previews.claim(10)
+        self.assertEqual((sha256, kind), (attachment.blob_id, PreviewJob.Kind.IMAGE))
+        self.assertEqual(previews.claim(10), [])
+
+        previews.fail(sha256, OSError('disk full'))
+        job = PreviewJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (PreviewJob.Status.PENDING, 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(previews.claim(10), [])
+
+        later = timezone.now() + timedelta(hours=1)
+        self.assertEqual(len(previews.claim(10, now=later)), 1)
+        # The worker died: the job is taken over once it has been running too long
+        self.assertEqual(len(previews.claim(10, now=later + timedelta(hours=1))), 1)
+
+        previews.fail(sha256, rendering.RenderError('Unrecognized image format'), permanent=True)
+        self.assertEqual(PreviewJob.objects.get().status, PreviewJob.Status.FAILED)
+        self.assertEqual(self.client.get(url)['X-Preview-Status'], 'failed')
+
+    @unittest.skipUnless(rendering.available(), 'Pillow is not installed')
+    def test_worker_renders_previews(self):
+        """Test the process pool renders every size and marks the job done"""
+        from PIL import Image
+
+        attachment, url = self.attach('scan.png', png_bytes())
+
+        stats = previews.run_worker(processes=1, drain=True)
+
+        self.assertEqual(stats['done'], 1)
+        self.assertEqual(PreviewJob.objects.get().status, PreviewJob.Status.DONE)
+        with Image.open(previews.cached_preview(attachment.blob_id, 'thumb').path) as thumb:
+            self.assertEqual(thumb.size, (256, 192))
+        response = self.client.get(url, {'size': 'page'})
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
@@ -0,0 +1,108 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.models import User
+from records.models import HealthRecord, DoctorAnnotation, PatientRecordSummary
+
+
+class RecordSummaryTest(TestCase):
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            role=User.Role.DOCTOR,
+            specialization='Cardiology'
+        )
+        self.record = self.create_record('HR-1', HealthRecord.RecordType.CONSULTATION)
+
+    def create_record(self, record_id, record_type):
+        return HealthRecord.objects.create(
+            record_id=record_id,
+            record_type=record_type,
+            patient=self.patient,
+            doctor=self.doctor,
+            title='Record',
+            description=''
+        )
+
+    def summary(self, record_type):
+        return PatientRecordSummary.objects.get(patient=self.patient, record_type=record_type)
+
+    def test_record_create_and_delete_update_patient_summary(self):
+        """Test per-type counts and latest time follow record changes"""
+        lab = self.create_record('HR-2', HealthRecord.RecordType.LAB_RESULT)
+        latest = self.create_record('HR-3', HealthRecord.RecordType.LAB_RESULT)
+
+        self.assertEqual(self.summary('CONSULTATION').record_count, 1)
+        self.assertEqual(self.summary('LAB_RESULT').record_count, 2)
+        self.assertEqual(self.summary('LAB_RESULT').latest_record_at, latest.created_at)
+
+        latest.delete()
+        self.assertEqual(self.summary('LAB_RESULT').record_count, 1)
+        self.assertEqual(self.summary('LAB_RESULT').latest_record_at, lab.created_at)
+
+    def test_record_type_change_moves_count(self):
+        """Test changing a record's type moves it between summary rows"""
+        self.record.record_type = HealthRecord.RecordType.PRESCRIPTION
+        self.record.save()
+
+        self.assertEqual(self.summary('CONSULTATION').record_count, 0)
+        self.assertEqual(self.summary('PRESCRIPTION').record_count, 1)
+
+    def test_annotation_counters(self):
+        """Test annotation count and last annotated time on the record"""
+        first = DoctorAnnotation.objects.create(record=self.record, doctor=self.doctor, content='First')
+        second = DoctorAnnotation.objects.create(record=self.record, doctor=self.doctor, content='Second')
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.annotation_count, 2)
+        self.assertEqual(self.record.last_annotated_at, second.created_at)
+
+        second.delete()
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.annotation_count, 1)
+        self.assertEqual(self.record.last_annotated_at, first.created_at)
+
+    def test_record_save_keeps_counters(self):
+        """Test saving a stale record instance does not overwrite counters"""
+        DoctorAnnotation.objects.create(record=self.record, doctor=self.doctor, content='Note')
+        self.record.title = 'Renamed'
+        self.record.save()
+
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.annotation_count, 1)
+
+    def test_rebuild_command_repairs_drift(self):
+        """Test the rebuild command recomputes counters from source rows"""
+        DoctorAnnotation.objects.create(record=self.record, doctor=self.doctor, content='Note')
+        HealthRecord.objects.filter(pk=self.record.pk).update(annotation_count=7)
+        PatientRecordSummary.objects.all().delete()
+
+        call_command('rebuild_record_summaries', stdout=StringIO())
+
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.annotation_count, 1)
+        self.assertEqual(self.summary('CONSULTATION').record_count, 1)
+
+    def test_summary_endpoint(self):
+        """Test doctors read a patient's summary without aggregating records"""
+        self.create_record('HR-2', HealthRecord.RecordType.LAB_RESULT)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.doctor).access_token}')
+
+        response = client.get(f'/api/assigned-patients/{self.patient.id}/summary/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_records'], 2)
+        self.assertEqual(response.data['by_type']['LAB_RESULT']['count'], 1)
@@ -0,0 +1,160 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import User
+from records import attachments, coldcodec, tiering
+from records.models import AttachmentBlob, HealthRecord
+
+CONTENT = b'Potassium 4.1 mmol/L, sodium 139 mmol/L\n' * 2000
+
+
+def png_scan():
+    from PIL import Image
+
+    image = Image.new('L', (600, 400))
+    image.putdata([(x // 8 + y // 8) % 256 for y in range(400) for x in range(600)])
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+@unittest.skipUnless(coldcodec.available(), 'zstandard is not installed')
+class ColdTierTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(
+            MEDIA_ROOT=f'{self.directory}/media', ATTACHMENT_CACHE_DIR=f'{self.directory}/cache',
+            ATTACHMENT_COLD_AFTER_DAYS=90,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.cold = FileSystemStorage(f'{self.directory}/cold')
+        patcher = mock.patch.object(AttachmentBlob._meta.get_field('cold_file'), 'storage', self.cold)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.record = HealthRecord.objects.create(
+            record_id='HR-1',
+            patient=self.patient,
+            title='Lab panel',
+            description=''
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+
+    def attach_old(self, content, name):
+        attachment = attachments.attach(self.record, ContentFile(content, name=name))
+        AttachmentBlob.objects.filter(pk=attachment.blob_id).update(
+            created_at=timezone.now() - timedelta(days=120)
+        )
+        return attachment
+
+    def test_old_blobs_move_to_the_cold_tier(self):
+        """Test old blobs are compressed, verified and their hot copy removed"""
+        attachment = self.attach_old(CONTENT, 'labs.txt')
+        attachments.attach(self.record, ContentFile(b'recent', name='recent.txt'))
+        hot_path = attachment.blob.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = tiering.run()
+        self.assertEqual((stats['blobs'], stats['bytes'], stats[coldcodec.ZSTD]), (1, len(CONTENT), 1))
+        self.assertLess(stats['stored_bytes'], len(CONTENT) // 10)
+
+        blob = AttachmentBlob.objects.get(pk=attachment.blob_id)
+        self.assertEqual((blob.tier, blob.codec, blob.file.name), (AttachmentBlob.Tier.COLD, coldcodec.ZSTD, ''))
+        self.assertEqual(blob.stored_size, self.cold.size(blob.cold_file.name))
+        self.assertFalse(os.path.exists(hot_path))
+        self.assertEqual(tiering.run()['blobs'], 0)
+
+    def test_cold_downloads_stream_then_come_from_the_cache(self):
+        """Test the first download decompresses on the fly and later ones support ranges"""
+        attachment = self.attach_old(CONTENT, 'labs.txt')
+        with self.captureOnCommitCallbacks(execute=True):
+            tiering.run()
+        url = f'/api/patient-records/{self.record.id}/attachments/{attachment.id}/download/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Content-Length'], str(len(CONTENT)))
+        self.assertEqual(response['ETag'], f'"{attachment.blob_id}"')
+        self.assertTrue(os.path.exists(tiering.cache_path(attachment.blob_id)))
+
+        response = self.client.get(url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT[:10])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+    def test_bulk_reads_bypass_the_cache(self):
+        """Test archives read cold blobs without filling the download cache"""
+        attachment = self.attach_old(CONTENT, 'labs.txt')
+        with self.captureOnCommitCallbacks(execute=True):
+            tiering.run()
+        response = self.client.get('/api/patient-records/attachments/archive/')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.read('HR-1/labs.txt'), CONTENT)
+        self.assertIsNone(tiering.cached(attachment.blob_id))
+
+    def test_png_scans_are_recompressed_losslessly(self):
+        """Test PNG image data is stored inflated and restored byte for byte"""
+        scan = png_scan()
+        attachment = attachments.attach(self.record, ContentFile(scan, name='scan.png'))
+        with self.captureOnCommitCallbacks(execute=True):
+            blob = tiering.freeze(attachment.blob)
+        self.assertEqual(blob.codec, coldcodec.PNG)
+        with blob.cold_file.open('rb') as source:
+            restored = b''.join(coldcodec.decompress(source, blob.codec))
+        self.assertEqual(hashlib.sha256(restored).hexdigest(), attachment.blob_id)
+
+    def test_reupload_rehydrates(self):
+        """Test uploading cold content again moves the blob back to the hot tier"""
+        attachment = self.attach_old(CONTENT, 'labs.txt')
+        with self.captureOnCommitCallbacks(execute=True):
+            tiering.run()
+        cold_name = AttachmentBlob.objects.get(pk=attachment.blob_id).cold_file.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            attachments.attach(self.record, ContentFile(CONTENT, name='labs again.txt'))
+        blob = AttachmentBlob.objects.get(pk=attachment.blob_id)
+        self.assertEqual((blob.tier, blob.cold_file.name, blob.ref_count), (AttachmentBlob.Tier.HOT, '', 2))
+        with blob.file.open('rb') as stored:
+            self.assertEqual(stored.read(), CONTENT)
+        self.assertFalse(self.cold.exists(cold_name))
+
+    def test_cache_evicts_least_recently_read(self):
+        """Test the cache is trimmed to its size limit, oldest reads first"""
+        for index, name in enumerate(['a' * 64, 'b' * 64, 'c' * 64]):
+            path = tiering.cache_path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as cached:
+                cached.write(b'x' * 100)
+            os.utime(path, (1000 + index, 1000 + index))
+        tiering.cached('a' * 64)
+
+        self.assertEqual(tiering.evict(max_bytes=200), 1)
+        self.assertIsNone(tiering.cached('b' * 64))
+        self.assertIsNotNone(tiering.cached('a' * 64))
+        self.assertIsNotNone(tiering.cached('c' * 64))
@@ -0,0 +1,115 @@
+from datetime import date, time, timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.models import User, DoctorAppointment
+from records.models import HealthRecord, DoctorAnnotation
+
+
+class PatientTimelineTest(TestCase):
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.doctor = User.objects.create_user(
+            username='testdoctor',
+            password='testpass123',
+            email='doctor@test.com',
+            role=User.Role.DOCTOR,
+            specialization='Cardiology'
+        )
+        self.other_doctor = User.objects.create_user(
+            username='otherdoctor',
+            password='testpass123',
+            email='other@test.com',
+            role=User.Role.DOCTOR,
+            specialization='Dermatology'
+        )
+        self.doctor.set_availability('SUNDAY', '08:00', '17:00')
+        start = timezone.now() - timedelta(days=10)
+
+        appointment = DoctorAppointment.objects.create(
+            doctor=self.doctor,
+            patient=self.patient,
+            appointment_date=date(2025, 6, 1),  # a Sunday
+            start_time=time(9, 0),
+            end_time=time(9, 30)
+        )
+        record = HealthRecord.objects.create(
+            record_id='HR-1',
+            patient=self.patient,
+            doctor=self.doctor,
+            title='Consultation',
+            description=''
+        )
+        annotation = DoctorAnnotation.objects.create(record=record, doctor=self.doctor, content='Looks fine')
+        other = HealthRecord.objects.create(
+            record_id='HR-2',
+            patient=self.patient,
+            doctor=self.other_doctor,
+            title='Skin check',
+            description=''
+        )
+        DoctorAppointment.objects.filter(pk=appointment.pk).update(created_at=start)
+        HealthRecord.objects.filter(pk=record.pk).update(created_at=start + timedelta(days=1))
+        DoctorAnnotation.objects.filter(pk=annotation.pk).update(created_at=start + timedelta(days=2))
+        HealthRecord.objects.filter(pk=other.pk).update(created_at=start + timedelta(days=3))
+
+        self.client = APIClient()
+
+    def test_patient_timeline_is_chronological(self):
+        """Test all event types are merged newest first"""
+        self.client.force_authenticate(user=self.patient)
+        response = self.client.get('/api/patient-records/timeline/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        events = response.data['results']
+        self.assertEqual(
+            [event['type'] for event in events],
+            ['record', 'annotation', 'record', 'appointment']
+        )
+        self.assertEqual(events[0]['summary'], 'Skin check')
+        self.assertEqual(events[3]['subtype'], 'SCHEDULED')
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_keyset_pagination(self):
+        """Test following next_cursor walks every event exactly once"""
+        self.client.force_authenticate(user=self.patient)
+        seen = []
+        params = {'limit': 3}
+        while True:
+            response = self.client.get('/api/patient-records/timeline/', params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend((event['type'], event['id']) for event in response.data['results'])
+            if not response.data['next_cursor']:
+                break
+            params['cursor'] = response.data['next_cursor']
+
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(set(seen)), 4)
+
+    def test_doctor_timeline_only_shows_own_events(self):
+        """Test a doctor only sees events they are involved in"""
+        token = RefreshToken.for_user(self.doctor).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.get(f'/api/assigned-patients/{self.patient.id}/timeline/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [event['type'] for event in response.data['results']],
+            ['annotation', 'record', 'appointment']
+        )
+
+    def test_invalid_cursor(self):
+        """Test malformed cursors are rejected"""
+        self.client.force_authenticate(user=self.patient)
+        response = self.client.get('/api/patient-records/timeline/', {'cursor': 'garbage'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,199 @@
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import tracemalloc
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import User
+from records import uploads
+from records.models import HealthRecord, UploadSession
+
+
+class ChunkStream:
+    """A request body of ``size`` bytes produced block by block, optionally failing midway."""
+
+    def __init__(self, size, fail_after=None):
+        self.remaining = size
+        self.sent = 0
+        self.fail_after = fail_after
+
+    def read(self, size=-1):
+        if self.fail_after is not None and self.sent >= self.fail_after:
+            raise OSError('connection reset')
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        self.remaining -= size
+        self.sent += size
+        return b'x' * size
+
+
+class ResumableUploadTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(
+            MEDIA_ROOT=os.path.join(self.directory, 'media'),
+            UPLOAD_SESSION_DIR=os.path.join(self.directory, 'uploads')
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.patient = User.objects.create_user(
+            username='testpatient',
+            password='testpass123',
+            email='patient@test.com',
+            role=User.Role.PATIENT
+        )
+        self.record = HealthRecord.objects.create(
+            record_id='HR-1',
+            patient=self.patient,
+            title='Scan',
+            description=''
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+
+    def create_session(self, size, filename='scan.pdf'):
+        response = self.client.post('/api/uploads/', {
+            'record': self.record.id, 'filename': filename, 'size': size
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def send_chunk(self, session_id, offset, data, checksum=None):
+        headers = {'HTTP_UPLOAD_OFFSET': str(offset)}
+        if checksum:
+            headers['HTTP_UPLOAD_CHECKSUM'] = checksum
+        return self.client.patch(
+            f'/api/uploads/{session_id}/', data, content_type='application/offset+octet-stream', **headers
+        )
+
+    def test_chunks_are_assembled_into_attachment(self):
+        """Test a file sent in checksummed chunks ends up as the record attachment"""
+        content = b'%PDF-1.4 ' + os.urandom(200_000)
+        session_id = self.create_session(len(content))
+
+        first, second = content[:120_000], content[120_000:]
+        response = self.send_chunk(
+            session_id, 0, first, 'sha256 ' + base64.b64encode(hashlib.sha256(first).digest()).decode()
+        )
+        self.assertEqual(response['Upload-Offset'], str(len(first)))
+        self.send_chunk(session_id, len(first), second)
+
+        response = self.client.post(
+            f'/api/uploads/{session_id}/complete/', {'sha256': hashlib.sha256(content).hexdigest()}, format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        attachment = self.record.attachments.select_related('blob').get()
+        self.assertEqual(attachment.filename, 'scan.pdf')
+        self.assertEqual(attachment.blob_id, hashlib.sha256(content).hexdigest())
+        with attachment.blob.file.open('rb') as stored:
+            self.assertEqual(stored.read(), content)
+        self.assertFalse(os.listdir(os.path.join(self.directory, 'uploads')))
+
+    def test_wrong_offset_is_rejected(self):
+        """Test a chunk at the wrong offset is refused and the expected offset returned"""
+        session_id = self.create_session(10)
+        self.send_chunk(session_id, 0, b'12345')
+
+        response = self.send_chunk(session_id, 0, b'12345')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Upload-Offset'], '5')
+
+    def test_checksum_mismatch_discards_chunk(self):
+        """Test a corrupted chunk is not kept"""
+        session_id = self.create_session(10)
+        wrong = 'sha256 ' + base64.b64encode(hashlib.sha256(b'other').digest()).decode()
+
+        response = self.send_chunk(session_id, 0, b'12345', wrong)
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(UploadSession.objects.get(pk=session_id).offset, 0)
+
+    def test_interrupted_chunk_resumes_from_received_bytes(self):
+        """Test bytes received before a dropped connection count and the upload continues"""
+        size = 1_000_000
+        session = uploads.create_session(self.record, self.patient, 'scan.pdf', size)
+
+        with self.assertRaises(uploads.UploadError):
+            uploads.append_chunk(session.pk, 0, ChunkStream(size, fail_after=300_000), size)
+        offset = self.client.head(f'/api/uploads/{session.pk}/')['Upload-Offset']
+        uploads.append_chunk(session.pk, int(offset), ChunkStream(size - int(offset)), size - int(offset))
+        session = uploads.complete_session(session.pk, hashlib.sha256(b'x' * size).hexdigest())
+
+        self.assertEqual(session.status, UploadSession.Status.COMPLETED)
+
+    def test_chunk_streams_outside_a_transaction(self):
+        """Test no transaction stays open while a chunk arrives and a second chunk is kept out meanwhile"""
+        session = uploads.create_session(self.record, self.patient, 'scan.pdf', 10)
+        savepoints = list(connection.savepoint_ids)
+        seen = []
+
+        class ProbingStream(ChunkStream):
+            def read(stream, size=-1):
+                if not seen:
+                    seen.append(list(connection.savepoint_ids))
+                    with self.assertRaises(uploads.UploadError) as raised:
+                        uploads.append_chunk(session.pk, 0, ChunkStream(5), 5)
+                    self.assertEqual(raised.exception.status_code, 409)
+                return super().read(size)
+
+        session = uploads.append_chunk(session.pk, 0, ProbingStream(5), 5)
+
+        self.assertEqual(seen, [savepoints])
+        self.assertEqual(session.offset, 5)
+        self.assertIsNone(UploadSession.objects.get(pk=session.pk).leased_until)
+        self.assertEqual(uploads.append_chunk(session.pk, 5, ChunkStream(5), 5).offset, 10)
+
+    def test_expired_lease_is_taken_over(self):
+        """Test a chunk whose client stalled past the lease loses the session to the next one"""
+        session = uploads.create_session(self.record, self.patient, 'scan.pdf', 10)
+        UploadSession.objects.filter(pk=session.pk).update(leased_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(uploads.append_chunk(session.pk, 0, ChunkStream(10), 10).offset, 10)
+
+    def test_memory_stays_flat(self):
+        """Test a large chunk is copied to disk without holding it in memory"""
+        size = 32 * 1024 * 1024
+        session = uploads.create_session(self.record, self.patient, 'scan.pdf', size)
+
+        tracemalloc.start()
+        try:
+            uploads.append_chunk(session.pk, 0, ChunkStream(size), size)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertLess(peak, 1024 * 1024)
+
+    def test_cannot_upload_to_other_patients_record(self):
+        """Test sessions are limited to records the user may attach files to"""
+        other = User.objects.create_user(
+            username='other', password='testpass123', email='other@test.com', role=User.Role.PATIENT
+        )
+        self.client.force_authenticate(user=other)
+
+        response = self.client.post('/api/uploads/', {
+            'record': self.record.id, 'filename': 'scan.pdf', 'size': 10
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sweep_aborts_expired_sessions(self):
+        """Test abandoned sessions and stray partial files are removed"""
+        session = uploads.create_session(self.record, self.patient, 'scan.pdf', 10)
+        UploadSession.objects.filter(pk=session.pk).update(expires_at=timezone.now() - timedelta(hours=1))
+        open(os.path.join(self.directory, 'uploads', 'stray.part'), 'wb').close()
+
+        self.assertEqual(uploads.sweep(), (1, 1))
+        self.assertEqual(UploadSession.objects.get(pk=session.pk).status, UploadSession.Status.ABORTED)
+        self.assertFalse(os.listdir(os.path.join(self.directory, 'uploads')))
@@ -0,0 +1,296 @@
+"""
+Cold tier for attachment blobs nobody reads any more.
+
+``python manage.py tier_attachments`` compresses blobs older than
+``ATTACHMENT_COLD_AFTER_DAYS`` with ``records/coldcodec.py`` into
+``STORAGES['cold_attachments']`` (a cheaper directory or bucket). Each one is
+verified by decompressing it before the blob row is switched to
+``tier=COLD`` (with the cold file, codec and stored size) and the hot copy is
+deleted after commit. Blobs still waiting for a preview are left hot.
+
+Reads of cold blobs stay transparent: the download streams the decompressed
+bytes as they are produced, writing them to ``ATTACHMENT_CACHE_DIR`` at the
+same time. Later reads are served from that copy, with ranges and
+``sendfile``. The cache is content-addressed and so never stale; it is
+trimmed to ``ATTACHMENT_CACHE_MAX_BYTES``, least recently read first.
+Uploading the same content again moves the blob back to the hot tier, as does
+``tier_attachments --rehydrate``.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from collections import Counter, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.http import quote_etag
+
+from core.downloads import serve_file, serve_stream
+
+from . import coldcodec
+from .models import AttachmentBlob, PreviewJob, attachment_blob_path, cold_blob_path
+
+logger = logging.getLogger(__name__)
+
+# What serve_file() needs from a cached copy
+CachedFile = namedtuple('CachedFile', 'name path')
+
+
+def blob_etag(sha256):
+    return quote_etag(sha256)
+
+
+def cache_path(sha256):
+    return os.path.join(settings.ATTACHMENT_CACHE_DIR, sha256[:2], sha256)
+
+
+def cached(sha256):
+    """The cached copy of ``sha256``, marked as just read, or ``None``."""
+    path = cache_path(sha256)
+    try:
+        # The access time orders eviction; the modification time stays the copy's age
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except FileNotFoundError:
+        return None
+    return CachedFile(sha256, path)
+
+
+def discard_cached(sha256):
+    try:
+        os.remove(cache_path(sha256))
+    except FileNotFoundError:
+        pass
+
+
+def evict(max_bytes=None, keep=None):
+    """Delete the least recently read copies (except ``keep``) until the cache fits; returns how many."""
+    max_bytes = settings.ATTACHMENT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries, total = [], 0
+    try:
+        directories = list(os.scandir(settings.ATTACHMENT_CACHE_DIR))
+    except FileNotFoundError:
+        return 0
+    for directory in directories:
+        if not directory.is_dir():
+            continue
+        for entry in os.scandir(directory.path):
+            if entry.name.endswith('.tmp') or entry.path == keep:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, entry.path))
+            total += stat.st_size
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def _fill(blob):
+    """Yield ``blob``'s decompressed bytes while writing them to the cache."""
+    path = cache_path(blob.sha256)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False)
+    digest = hashlib.sha256()
+    complete = False
+    try:
+        with partial, blob.cold_file.open('rb') as source:
+            for block in coldcodec.decompress(source, blob.codec):
+                partial.write(block)
+                digest.update(block)
+                yield block
+        if digest.hexdigest() != blob.sha256:
+            raise coldcodec.CodecError(f'Cold copy of {blob.sha256} does not match its digest')
+        os.replace(partial.name, path)
+        complete = True
+    finally:
+        # Also when the client disconnects and the generator is closed
+        if not complete:
+            os.remove(partial.name)
+    evict(keep=path)
+
+
+def local_copy(blob):
+    """Path of a local file with a cold ``blob``'s bytes, decompressing it into the cache if needed."""
+    copy = cached(blob.sha256)
+    if copy is None:
+        for _ in _fill(blob):
+            pass
+        copy = CachedFile(blob.sha256, cache_path(blob.sha256))
+    return copy.path
+
+
+def read(blob):
+    """
+    Yield a cold ``blob``'s bytes from the cache, or decompressed without
+    caching them (for bulk reads such as archives, which would flush it).
+    """
+    copy = cached(blob.sha256)
+    if copy is not None:
+        try:
+            source = open(copy.path, 'rb')
+        except FileNotFoundError:
+            pass  # Evicted meanwhile
+        else:
+            with source:
+                yield from iter(lambda: source.read(coldcodec.BLOCK_SIZE), b'')
+            return
+    with blob.cold_file.open('rb') as source:
+        yield from coldcodec.decompress(source, blob.codec)
+
+
+def serve(request, blob, filename):
+    """Download response for a cold ``blob``: from the cache, or decompressed on the fly."""
+    etag = blob_etag(blob.sha256)
+    copy = cached(blob.sha256)
+    if copy is not None:
+        return serve_file(request, copy, filename=filename, etag=etag, offload=False)
+    # No ranges on the first read: the stream cannot seek
+    return serve_stream(request, _fill(blob), size=blob.size, filename=filename, etag=etag)
+
+
+def mark_hot(blob):
+    """Switch a cold ``blob`` whose ``file`` holds the bytes again back to the hot tier."""
+    cold_file = blob.cold_file
+    cold_name = cold_file.name
+    blob.tier = AttachmentBlob.Tier.HOT
+    blob.cold_file = ''
+    blob.codec = ''
+    blob.stored_size = None
+    blob.tiered_at = None
+    blob.save(update_fields=['file', 'tier', 'cold_file', 'codec', 'stored_size', 'tiered_at'])
+    transaction.on_commit(lambda: cold_file.storage.delete(cold_name))
+
+
+def candidates(cutoff):
+    return (
+        AttachmentBlob.objects
+        .filter(tier=AttachmentBlob.Tier.HOT, created_at__lt=cutoff, ref_count__gt=0)
+        .exclude(preview_job__status__in=[PreviewJob.Status.PENDING, PreviewJob.Status.RUNNING])
+        .order_by('created_at')
+    )
+
+
+def _hot_path(blob, workdir):
+    try:
+        return blob.file.path
+    except NotImplementedError:
+        # Object storage: download it once for compressing
+        path = os.path.join(workdir, 'source')
+        with blob.file.open('rb') as source, open(path, 'wb') as output:
+            for block in source.chunks():
+                output.write(block)
+        return path
+
+
+def freeze(blob):
+    """
+    Move ``blob`` to the cold tier. Returns the updated blob, or ``None`` when
+    it was deleted or tiered by someone else meanwhile.
+    """
+    with tempfile.TemporaryDirectory(dir=settings.FILE_UPLOAD_TEMP_DIR) as workdir:
+        packed = os.path.join(workdir, 'packed')
+        with open(packed, 'w+b') as output:
+            codec = coldcodec.compress(_hot_path(blob, workdir), output, level=settings.ATTACHMENT_COLD_LEVEL)
+            output.seek(0)
+            # Never drop the hot copy without proof the cold one restores it
+            digest, size = hashlib.sha256(), 0
+            for block in coldcodec.decompress(output, codec):
+                digest.update(block)
+                size += len(block)
+            if (digest.hexdigest(), size) != (blob.sha256, blob.size):
+                raise coldcodec.CodecError(f'Compressed {blob.sha256} does not round-trip')
+        stored_size = os.path.getsize(packed)
+
+        storage = blob.cold_file.storage
+        name = cold_blob_path(blob, blob.sha256)
+        if storage.exists(name):
+            storage.delete(name)
+        with open(packed, 'rb') as source:
+            name = storage.save(name, File(source, name=name))
+
+    with transaction.atomic():
+        current = AttachmentBlob.objects.select_for_update().filter(
+            pk=blob.pk, tier=AttachmentBlob.Tier.HOT
+        ).first()
+        if current is None:
+            storage.delete(name)
+            return None
+        hot_file = current.file
+        hot_name = hot_file.name
+        current.tier = AttachmentBlob.Tier.COLD
+        current.file = ''
+        current.cold_file = name
+        current.codec = codec
+        current.stored_size = stored_size
+        current.tiered_at = timezone.now()
+        current.save(update_fields=['file', 'tier', 'cold_file', 'codec', 'stored_size', 'tiered_at'])
+        transaction.on_commit(lambda: hot_file.storage.delete(hot_name))
+    return current
+
+
+def thaw(blob):
+    """Decompress a cold ``blob`` back into the hot tier; ``False`` if it is no longer cold."""
+    path = local_copy(blob)
+    with transaction.atomic():
+        current = AttachmentBlob.objects.select_for_update().filter(
+            pk=blob.pk, tier=AttachmentBlob.Tier.COLD
+        ).first()
+        if current is None:
+            return False
+        storage = current.file.storage
+        name = attachment_blob_path(current, current.sha256)
+        with open(path, 'rb') as source:
+            current.file.name = storage.save(name, File(source, name=name))
+        mark_hot(current)
+    return True
+
+
+def run(older_than_days=None, limit=None, rehydrate=False, dry_run=False, log=None):
+    """
+    Tier (or with ``rehydrate``, thaw) blobs one at a time. Returns a
+    ``Counter`` of blobs moved, failures, and bytes before and after.
+    """
+    stats = Counter()
+    if rehydrate:
+        blobs = AttachmentBlob.objects.filter(tier=AttachmentBlob.Tier.COLD).order_by('-tiered_at')
+    else:
+        days = settings.ATTACHMENT_COLD_AFTER_DAYS if older_than_days is None else older_than_days
+        blobs = candidates(timezone.now() - timedelta(days=days))
+    if limit:
+        blobs = blobs[:limit]
+    for blob in blobs.iterator():
+        if dry_run:
+            stats['blobs'] += 1
+            stats['bytes'] += blob.size
+            continue
+        try:
+            moved = thaw(blob) if rehydrate else freeze(blob)
+        except (OSError, coldcodec.CodecError) as e:
+            logger.warning('Could not move %s: %s', blob.sha256, e)
+            stats['failed'] += 1
+            continue
+        if not moved:
+            continue
+        stats['blobs'] += 1
+        stats['bytes'] += blob.size
+        if not rehydrate:
+            stats['stored_bytes'] += moved.stored_size
+            stats[moved.codec] += 1
+        if log:
+            log(moved if not rehydrate else blob)
+    return stats
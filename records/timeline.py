@@ -0,0 +1,130 @@
+"""
+Unified patient timeline: appointments, health records and doctor
+annotations merged into one chronological feed.
+
+Each source is filtered by the keyset cursor and limited on its own indexed
+``(patient, created_at)`` path, then the three are combined with a single
+``UNION ALL`` query ordered by ``(occurred_at, kind, id)`` descending.
+"""
+from django.db import connection
+from django.db.models import BigIntegerField, CharField, F, Q, Value
+from django.db.models.functions import Cast, Concat, Left
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.cursors import decode_cursor, encode_cursor
+from core.models import DoctorAppointment
+from .models import HealthRecord, DoctorAnnotation
+
+TIMELINE_PAGE_SIZE = 50
+TIMELINE_MAX_PAGE_SIZE = 200
+SUMMARY_LENGTH = 140
+
+COLUMNS = ('kind', 'event_id', 'occurred_at', 'doctor_ref', 'record_ref', 'subtype', 'summary')
+
+
+def _after_cursor(kind, cursor):
+    """Keyset predicate for one source: rows strictly after the cursor."""
+    if cursor is None:
+        return Q()
+    occurred_at, cursor_kind, event_id = cursor
+    if kind < cursor_kind:
+        return Q(created_at__lte=occurred_at)
+    if kind > cursor_kind:
+        return Q(created_at__lt=occurred_at)
+    return Q(created_at__lt=occurred_at) | Q(created_at=occurred_at, id__lt=event_id)
+
+
+def _events(queryset, kind, cursor, limit, **columns):
+    events = queryset.filter(_after_cursor(kind, cursor)).annotate(
+        kind=Value(kind, output_field=CharField()),
+        event_id=F('id'),
+        occurred_at=F('created_at'),
+        **columns
+    ).values(*COLUMNS)
+    if connection.features.supports_slicing_ordering_in_compound:
+        return events.order_by('-created_at', '-id')[:limit]
+    # Backends such as SQLite cannot limit the individual branches
+    return events.order_by()
+
+
+def patient_timeline(patient, doctor=None, cursor=None, limit=TIMELINE_PAGE_SIZE):
+    """
+    Return ``(events, next_cursor)`` for ``patient``, newest first. When
+    ``doctor`` is given only events involving that doctor are included.
+    """
+    appointments = DoctorAppointment.objects.filter(patient=patient)
+    records = HealthRecord.objects.filter(patient=patient)
+    annotations = DoctorAnnotation.objects.filter(record__patient=patient)
+    if doctor is not None:
+        appointments = appointments.filter(doctor=doctor)
+        records = records.filter(doctor=doctor)
+        annotations = annotations.filter(record__doctor=doctor)
+
+    # Fetch one extra row to know whether another page exists
+    fetch = limit + 1
+    events = _events(
+        appointments, 'appointment', cursor, fetch,
+        doctor_ref=F('doctor_id'),
+        record_ref=Value(None, output_field=BigIntegerField()),
+        subtype=Cast('status', CharField()),
+        summary=Concat(
+            Cast('appointment_date', CharField()), Value(' '), Cast('start_time', CharField()),
+            output_field=CharField()
+        ),
+    ).union(
+        _events(
+            records, 'record', cursor, fetch,
+            doctor_ref=F('doctor_id'),
+            record_ref=F('id'),
+            subtype=Cast('record_type', CharField()),
+            summary=Cast('title', CharField()),
+        ),
+        _events(
+            annotations, 'annotation', cursor, fetch,
+            doctor_ref=F('doctor_id'),
+            record_ref=F('record_id'),
+            subtype=Value('', output_field=CharField()),
+            summary=Left('content', SUMMARY_LENGTH, output_field=CharField()),
+        ),
+        all=True,
+    ).order_by('-occurred_at', '-kind', '-event_id')[:fetch]
+
+    rows = list(events)
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last['occurred_at'], last['kind'], last['event_id'])
+    return [
+        {
+            'type': row['kind'],
+            'id': row['event_id'],
+            'occurred_at': row['occurred_at'],
+            'doctor_id': row['doctor_ref'],
+            'record_id': row['record_ref'],
+            'subtype': row['subtype'],
+            'summary': row['summary'],
+        }
+        for row in rows[:limit]
+    ], next_cursor
+
+
+def parse_page_size(value):
+    if not value:
+        return TIMELINE_PAGE_SIZE
+    if not value.isdigit() or int(value) < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(int(value), TIMELINE_MAX_PAGE_SIZE)
+
+
+def timeline_response(request, patient, doctor=None):
+    """Render one timeline page for ``?cursor=&limit=`` query parameters."""
+    try:
+        limit = parse_page_size(request.query_params.get('limit'))
+        cursor = request.query_params.get('cursor')
+        cursor = decode_cursor(cursor, str, int) if cursor else None
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    events, next_cursor = patient_timeline(patient, doctor=doctor, cursor=cursor, limit=limit)
+    return Response({'results': events, 'next_cursor': next_cursor})
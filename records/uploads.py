@@ -0,0 +1,337 @@
+"""
+Resumable, chunked attachment uploads.
+
+A client creates an ``UploadSession`` for a record with the file's name and
+size, sends the bytes with ``PATCH`` requests at increasing offsets
+(``Upload-Offset`` header, body ``application/offset+octet-stream``) and
+completes the session, which adds the file to the record's attachments
+(deduplicated by ``records.attachments``). The request body is copied to a
+partial file on disk in ``UPLOAD_BLOCK_SIZE`` blocks, so memory use per
+upload is one block regardless of file or chunk size. A dropped connection keeps the bytes that arrived; the client asks for
+the session's offset and continues from there.
+
+With object storage a session can instead be ``direct``: the client declares
+the file's SHA-256 up front and ``PUT``s the whole file to a presigned URL on
+the storage service (``upload_target()``), which only accepts exactly those
+bytes. The URL names an object of the session's own (``staged_name()``), never
+the blob, so a client that only knows a digest cannot claim stored content:
+completion requires the session's object, copies it to the blob inside the
+store and records the attachment. The bytes never pass through the application.
+
+Chunks stream in outside any database transaction; a short-lived lease on the
+session keeps a second chunk from writing at the same time (``append_chunk``).
+Each chunk may carry an ``Upload-Checksum: sha256 <base64 digest>`` header and
+is discarded on mismatch. The whole-file SHA-256 is updated as chunks arrive
+and kept per process; a chunk handled by another worker re-reads the partial
+file once to catch up.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import attachments
+from .models import UploadSession
+
+# Running whole-file hashes: session id -> (offset, hasher)
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+MAX_CACHED_HASHERS = 1000
+DIRECT_UPLOAD_PREFIX = 'uploads/'
+
+
+class UploadError(Exception):
+    """A chunk or completion request that cannot be applied; carries the HTTP status."""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def part_path(session):
+    return os.path.join(settings.UPLOAD_SESSION_DIR, f'{session.pk}.part')
+
+
+def staged_name(session):
+    """Object name a direct session uploads to."""
+    return f'{DIRECT_UPLOAD_PREFIX}{session.pk}'
+
+
+def expiry():
+    return timezone.now() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+
+
+def parse_checksum(header):
+    """Decode ``sha256 <base64>``; ``None`` when the header is absent."""
+    if not header:
+        return None
+    algorithm, _, value = header.partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise UploadError('Only sha256 checksums are supported', 400)
+    try:
+        return base64.b64decode(value.strip(), validate=True)
+    except (binascii.Error, ValueError):
+        raise UploadError('Malformed Upload-Checksum header', 400)
+
+
+def _take_hasher(session):
+    with _hashers_lock:
+        cached = _hashers.pop(session.pk, None)
+    if cached is not None and cached[0] == session.offset:
+        return cached[1]
+    # Another worker handled the previous chunk: hash what is on disk so far
+    hasher = hashlib.sha256()
+    with open(part_path(session), 'rb') as part:
+        remaining = session.offset
+        while remaining:
+            block = part.read(min(settings.UPLOAD_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+def _keep_hasher(session, hasher):
+    with _hashers_lock:
+        _hashers[session.pk] = (session.offset, hasher)
+        while len(_hashers) > MAX_CACHED_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def _forget_hasher(session):
+    with _hashers_lock:
+        _hashers.pop(session.pk, None)
+
+
+def create_session(record, user, filename, size, content_type='', direct=False, sha256=''):
+    if direct and attachments.direct_storage() is None:
+        raise UploadError('Direct uploads need object storage (ATTACHMENT_S3_BUCKET)', 400)
+    session = UploadSession.objects.create(
+        record=record, user=user, filename=os.path.basename(filename), size=size,
+        content_type=content_type, expires_at=expiry(), direct=direct, sha256=sha256.lower()
+    )
+    if not direct:
+        os.makedirs(settings.UPLOAD_SESSION_DIR, exist_ok=True)
+        open(part_path(session), 'wb').close()
+    return session
+
+
+def upload_target(session):
+    """``(url, headers)`` for a direct session's presigned ``PUT``; valid until the session expires."""
+    storage = attachments.direct_storage()
+    expire = max(int((session.expires_at - timezone.now()).total_seconds()), 1)
+    return storage.presigned_put(staged_name(session), session.size, session.sha256, expire)
+
+
+def _lease(session_id, offset, length):
+    """Check a chunk against the session and lease the session to it; the row lock ends here."""
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session_id)
+        if session.status != UploadSession.Status.ACTIVE:
+            raise UploadError('Upload session is no longer active', 409)
+        if session.direct:
+            raise UploadError('Direct uploads are sent to their upload URL', 409)
+        now = timezone.now()
+        if session.leased_until is not None and session.leased_until > now:
+            raise UploadError('Another chunk of this upload is still being received', 409)
+        if offset != session.offset:
+            raise UploadError(f'Expected Upload-Offset {session.offset}', 409)
+        if length is not None and session.offset + length > session.size:
+            raise UploadError('Chunk exceeds the declared upload size', 413)
+        session.leased_until = now + timedelta(seconds=settings.UPLOAD_LEASE_SECONDS)
+        session.expires_at = expiry()
+        session.save(update_fields=['leased_until', 'expires_at', 'updated_at'])
+    return session
+
+
+def _renew_lease(session):
+    leased_until = timezone.now() + timedelta(seconds=settings.UPLOAD_LEASE_SECONDS)
+    renewed = UploadSession.objects.filter(pk=session.pk, leased_until=session.leased_until).update(
+        leased_until=leased_until
+    )
+    session.leased_until = leased_until
+    return bool(renewed)
+
+
+def _end_lease(session, written=0):
+    """Add ``written`` bytes to the offset and release the lease; ``False`` if the lease was lost."""
+    return bool(UploadSession.objects.filter(
+        pk=session.pk, leased_until=session.leased_until, offset=session.offset
+    ).update(
+        offset=F('offset') + written, leased_until=None, expires_at=expiry(), updated_at=timezone.now()
+    ))
+
+
+def append_chunk(session_id, offset, stream, length=None, checksum=None):
+    """
+    Copy ``stream`` to the session's partial file at ``offset`` and return the
+    updated session. Bytes that arrive before a dropped connection are kept
+    unless a chunk checksum was given.
+
+    No transaction is open while the body streams in: a lease on the session
+    (``leased_until``, renewed while a slow client sends) keeps other chunks
+    out, and the new offset is committed with one ``UPDATE`` at the end.
+    """
+    session = _lease(session_id, offset, length)
+    renew_at = time.monotonic() + settings.UPLOAD_LEASE_SECONDS / 3
+    written = 0
+    interrupted = None
+    try:
+        hasher = _take_hasher(session)
+        chunk_hasher = hashlib.sha256() if checksum is not None else None
+        remaining = session.size - session.offset if length is None else length
+        with open(part_path(session), 'r+b') as part:
+            part.seek(session.offset)
+            # Drop bytes left behind by an earlier interrupted or rejected chunk
+            part.truncate()
+            while remaining:
+                if time.monotonic() > renew_at:
+                    if not _renew_lease(session):
+                        raise UploadError('Upload lease expired; resume from the current offset', 409)
+                    renew_at = time.monotonic() + settings.UPLOAD_LEASE_SECONDS / 3
+                try:
+                    block = stream.read(min(settings.UPLOAD_BLOCK_SIZE, remaining))
+                except OSError as e:
+                    interrupted = e
+                    break
+                if not block:
+                    break
+                part.write(block)
+                hasher.update(block)
+                if chunk_hasher is not None:
+                    chunk_hasher.update(block)
+                written += len(block)
+                remaining -= len(block)
+            if length is None and stream.read(1):
+                part.truncate(session.offset)
+                raise UploadError('Chunk exceeds the declared upload size', 413)
+            if chunk_hasher is not None and (interrupted or chunk_hasher.digest() != checksum):
+                part.truncate(session.offset)
+                raise UploadError('Chunk checksum mismatch', 422)
+    except BaseException:
+        _end_lease(session)
+        raise
+
+    if not _end_lease(session, written):
+        # Another request took the session over after the lease ran out
+        raise UploadError('Upload lease expired; resume from the current offset', 409)
+    session.offset += written
+    session.leased_until = None
+    _keep_hasher(session, hasher)
+    if interrupted is not None:
+        raise UploadError(f'Connection interrupted at offset {session.offset}', 400)
+    return session
+
+
+def complete_session(session_id, sha256=''):
+    """Verify the full upload and move it into the record's attachments."""
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update(of=('self',)).select_related(
+            'record', 'user'
+        ).get(pk=session_id)
+        if session.status != UploadSession.Status.ACTIVE:
+            raise UploadError('Upload session is no longer active', 409)
+        if session.direct:
+            return _complete_direct(session)
+        if session.offset != session.size:
+            raise UploadError(f'Upload incomplete: {session.offset} of {session.size} bytes received', 409)
+        digest = _take_hasher(session).hexdigest()
+        corrupt = bool(sha256) and sha256.lower() != digest
+        if not corrupt:
+            # The running hash doubles as the content address: the file is not read again
+            session.attachment = attachments.attach_path(
+                session.record, part_path(session), digest, session.size,
+                session.filename, session.content_type, session.user
+            )
+            session.sha256 = digest
+            session.status = UploadSession.Status.COMPLETED
+            session.save(update_fields=['sha256', 'status', 'updated_at'])
+    if corrupt:
+        # The bytes on disk are not the client's file; it has to start over
+        abort_session(session)
+        raise UploadError('File checksum mismatch; upload session aborted', 422)
+    discard_part(session)
+    return session
+
+
+def _complete_direct(session):
+    storage = attachments.direct_storage()
+    name = staged_name(session)
+    try:
+        # The signature covered size and digest, so the session's object holds the declared bytes
+        size = storage.size(name)
+    except FileNotFoundError:
+        raise UploadError('The file has not been uploaded yet', 409)
+    if size != session.size:
+        raise UploadError('Uploaded object does not match the declared size', 422)
+    session.attachment = attachments.attach_stored(
+        session.record, name, session.sha256, size, session.filename, session.content_type, session.user
+    )
+    session.offset = size
+    session.status = UploadSession.Status.COMPLETED
+    session.save(update_fields=['offset', 'status', 'updated_at'])
+    transaction.on_commit(lambda: storage.delete(name), robust=True)
+    return session
+
+
+def discard_part(session):
+    _forget_hasher(session)
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def abort_session(session):
+    session.status = UploadSession.Status.ABORTED
+    session.save(update_fields=['status', 'updated_at'])
+    if session.direct:
+        _discard_object(session)
+    else:
+        discard_part(session)
+
+
+def _discard_object(session):
+    storage = attachments.direct_storage()
+    if storage is not None:
+        storage.delete(staged_name(session))
+
+
+def sweep(now=None, dry_run=False):
+    """
+    Abort expired sessions and remove partial files that no active session
+    owns. Returns ``(sessions, files)`` counts.
+    """
+    now = now or timezone.now()
+    expired = list(UploadSession.objects.filter(status=UploadSession.Status.ACTIVE, expires_at__lt=now))
+    if not dry_run:
+        for session in expired:
+            abort_session(session)
+
+    orphans = 0
+    if os.path.isdir(settings.UPLOAD_SESSION_DIR):
+        # List before querying so files of sessions created meanwhile are not seen
+        names = os.listdir(settings.UPLOAD_SESSION_DIR)
+        active = {str(pk) for pk in UploadSession.objects.filter(
+            status=UploadSession.Status.ACTIVE
+        ).values_list('pk', flat=True)}
+        for name in names:
+            stem, extension = os.path.splitext(name)
+            if extension == '.part' and stem not in active:
+                orphans += 1
+                if not dry_run:
+                    try:
+                        os.remove(os.path.join(settings.UPLOAD_SESSION_DIR, name))
+                    except FileNotFoundError:
+                        pass
+    return len(expired), orphans
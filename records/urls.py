@@ -1,11 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import HealthRecordViewSet, DoctorViewSet, PatientViewSet
+from .views import HealthRecordViewSet, PatientHealthRecordViewSet, DoctorViewSet, PatientViewSet, UploadSessionViewSet
 
 router = DefaultRouter()
 router.register(r'records', HealthRecordViewSet)
-router.register(r'doctors', DoctorViewSet, basename='doctor')
-router.register(r'patients', PatientViewSet, basename='patient')
+router.register(r'patient-records', PatientHealthRecordViewSet, basename='patient-record')
+# core.urls owns doctors/ and patients/ on the same api/ prefix
+router.register(r'doctor-directory', DoctorViewSet, basename='doctor-directory')
+router.register(r'assigned-patients', PatientViewSet, basename='assigned-patient')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 
 urlpatterns = [
     path('', include(router.urls)),
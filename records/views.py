@@ -1,26 +1,59 @@
 from django.shortcuts import render
-from rest_framework import viewsets, permissions, status
+from rest_framework import mixins, viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.reverse import reverse
 from django.contrib.auth import get_user_model
-from .models import HealthRecord, DoctorAnnotation
+from .models import HealthRecord, DoctorAnnotation, PatientRecordSummary, UploadSession
 from .serializers import (
+    AttachmentUploadSerializer,
     HealthRecordSerializer, 
+    HealthRecordFastSerializer,
     DoctorAnnotationSerializer,
+    RecordAttachmentSerializer,
+    UploadSessionSerializer,
     UserSerializer
 )
 from core.permissions import IsAdminUser, IsDoctor, IsPatient
 from core.models import User
+from audit.mixins import AuditMixin
+from core.cache import doctor_directory
+from core.conditional import ConditionalRequestMixin, collection_validators, conditional_response
+from core.eager import EagerLoadingMixin, eager_load
+from core.fastserializers import FastListMixin
+from core.fieldsets import SparseFieldsViewMixin
+from .archives import AttachmentArchiveMixin
+from .downloads import AttachmentDownloadMixin
+from .exports import RecordExportMixin
+from .timeline import timeline_response
+from .summaries import summary_payload
+from . import attachments, uploads
 
 User = get_user_model()
 
 # Create your views here.
 
-class PatientHealthRecordViewSet(viewsets.ModelViewSet):
+def attachment_response(request, record, download_url):
+    """Validate ``request``'s file, add it to ``record`` and describe the new attachment."""
+    serializer = AttachmentUploadSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    attachment = attachments.attach(record, serializer.validated_data['file'], user=request.user)
+    return Response({
+        'message': 'File uploaded successfully',
+        'file_url': download_url(attachment),
+        'attachment': RecordAttachmentSerializer(attachment).data
+    })
+
+class PatientHealthRecordViewSet(AuditMixin, EagerLoadingMixin, ConditionalRequestMixin,
+                                 AttachmentDownloadMixin, AttachmentArchiveMixin, RecordExportMixin,
+                                 FastListMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for patients and admins to view and update health records.
     """
     serializer_class = HealthRecordSerializer
+    fast_serializer_class = HealthRecordFastSerializer
+    conditional_related = ('annotations', 'attachments', 'patient')
     permission_classes = [permissions.IsAuthenticated]  # Base permission
 
     def get_permissions(self):
@@ -115,9 +148,13 @@ class PatientHealthRecordViewSet(viewsets.ModelViewSet):
         Get all records for the authenticated patient with doctor details.
         """
         records = self.get_queryset()
+        validators = collection_validators(request, records, self.conditional_related)
+        return conditional_response(request, validators, lambda: self._records_with_details(records))
+
+    def _records_with_details(self, records):
         records_with_details = []
 
-        for record in records:
+        for record in records.select_related('doctor'):
             record_data = self.get_serializer(record).data
             
             # Add doctor details if available
@@ -133,6 +170,32 @@ class PatientHealthRecordViewSet(viewsets.ModelViewSet):
 
         return Response(records_with_details)
 
+    @action(detail=False, methods=['get'])
+    def timeline(self, request):
+        """
+        Get the authenticated patient's appointments, records and annotations
+        as one chronological feed. Admins pass ?patient=<id>.
+        """
+        user = request.user
+        if user.role == 'PATIENT':
+            return timeline_response(request, user)
+        if user.role != 'ADMIN':
+            return Response(
+                {'detail': 'Only patients and admins can view timelines.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        patient_id = request.query_params.get('patient', '')
+        if not patient_id.isdigit():
+            return Response(
+                {'error': 'Please provide a patient id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        patient = User.objects.filter(pk=int(patient_id), role='PATIENT').first()
+        if patient is None:
+            return Response({'error': 'Patient not found'}, status=status.HTTP_404_NOT_FOUND)
+        return timeline_response(request, patient)
+
     @action(detail=False, methods=['get'])
     def records_by_type(self, request):
         """
@@ -145,7 +208,7 @@ class PatientHealthRecordViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        records = self.get_queryset().filter(record_type=record_type)
+        records = self.get_queryset().filter(record_type=record_type).select_related('doctor')
         records_with_details = []
 
         for record in records:
@@ -182,18 +245,17 @@ class PatientHealthRecordViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        file = request.FILES['file']
-        record.attachments = file
-        record.save()
+        return attachment_response(request, record, lambda attachment: self.reverse_action(
+            'download-attachment', args=[record.pk, attachment.pk]
+        ))
 
-        return Response({
-            'message': 'File uploaded successfully',
-            'file_url': record.attachments.url
-        })
-
-class HealthRecordViewSet(viewsets.ModelViewSet):
+class HealthRecordViewSet(AuditMixin, EagerLoadingMixin, ConditionalRequestMixin,
+                          AttachmentDownloadMixin, AttachmentArchiveMixin, RecordExportMixin,
+                          FastListMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = HealthRecord.objects.all()
     serializer_class = HealthRecordSerializer
+    fast_serializer_class = HealthRecordFastSerializer
+    conditional_related = ('annotations', 'attachments', 'patient')
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -242,7 +304,7 @@ class HealthRecordViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class DoctorViewSet(viewsets.ReadOnlyModelViewSet):
+class DoctorViewSet(EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for listing doctors (Patient only)"""
     serializer_class = UserSerializer
     permission_classes = [IsPatient]  # Only patients can view doctors
@@ -250,15 +312,18 @@ class DoctorViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         return User.objects.filter(role='DOCTOR')
 
+    def list(self, request, *args, **kwargs):
+        return doctor_directory.cached(request, lambda: super(DoctorViewSet, self).list(request, *args, **kwargs))
+
     @action(detail=True, methods=['get'])
     def records(self, request, pk=None):
         """Get all records for a specific doctor"""
         doctor = self.get_object()
-        records = HealthRecord.objects.filter(doctor=doctor)
+        records = eager_load(HealthRecord.objects.filter(doctor=doctor), HealthRecordSerializer)
         serializer = HealthRecordSerializer(records, many=True)
         return Response(serializer.data)
 
-class PatientViewSet(viewsets.ReadOnlyModelViewSet):
+class PatientViewSet(AuditMixin, EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for listing assigned patients (Doctor only)"""
     serializer_class = UserSerializer
     permission_classes = [IsDoctor]  # Only doctors can view their patients
@@ -275,10 +340,10 @@ class PatientViewSet(viewsets.ReadOnlyModelViewSet):
         """Get all records for a specific patient"""
         patient = self.get_object()
         # Only show records assigned to this doctor
-        records = HealthRecord.objects.filter(
+        records = eager_load(HealthRecord.objects.filter(
             patient=patient,
             doctor=request.user
-        )
+        ), HealthRecordSerializer)
         serializer = HealthRecordSerializer(records, many=True)
         return Response(serializer.data)
 
@@ -286,27 +351,145 @@ class PatientViewSet(viewsets.ReadOnlyModelViewSet):
     def annotations(self, request, pk=None):
         """Get all annotations for a specific patient's records"""
         patient = self.get_object()
-        annotations = DoctorAnnotation.objects.filter(
+        annotations = eager_load(DoctorAnnotation.objects.filter(
             record__patient=patient,
             record__doctor=request.user
-        )
+        ), DoctorAnnotationSerializer)
         serializer = DoctorAnnotationSerializer(annotations, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        """Get this doctor's appointments, records and annotations for a patient"""
+        patient = self.get_object()
+        return timeline_response(request, patient, doctor=request.user)
+
+    @action(detail=True, methods=['get'])
+    def summary(self, request, pk=None):
+        """Record counts by type and latest record time for a patient"""
+        patient = self.get_object()
+        summaries = PatientRecordSummary.objects.filter(patient=patient)
+        return Response(summary_payload(patient.id, summaries))
+
     @action(detail=True, methods=['post'])
     def upload_attachment(self, request, pk=None):
-        record = self.get_object()
+        """Attach a file to one of this patient's records assigned to the doctor"""
+        patient = self.get_object()
+        record_id = str(request.data.get('record', ''))
+        if not record_id.isdigit():
+            return Response(
+                {'error': 'Please provide a record id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        record = HealthRecord.objects.filter(pk=int(record_id), patient=patient, doctor=request.user).first()
+        if record is None:
+            return Response({'error': 'Record not found'}, status=status.HTTP_404_NOT_FOUND)
         if 'file' not in request.FILES:
             return Response(
                 {'error': 'No file provided'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        file = request.FILES['file']
-        record.attachments = file
-        record.save()
-        
+
+        return attachment_response(request, record, lambda attachment: reverse(
+            'healthrecord-download-attachment', args=[record.pk, attachment.pk], request=request
+        ))
+
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable attachment uploads (see records/uploads.py):
+    POST to create, PATCH chunks with Upload-Offset, POST complete/.
+    Direct sessions PUT the file to ``upload_url`` instead of PATCHing.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['records'] = self.attachable_records()
+        return context
+
+    def attachable_records(self):
+        user = self.request.user
+        if user.is_superuser or user.role == 'ADMIN':
+            return HealthRecord.objects.all()
+        elif user.role == 'DOCTOR':
+            return HealthRecord.objects.filter(doctor=user)
+        elif user.role == 'PATIENT':
+            return HealthRecord.objects.filter(patient=user)
+        return HealthRecord.objects.none()
+
+    def progress(self, session, response_status=status.HTTP_200_OK):
+        data = self.get_serializer(session).data
+        if session.direct and session.status == UploadSession.Status.ACTIVE:
+            # PUT the file here with these headers, then POST complete/
+            data['upload_url'], data['upload_headers'] = uploads.upload_target(session)
+        response = Response(data, status=response_status)
+        response['Upload-Offset'] = str(session.offset)
+        response['Upload-Length'] = str(session.size)
+        return response
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            session = uploads.create_session(user=request.user, **serializer.validated_data)
+        except uploads.UploadError as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        return self.progress(session, status.HTTP_201_CREATED)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Current offset, for resuming after a dropped connection (also answers HEAD)"""
+        return self.progress(self.get_object())
+
+    def partial_update(self, request, *args, **kwargs):
+        """Append the raw request body at the Upload-Offset header"""
+        session = self.get_object()
+        if request.content_type.split(';')[0].strip() != 'application/offset+octet-stream':
+            return Response(
+                {'error': 'Chunks must be sent as application/offset+octet-stream'},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length']) if request.headers.get('Content-Length') else None
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Upload-Offset header is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            checksum = uploads.parse_checksum(request.headers.get('Upload-Checksum'))
+            # The body is never parsed: it is read from the socket block by block
+            session = uploads.append_chunk(session.pk, offset, request._request, length, checksum)
+        except uploads.UploadError as e:
+            response = Response({'error': str(e)}, status=e.status_code)
+            response['Upload-Offset'] = str(UploadSession.objects.values_list('offset', flat=True).get(pk=session.pk))
+            return response
+        return self.progress(session)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """Verify the upload (optional sha256) and attach it to the record"""
+        session = self.get_object()
+        try:
+            session = uploads.complete_session(session.pk, request.data.get('sha256', ''))
+        except uploads.UploadError as e:
+            return Response({'error': str(e)}, status=e.status_code)
         return Response({
             'message': 'File uploaded successfully',
-            'file_url': record.attachments.url
+            'file_url': reverse(
+                'healthrecord-download-attachment', args=[session.record_id, session.attachment.pk], request=request
+            ),
+            'attachment': RecordAttachmentSerializer(session.attachment).data,
+            'sha256': session.sha256
         })
+
+    def destroy(self, request, *args, **kwargs):
+        session = self.get_object()
+        if session.status == UploadSession.Status.ACTIVE:
+            uploads.abort_session(session)
+        return Response(status=status.HTTP_204_NO_CONTENT)